@@ -0,0 +1,126 @@
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Any, Optional
+from .metrics import observe_stage, ADMISSION_ACTIVE, ADMISSION_QUEUE, ADMISSION_SHED
+
+logger = logging.getLogger(__name__)
+
+class Overloaded(Exception):
+    """A request shed by an AdmissionLimiter; the API turns it into status_code with a Retry-After header."""
+
+    def __init__(self, stage: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{stage} is overloaded ({reason})")
+        self.stage = stage
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class Ticket:
+    """A held slot. release() is idempotent, so a slot handed to a stream can be released from more than one place."""
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self._limiter = limiter
+        self._started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(time.perf_counter() - self._started)
+
+    async def __aenter__(self) -> "Ticket":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+class AdmissionLimiter:
+    """
+    Bounded concurrency for one stage, with a bounded, deadline-limited wait queue.
+
+    At most `limit` requests hold a slot at once. Others wait in FIFO order,
+    up to `max_queue` of them and for at most `queue_timeout` seconds. A
+    request finding the queue full is shed at once with 429; one whose wait
+    runs out is shed with 503. Either way Retry-After estimates when a slot
+    frees up, from the recent time slots are held and the queue ahead.
+    """
+
+    def __init__(self, stage: str, limit: int, max_queue: int, queue_timeout: float):
+        self.stage = stage
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_seconds = 1.0  # Moving average of how long a slot is held
+        self._admitted = 0
+        self._shed: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+
+    def retry_after(self) -> int:
+        """Seconds until a new request could expect a slot."""
+        backlog = len(self._waiters) / max(1, self.limit) + 1
+        return max(1, math.ceil(self._hold_seconds * backlog))
+
+    def _shed_request(self, reason: str, status_code: int) -> Overloaded:
+        self._shed[reason] += 1
+        ADMISSION_SHED.labels(self.stage, reason).inc()
+        logger.warning("Shedding %s request: %s (%d active, %d queued)", self.stage, reason, self._active, len(self._waiters))
+        return Overloaded(self.stage, reason, status_code, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(self.stage).set(self._active)
+        ADMISSION_QUEUE.labels(self.stage).set(len(self._waiters))
+
+    async def acquire(self) -> Ticket:
+        """Wait for a slot and return its Ticket; raises Overloaded if the request is shed."""
+        started = time.perf_counter()
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+        elif len(self._waiters) >= self.max_queue:
+            raise self._shed_request("queue_full", 429)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(None)  # Handed a slot just as the wait ended; pass it on
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._update_gauges()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._shed_request("timeout", 503) from None
+                raise
+            # _release handed its slot straight to this waiter, so _active already counts it
+        self._admitted += 1
+        self._update_gauges()
+        observe_stage(f"{self.stage}_queue", time.perf_counter() - started)
+        return Ticket(self)
+
+    def _release(self, held_seconds: Optional[float]):
+        if held_seconds is not None:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self._admitted,
+            "shed": dict(self._shed),
+            "hold_seconds": round(self._hold_seconds, 3),
+        }
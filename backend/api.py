@@ -1,62 +1,504 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.concurrency import run_in_threadpool
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import openai
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, AsyncIterator, Optional
 from .hybrid_search import HybridSearchSystem
+from .sidecar import RemoteSearchSystem
+from .shards import ShardedSearchSystem
 from .llm_integration import OpenAIClient
+from .context_builder import ContextBuilder
+from .sessions import SessionStore, Session
+from .singleflight import SingleFlight, StreamFlight
+from .admission import AdmissionLimiter, Overloaded, Ticket
+from .cache import normalize_query
+from .metrics import stage, setup_tracing, record_tokens, IN_FLIGHT, REQUEST_LATENCY
 from .config import Config
 
-app = FastAPI()
-search_system = HybridSearchSystem(Config.PDF_DIR, Config.CHROMA_DIR)
+logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Built in the background by the lifespan handler; None until the model and stores are loaded.
+# With Config.SIDECAR_SOCKET set it is a RemoteSearchSystem and the model lives in the sidecar.
+# With Config.SHARD_ADDRESSES set it is a ShardedSearchSystem fanning out to the shards.
+search_system: Optional[HybridSearchSystem] = None
+startup_state: Dict[str, Any] = {"ready": False, "stage": "starting", "error": None, "attempts": 0, "warmup": None}
 llm_client = OpenAIClient(api_key=Config.OPENAI_API_KEY, model=Config.OPENAI_MODEL)
+context_builder = ContextBuilder()
+session_store = SessionStore()
+
+async def start_search_system():
+    """
+    Load the search system and warm it up, retrying until it succeeds.
+
+    Runs after the server has bound its port, so liveness probes pass while
+    the model loads. Requests that need retrieval get 503 until readiness.
+    A store that is not up yet (e.g. Elasticsearch still starting) is retried
+    with capped backoff.
+    """
+    global search_system
+    started = time.perf_counter()
+    while True:
+        startup_state["attempts"] += 1
+        try:
+            if search_system is None and Config.SHARD_ADDRESSES:
+                startup_state["stage"] = "loading"
+                search_system = await asyncio.to_thread(ShardedSearchSystem, Config.SHARD_ADDRESSES)
+            if search_system is None and Config.SIDECAR_SOCKET:
+                search_system = RemoteSearchSystem(Config.SIDECAR_SOCKET)
+            if search_system is None:
+                startup_state["stage"] = "loading"
+                search_system = await asyncio.to_thread(
+                    HybridSearchSystem, Config.PDF_DIR, Config.CHROMA_DIR, Config.CHUNK_STORE_DIR
+                )
+            if Config.SNAPSHOT_PATH and isinstance(search_system, HybridSearchSystem):
+                startup_state["stage"] = "loading snapshot"
+                await asyncio.to_thread(search_system.load_snapshot, Config.SNAPSHOT_PATH)
+            startup_state["stage"] = "warming up"
+            startup_state["warmup"] = await asyncio.to_thread(search_system.warmup)
+        except Exception as e:
+            startup_state["error"] = f"{type(e).__name__}: {e}"
+            delay = min(Config.STARTUP_RETRY_MAX, 2 ** startup_state["attempts"])
+            logger.warning("Startup attempt %d failed (%s); retrying in %ss", startup_state["attempts"], startup_state["error"], delay)
+            await asyncio.sleep(delay)
+            continue
+        startup_state.update(ready=True, stage="ready", error=None)
+        logger.info("Search system ready in %.1fs: %s", time.perf_counter() - started, startup_state["warmup"])
+        return
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = asyncio.create_task(start_search_system())
+    yield
+    startup.cancel()
+
+app = FastAPI(lifespan=lifespan)
+setup_tracing(app)
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Count in-flight requests and time them per route, until a streamed body has finished."""
+    started = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+    except Exception:
+        IN_FLIGHT.dec()
+        REQUEST_LATENCY.labels("unmatched", "500").observe(time.perf_counter() - started)
+        raise
+    # Label by route template so path parameters cannot blow up the series count
+    matched = request.scope.get("route")
+    template = getattr(matched, "path", "unmatched")
+    body = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(template, str(response.status_code)).observe(time.perf_counter() - started)
+
+    response.body_iterator = tracked_body()
+    return response
+
+def get_search_system() -> HybridSearchSystem:
+    """The warmed-up search system, or 503 while the server is still starting."""
+    if not startup_state["ready"]:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Search system is {startup_state['stage']}",
+            headers={"Retry-After": "5"},
+        )
+    return search_system
+
+SYSTEM_PROMPT = """You are a helpful assistant. Answer the user's question based on the provided context.
+    If the context does not contain enough information, say 'I don't know' and ask the user to clarify.
+    Keep your responses concise and to the point."""
 
 class ChatRequest(BaseModel):
     message: str
-    history: List[Tuple[str, str]]  # List of (user_input, assistant_response) pairs 
+    session_id: Optional[str] = None  # Omit to start a new conversation; the reply carries its id
+    # Deprecated: (user_input, assistant_response) pairs, only used to seed a new session
+    history: Optional[List[Tuple[str, str]]] = None
+
+def get_session(request: ChatRequest) -> Session:
+    """Look up the request's session, seeding a new one from a client-sent transcript."""
+    session = session_store.get(request.session_id)
+    if request.history and not session.turns and not session.summary:
+        session.turns = [tuple(turn) for turn in request.history]
+    return session
+
+async def record_turn(session: Session, user_input: str, response: str):
+    await session_store.record_turn(session, user_input, response, llm_client.asummarize)
+
+def build_context(search_results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]], Dict[str, int]]:
+    """Pack search results into a context within Config.MAX_CONTEXT_TOKENS."""
+    with stage("context_build"):
+        context, used_results, stats = context_builder.build(search_results)
+    record_tokens("context", stats["context_tokens"])
+    logger.debug("Context: %s", stats)
+    return context, used_results, stats
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Concurrent identical requests share one retrieval and one LLM call. Results
+# are shared between the waiters, so treat them as read-only.
+search_flight = SingleFlight("search", enabled=Config.COALESCE_REQUESTS)
+llm_flight = SingleFlight("llm", enabled=Config.COALESCE_REQUESTS)
+stream_flight = StreamFlight("llm_stream", enabled=Config.COALESCE_REQUESTS)
 
-def build_context(search_results: List[Dict[str, Any]]) -> str:
-    """Build a context string from search results."""
-    return "\n\n".join([f"Source: {res['source']}\nContent: {res['content']}" for res in search_results])
+def prompt_key(message: str, context: str, history: str) -> str:
+    """Key of an LLM call: requests with the same question, context and history get the same answer."""
+    digest = hashlib.sha256()
+    for part in (normalize_query(message), context, history):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# Chat requests are admitted to retrieval and to the LLM separately, so a
+# backlog of slow completions does not hold up retrieval and vice versa.
+retrieval_admission = AdmissionLimiter("retrieval", Config.RETRIEVAL_CONCURRENCY,
+                                       Config.RETRIEVAL_QUEUE_SIZE, Config.RETRIEVAL_QUEUE_TIMEOUT)
+llm_admission = AdmissionLimiter("llm", Config.LLM_CONCURRENCY, Config.LLM_QUEUE_SIZE, Config.LLM_QUEUE_TIMEOUT)
+
+def overloaded(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=error.status_code, detail=str(error),
+                         headers={"Retry-After": str(error.retry_after)})
+
+async def admit(limiter: AdmissionLimiter) -> Ticket:
+    """A slot in the limiter's stage, or 429/503 with Retry-After if the request is shed."""
+    try:
+        return await limiter.acquire()
+    except Overloaded as e:
+        raise overloaded(e)
+
+def source_fields(used_results: List[Dict[str, Any]], context_stats: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "context_sources": [res["source"] for res in used_results],
+        "retrievers": sorted({name for res in used_results for name in res["retrievers"]}),
+        "context_tokens": context_stats["context_tokens"],
+    }
+
+async def retrieve(message: str) -> List[Dict[str, Any]]:
+    """Run hybrid search without blocking the event loop, joining an identical search in flight."""
+    system = get_search_system()
+    try:
+        async with await admit(retrieval_admission):
+            return await search_flight.do(normalize_query(message), lambda: system.asearch(message))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
+
+class BatchChatRequest(BaseModel):
+    messages: List[str]  # Independent questions; batch answers have no session or history
+    k: int = 5
+
+def check_batch_size(items: List[str]):
+    if len(items) > Config.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {Config.BATCH_MAX_QUERIES} items")
+
+def ndjson_line(data: Any) -> str:
+    return json.dumps(data) + "\n"
+
+async def search_in_groups(system: HybridSearchSystem,
+                           queries: List[str],
+                           k: int) -> AsyncIterator[Tuple[int, List[str], Optional[List[List[Dict[str, Any]]]], Optional[str]]]:
+    """
+    Run search_many over groups of Config.BATCH_SEARCH_GROUP queries.
+
+    Yields (offset of the group, its queries, their results, error) per group.
+    Each group takes a retrieval slot. A group whose retrieval fails, or that
+    is shed by admission control, yields no results and an error message
+    instead of ending the batch.
+    """
+    for start in range(0, len(queries), Config.BATCH_SEARCH_GROUP):
+        group = queries[start:start + Config.BATCH_SEARCH_GROUP]
+        try:
+            async with await retrieval_admission.acquire():
+                results = await system.asearch_many(group, k)
+        except Overloaded as e:
+            yield start, group, None, str(e)
+            continue
+        except Exception as e:
+            logger.error("Batch retrieval failed for queries %d-%d: %s", start, start + len(group) - 1, e)
+            yield start, group, None, str(e) if isinstance(e, RuntimeError) else "Retrieval failed"
+            continue
+        yield start, group, results, None
 
 @app.get("/")
 def read_root():
     return {"message": "Hello, World!"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, tokens, cache lookups, errors and in-flight requests."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not it is warm yet."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model is loaded and warmed up, and the lexical index still answers."""
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": startup_state["stage"], "error": startup_state["error"]})
+    try:
+        reachable = await asyncio.wait_for(asyncio.to_thread(search_system.ping), timeout=2.0)
+    except Exception:
+        reachable = False
+    if not reachable:
+        return JSONResponse(status_code=503, content={"status": "lexical index unreachable", "error": None})
+    return {"status": "ready", "warmup": startup_state["warmup"]}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        **get_search_system().cache_stats(),
+        "coalescing": {flight.name: flight.stats() for flight in (search_flight, llm_flight, stream_flight)},
+    }
+
+@app.get("/sessions/stats")
+def session_stats():
+    return session_store.stats()
+
+@app.get("/pool/stats")
+def pool_stats():
+    """Connection pool use and retry counts of the upstream clients."""
+    return {
+        "openai": llm_client.pool_stats(),
+        "lexical": get_search_system().pool_stats(),
+    }
+
+@app.get("/embedding/stats")
+def embedding_stats():
+    return get_search_system().embedding_stats()
+
+@app.get("/admission/stats")
+def admission_stats():
+    return {limiter.stage: limiter.stats() for limiter in (retrieval_admission, llm_admission)}
+
 @app.post("/chat")
-# async def chat_endpoint(request: ChatRequest):
-def chat_endpoint(request: ChatRequest):
-    # try:
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
+    session = get_session(request)
+
     # Step 1: Retrieve relevant context using RAG
-    # search_results = await run_in_threadpool(search_system.search, request.message) 
-    search_results = search_system.search(request.message)
-    context = build_context(search_results)
+    search_results = await retrieve(request.message)
+    context, used_results, context_stats = build_context(search_results)
 
-    # Step 2: Generate system prompt
-    system_prompt = """You are a helpful assistant. Answer the user's question based on the provided context.
-    If the context does not contain enough information, say 'I don't know' and ask the user to clarify.
-    Keep your responses concise and to the point."""
+    # Step 2: Generate response using OpenAI API, or return the sources alone if the LLM is overloaded
+    history = session.render()
 
-    # Step 3: Generate response using OpenAI API
-    # response = await run_in_threadpool(
-    #     llm_client.generate_response, 
-    #     system_prompt=system_prompt, 
-    #     user_input=request.message, 
-    #     context=context
-    # )
-    response = llm_client.generate_response(
-        system_prompt=system_prompt,
-        user_input=request.message,
-        context=context,
-    )
-    print(response)
+    async def generate() -> str:
+        # Only the call's leader runs this, so requests joining it do not hold slots of their own
+        async with await llm_admission.acquire():
+            return await llm_client.agenerate_response(
+                system_prompt=SYSTEM_PROMPT,
+                user_input=request.message,
+                context=context,
+                history=history,
+            )
+
+    try:
+        response = await llm_flight.do(prompt_key(request.message, context, history), generate)
+    except Overloaded as e:
+        if not Config.DEGRADED_RESPONSES:
+            raise overloaded(e)
+        return {"response": None, "degraded": True, "detail": str(e), "session_id": session.session_id,
+                **source_fields(used_results, context_stats)}
+    except openai.APITimeoutError:
+        raise HTTPException(status_code=504, detail="The language model timed out")
+    except Exception as e:
+        logger.error("Error generating response: %s", e)
+        raise HTTPException(status_code=502, detail="Failed to generate response")
     if not response:
         raise HTTPException(status_code=500, detail="Failed to generate response")
 
+    # Step 3: Remember the turn once the reply is sent; summarizing older turns may call the LLM
+    background_tasks.add_task(record_turn, session, request.message, response)
+
     # Step 4: Return response and context sources
     return {
         "response": response,
-        "context_sources": [res["source"] for res in search_results],
+        "session_id": session.session_id,
+        **source_fields(used_results, context_stats),
     }
 
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Stream the answer as server-sent events.
+
+    Emits one `sources` event as soon as retrieval finishes, then a `token`
+    event per completion delta, and finally `done` (or `error` if the LLM call
+    fails part way through). The `sources` event carries the session id.
+    Identical concurrent streams share one LLM stream; a client that
+    disconnects leaves it running for the others. The shared stream holds
+    one LLM slot, taken before the response starts, so an overloaded server
+    answers 429/503, or with Config.DEGRADED_RESPONSES streams the sources
+    followed by a `degraded` event in place of the answer.
+    """
+    session = get_session(request)
+    search_results = await retrieve(request.message)
+    context, used_results, context_stats = build_context(search_results)
+
+    history = session.render()
+    sources = {"session_id": session.session_id, **source_fields(used_results, context_stats)}
+
+    async def generate() -> AsyncIterator[Optional[str]]:
+        # Only the stream's leader runs this; the None tells every subscriber the slot is held
+        async with await llm_admission.acquire():
+            yield None
+            async for token in llm_client.stream_response(
+                system_prompt=SYSTEM_PROMPT,
+                user_input=request.message,
+                context=context,
+                history=history,
+            ):
+                yield token
+
+    upstream = stream_flight.stream(prompt_key(request.message, context, history), generate)
+    try:
+        await anext(upstream)
+    except Overloaded as e:
+        if not Config.DEGRADED_RESPONSES:
+            raise overloaded(e)
+        degraded = iter([sse_event("sources", sources), sse_event("degraded", {"detail": str(e)}), sse_event("done", {})])
+        return StreamingResponse(degraded, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    async def event_stream() -> AsyncIterator[str]:
+        tokens = []
+        yield sse_event("sources", sources)
+        try:
+            async for token in upstream:
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
+        except Exception as e:
+            logger.error("Error streaming response: %s", e)
+            yield sse_event("error", {"detail": "Failed to generate response"})
+            return
+        finally:
+            await upstream.aclose()
+        yield sse_event("done", {})
+        await record_turn(session, request.message, "".join(tokens))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(upstream.aclose),  # In case the body is never iterated
+    )
+
+@app.post("/search/batch")
+async def search_batch_endpoint(request: BatchSearchRequest):
+    """
+    Search a batch of queries, streaming one NDJSON line per query.
+
+    Queries are retrieved in groups, each with one batched encode and one round
+    trip to each store, and a group's lines are sent as soon as it finishes.
+    Each line carries the query's index in the request.
+    """
+    system = get_search_system()
+    check_batch_size(request.queries)
+
+    async def lines() -> AsyncIterator[str]:
+        async for start, group, results, error in search_in_groups(system, request.queries, request.k):
+            for offset, query in enumerate(group):
+                item = {"index": start + offset, "query": query}
+                if error is None:
+                    item["results"] = results[offset]
+                else:
+                    item["error"] = error
+                yield ndjson_line(item)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    """
+    Answer a batch of questions, streaming one NDJSON line per answer as it finishes.
+
+    Retrieval runs in groups as in /search/batch. At most
+    Config.BATCH_LLM_CONCURRENCY LLM calls are in flight, and the next group
+    is retrieved once the current one's calls have all started. Each call
+    also takes a slot from the LLM admission limiter shared with /chat; an
+    item shed there gets an error line. Lines arrive in completion order and
+    carry the question's index in the request.
+    """
+    system = get_search_system()
+    check_batch_size(request.messages)
+    finished: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(Config.BATCH_LLM_CONCURRENCY)
+
+    async def answer(index: int, message: str, search_results: List[Dict[str, Any]]):
+        try:
+            context, used_results, context_stats = build_context(search_results)
+            try:
+                async with await llm_admission.acquire():
+                    response = await llm_client.agenerate_response(
+                        system_prompt=SYSTEM_PROMPT,
+                        user_input=message,
+                        context=context,
+                    )
+            except Overloaded as e:
+                await finished.put({"index": index, "message": message, "error": str(e), "retry_after": e.retry_after})
+                return
+            except Exception as e:
+                logger.error("Error generating response for batch item %d: %s", index, e)
+                await finished.put({"index": index, "message": message, "error": "Failed to generate response"})
+                return
+            await finished.put({
+                "index": index,
+                "message": message,
+                "response": response or "",
+                "context_sources": [res["source"] for res in used_results],
+                "retrievers": sorted({name for res in used_results for name in res["retrievers"]}),
+                "context_tokens": context_stats["context_tokens"],
+            })
+        finally:
+            slots.release()
+
+    async def produce():
+        tasks = []
+        try:
+            async for start, group, results, error in search_in_groups(system, request.messages, request.k):
+                for offset, message in enumerate(group):
+                    if error is not None:
+                        await finished.put({"index": start + offset, "message": message, "error": error})
+                        continue
+                    await slots.acquire()
+                    tasks.append(asyncio.create_task(answer(start + offset, message, results[offset])))
+            await asyncio.gather(*tasks)
+        finally:
+            # Only does anything when the client has gone away and this task was cancelled
+            for task in tasks:
+                task.cancel()
+            finished.put_nowait(None)
+
+    async def lines() -> AsyncIterator[str]:
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await finished.get()
+                if item is None:
+                    break
+                yield ndjson_line(item)
+        finally:
+            producer.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
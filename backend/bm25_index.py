@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import shutil
+import threading
+import numpy as np
+import scipy.sparse as sp
+from typing import List, Dict, Any, Optional
+from .config import Config
+
+TOKEN_PATTERN = re.compile(r"\w+")
+VERSION_PATTERN = re.compile(r"v\d+")
+
+# Same field boosts as ElasticSearchManager's multi_match query
+FIELD_BOOSTS = {"content": 2.0, "context": 1.0}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, close to Elasticsearch's standard analyzer."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class LocalBM25Index:
+    """
+    In-process BM25 engine with the same interface as ElasticSearchManager.
+
+    Each field keeps a sparse (documents x terms) term-frequency matrix. From it
+    a BM25 weight matrix is precomputed, using Lucene's formula with k1=1.2 and
+    b=0.75. A query is then one sparse column slice and a matrix-vector product
+    per field. As with Elasticsearch's best_fields multi_match, a document's
+    score is its best boosted field score.
+
+    The index is persisted to versioned directories under index_dir, with a
+    CURRENT pointer swapped atomically. A server therefore picks up rebuilds
+    written by a separate indexing process on its next search. The version
+    being replaced is kept until the next write, so a reader that has just
+    read the old CURRENT can still open it.
+    """
+
+    def __init__(self,
+                 index_dir: str = Config.BM25_INDEX_DIR,
+                 k1: float = 1.2,
+                 b: float = 0.75):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._version = None
+        self._dirty = False
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self.docs: List[Dict[str, str]] = []
+        self.vocab: Dict[str, int] = {}
+        self.tf = {field: sp.csr_matrix((0, 0), dtype=np.float32) for field in FIELD_BOOSTS}
+        self._pending = {field: [] for field in FIELD_BOOSTS}  # Row batches not yet in tf
+        self._weights = None
+        self._row_of: Dict[str, int] = {}
+
+    # Persistence
+
+    def _current_path(self) -> str:
+        return os.path.join(self.index_dir, "CURRENT")
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(self._current_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        while True:
+            version = self._read_current()
+            if version is None or version == self._version:
+                return
+            path = os.path.join(self.index_dir, version)
+            try:
+                with open(os.path.join(path, "docs.json")) as f:
+                    data = json.load(f)
+                tf = {
+                    field: sp.load_npz(os.path.join(path, f"{field}_tf.npz")).tocsr()
+                    for field in FIELD_BOOSTS
+                }
+                break
+            except FileNotFoundError:
+                # The version was pruned by a second write after we read CURRENT;
+                # follow CURRENT to the newer one
+                if self._read_current() == version:
+                    raise
+        with self._lock:
+            self.ids = data["ids"]
+            self.docs = data["docs"]
+            self.vocab = data["vocab"]
+            self.tf = tf
+            self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+            self._compute_weights()
+            self._version = version
+            self._dirty = False
+
+    def _maybe_reload(self):
+        """Pick up a newer on-disk version written by another process."""
+        if not self._dirty and self._read_current() != self._version:
+            self._load()
+
+    def flush(self):
+        """Persist pending changes as a new version and switch CURRENT to it."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._materialize()
+            os.makedirs(self.index_dir, exist_ok=True)
+            version = f"v{int((self._version or 'v0')[1:]) + 1}"
+            path = os.path.join(self.index_dir, version)
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+            with open(os.path.join(path, "docs.json"), "w") as f:
+                json.dump({"ids": self.ids, "docs": self.docs, "vocab": self.vocab}, f)
+            for field, matrix in self.tf.items():
+                sp.save_npz(os.path.join(path, f"{field}_tf.npz"), matrix)
+            tmp_path = self._current_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(version)
+            os.replace(tmp_path, self._current_path())
+            previous, self._version = self._version, version
+            self._dirty = False
+            self._remove_versions(keep={version, previous})
+
+    def _remove_versions(self, keep: set):
+        """Delete version directories other than those in keep."""
+        for entry in os.listdir(self.index_dir):
+            if VERSION_PATTERN.fullmatch(entry) and entry not in keep:
+                shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+
+    def export_version(self, dest_dir: str):
+        """Flush, then copy the files of the current version into dest_dir."""
+        self.flush()
+        version = self._read_current()
+        if version is None:
+            raise ValueError(f"No BM25 index has been written to {self.index_dir}")
+        shutil.copytree(os.path.join(self.index_dir, version), dest_dir, dirs_exist_ok=True)
+
+    def install_version(self, src_dir: str):
+        """Replace the whole index with files written by export_version, discarding unflushed changes."""
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            current = self._read_current()
+            version = f"v{int((current or 'v0')[1:]) + 1}"
+            path = os.path.join(self.index_dir, version)
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.copytree(src_dir, path)
+            tmp_path = self._current_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(version)
+            os.replace(tmp_path, self._current_path())
+            self._remove_versions(keep={version, current})
+            self._reset()
+            self._version = None
+            self._dirty = False
+            self._load()
+
+    # Indexing
+
+    def ping(self) -> bool:
+        return True
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """No connections to pool; kept for interface parity with ElasticSearchManager."""
+        return {"backend": "local"}
+
+    def create_index(self):
+        """Nothing to create up front; kept for interface parity with ElasticSearchManager."""
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def index_documents(self, documents: List[Dict[str, Any]]):
+        """Add or replace documents. Call flush to persist."""
+        with self._lock:
+            self._delete_rows([doc["chunk_id"] for doc in documents if doc["chunk_id"] in self._row_of])
+            new_rows = {field: ([], [], []) for field in FIELD_BOOSTS}  # rows, cols, counts
+            base = len(self.ids)
+            for offset, doc in enumerate(documents):
+                for field in FIELD_BOOSTS:
+                    counts: Dict[int, int] = {}
+                    for term in tokenize(doc.get(field, "")):
+                        col = self.vocab.setdefault(term, len(self.vocab))
+                        counts[col] = counts.get(col, 0) + 1
+                    rows, cols, data = new_rows[field]
+                    rows.extend([offset] * len(counts))
+                    cols.extend(counts.keys())
+                    data.extend(counts.values())
+                self.ids.append(doc["chunk_id"])
+                self.docs.append({
+                    "chunk_id": doc["chunk_id"],
+                    "source": doc["source"],
+                    "content": doc["content"],
+                    "context": doc.get("context", ""),
+                })
+                self._row_of[doc["chunk_id"]] = base + offset
+
+            for field, (rows, cols, data) in new_rows.items():
+                self._pending[field].append((np.array(rows, dtype=np.int64) + base,
+                                             np.array(cols, dtype=np.int64),
+                                             np.array(data, dtype=np.float32)))
+            self._weights = None
+            self._dirty = True
+
+    def _materialize(self):
+        """Fold rows added since the last call into the term-frequency matrices."""
+        if not any(self._pending.values()):
+            return
+        shape = (len(self.ids), len(self.vocab))
+        for field, batches in self._pending.items():
+            existing = self.tf[field].tocoo()
+            rows = np.concatenate([existing.row.astype(np.int64)] + [b[0] for b in batches])
+            cols = np.concatenate([existing.col.astype(np.int64)] + [b[1] for b in batches])
+            data = np.concatenate([existing.data.astype(np.float32)] + [b[2] for b in batches])
+            self.tf[field] = sp.csr_matrix((data, (rows, cols)), shape=shape)
+            batches.clear()
+
+    def delete_documents(self, chunk_ids: List[str]):
+        """Delete documents by chunk id, ignoring ids that are already gone."""
+        with self._lock:
+            self._delete_rows([chunk_id for chunk_id in chunk_ids if chunk_id in self._row_of])
+            self._weights = None
+            self._dirty = True
+
+    def _delete_rows(self, chunk_ids: List[str]):
+        if not chunk_ids:
+            return
+        self._materialize()
+        drop = {self._row_of[chunk_id] for chunk_id in chunk_ids}
+        keep = np.array([row for row in range(len(self.ids)) if row not in drop], dtype=np.int64)
+        self.ids = [self.ids[row] for row in keep]
+        self.docs = [self.docs[row] for row in keep]
+        self.tf = {field: matrix[keep] for field, matrix in self.tf.items()}
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+    def _compute_weights(self):
+        """Precompute per-field BM25 term weights as CSC matrices for fast column slicing."""
+        self._materialize()
+        weights = {}
+        for field, tf in self.tf.items():
+            n_docs = tf.shape[0]
+            if n_docs == 0:
+                weights[field] = sp.csc_matrix(tf.shape, dtype=np.float32)
+                continue
+            doc_len = np.asarray(tf.sum(axis=1)).ravel()
+            has_field = doc_len > 0
+            avg_len = doc_len[has_field].mean() if has_field.any() else 1.0
+            doc_freq = np.bincount(tf.indices, minlength=tf.shape[1])
+            field_docs = has_field.sum()
+            idf = np.log1p((field_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+            coo = tf.tocoo()
+            norm = self.k1 * (1 - self.b + self.b * doc_len[coo.row] / avg_len)
+            data = idf[coo.col] * coo.data / (coo.data + norm)
+            weights[field] = sp.csc_matrix((data.astype(np.float32), (coo.row, coo.col)), shape=tf.shape)
+        self._weights = weights
+
+    # Search
+
+    def _snapshot(self):
+        self._maybe_reload()
+        with self._lock:
+            if self._weights is None:
+                self._compute_weights()
+            return self._weights, self.docs, self.vocab
+
+    @staticmethod
+    def _top_hits(scores: np.ndarray, docs: List[Dict[str, str]], size: int) -> List[Dict[str, Any]]:
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > size:
+            matched = matched[np.argpartition(-scores[matched], size - 1)[:size]]
+        top = matched[np.argsort(-scores[matched], kind="stable")]
+        return [
+            {"_id": docs[row]["chunk_id"], "_score": float(scores[row]), "_source": docs[row]}
+            for row in top
+        ]
+
+    def search(self,
+               query: str,
+               size: int = 20,
+               timeout: Optional[str] = None,
+               request_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 search over content and context, returning Elasticsearch-shaped hits.
+
+        timeout and request_timeout are accepted for interface parity and
+        ignored: scoring is a couple of sparse products and finishes well
+        inside any sensible deadline.
+        """
+        weights, docs, vocab = self._snapshot()
+        if not docs:
+            return []
+
+        query_counts: Dict[int, int] = {}
+        for term in tokenize(query):
+            if term in vocab:
+                query_counts[vocab[term]] = query_counts.get(vocab[term], 0) + 1
+        if not query_counts:
+            return []
+        cols = np.fromiter(query_counts.keys(), dtype=np.int64)
+        counts = np.fromiter(query_counts.values(), dtype=np.float32)
+
+        scores = None
+        for field, boost in FIELD_BOOSTS.items():
+            field_scores = boost * (weights[field][:, cols] @ counts)
+            scores = field_scores if scores is None else np.maximum(scores, field_scores)
+        return self._top_hits(scores, docs, size)
+
+    def search_many(self,
+                    queries: List[str],
+                    size: int = 20,
+                    timeout: Optional[str] = None,
+                    block_queries: int = 32) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries, scoring block_queries of them per sparse product.
+
+        Each block's (documents x queries) score matrix is dense, so the block
+        size bounds memory on large indexes.
+        """
+        weights, docs, vocab = self._snapshot()
+        if not docs:
+            return [[] for _ in queries]
+
+        results = []
+        for start in range(0, len(queries), block_queries):
+            block = queries[start:start + block_queries]
+            # Query term counts as a (terms x queries) matrix over the terms any of them use
+            columns: Dict[int, int] = {}
+            rows, cols, counts = [], [], []
+            for q, query in enumerate(block):
+                for term in tokenize(query):
+                    if term in vocab:
+                        rows.append(columns.setdefault(vocab[term], len(columns)))
+                        cols.append(q)
+                        counts.append(1.0)
+            if not columns:
+                results.extend([] for _ in block)
+                continue
+            query_matrix = sp.csr_matrix((np.array(counts, dtype=np.float32), (rows, cols)),
+                                         shape=(len(columns), len(block)))  # Duplicate terms are summed
+            term_ids = np.fromiter(columns.keys(), dtype=np.int64)
+
+            scores = None
+            for field, boost in FIELD_BOOSTS.items():
+                field_scores = boost * (weights[field][:, term_ids] @ query_matrix).toarray()
+                scores = field_scores if scores is None else np.maximum(scores, field_scores)
+            results.extend(self._top_hits(scores[:, q], docs, size) for q in range(len(block)))
+        return results
+
+def create_lexical_index(backend: str = Config.LEXICAL_BACKEND,
+                         index_dir: str = Config.BM25_INDEX_DIR,
+                         index_name: str = "documents"):
+    """Build the BM25 backend selected in Config; index_dir is used by the local backend, index_name by Elasticsearch."""
+    if backend == "local":
+        return LocalBM25Index(index_dir)
+    if backend == "elasticsearch":
+        from .elasticsearch_manager import ElasticSearchManager
+        return ElasticSearchManager(index_name)
+    raise ValueError(f"Unknown lexical backend: {backend}")
@@ -0,0 +1,72 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from .metrics import record_cache
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a size bound, per-entry TTL and hit/miss counters.
+
+    A named cache also reports its lookups to the rag_cache_lookups_total metric.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, generation, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, generation: int = 0) -> Optional[Any]:
+        """Return the cached value, or None if it is missing, expired or from another generation."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_generation, value = entry
+                if expires_at > time.monotonic() and entry_generation == generation:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    record_cache(self.name, True)
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            record_cache(self.name, False)
+            return None
+
+    def put(self, key: Hashable, value: Any, generation: int = 0):
+        """Insert a value, evicting the least recently used entries past maxsize."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counts for sizing the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query for cache keys: lowercased with collapsed whitespace."""
+    return " ".join(query.lower().split())
@@ -0,0 +1,201 @@
+import os
+import json
+import mmap
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+# One fixed-width record per chunk: hash of the chunk id, byte offset and length
+# of the chunk's JSON line in the data file. Sorted by hash so lookups are a
+# binary search over a memory-mapped array.
+INDEX_DTYPE = np.dtype([("hash", "<u8"), ("offset", "<u8"), ("length", "<u4")])
+
+def _hash_id(chunk_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+class ChunkStore:
+    """Local chunk content store backed by an append-only data file and an id -> offset index."""
+
+    def __init__(self, store_dir: str = "./chunk_store"):
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, "chunks.dat")
+        self.index_path = os.path.join(store_dir, "chunks.idx.npy")
+        os.makedirs(store_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._pending: Dict[str, Any] = {}  # chunk_id -> (offset, length), or None when deleted
+        self._data: Optional[mmap.mmap] = None
+        self._data_size = 0
+
+    def _load_index(self) -> np.ndarray:
+        if os.path.exists(self.index_path):
+            return np.load(self.index_path, mmap_mode="r")
+        return np.zeros(0, dtype=INDEX_DTYPE)
+
+    def reload(self):
+        """Pick up an index flushed by another process. Pending writes of this one are kept."""
+        with self._lock:
+            if not self._pending:
+                self._index = self._load_index()
+
+    def _map_data(self, min_size: int) -> Optional[mmap.mmap]:
+        """Return a mapping of the data file covering at least `min_size` bytes."""
+        if self._data is not None and self._data_size >= min_size:
+            return self._data
+        with self._lock:
+            if self._data is None or self._data_size < min_size:
+                if not os.path.exists(self.data_path) or os.path.getsize(self.data_path) == 0:
+                    return None
+                with open(self.data_path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data, self._data_size = data, len(data)
+        return self._data
+
+    def _read(self, offset: int, length: int) -> Optional[Dict[str, Any]]:
+        data = self._map_data(offset + length)
+        if data is None:
+            return None
+        return json.loads(data[offset:offset + length])
+
+    def _locate(self, chunk_id: str) -> Optional[tuple]:
+        if chunk_id in self._pending:
+            return self._pending[chunk_id]
+        index = self._index
+        h = _hash_id(chunk_id)
+        pos = int(np.searchsorted(index["hash"], h))
+        # Walk every entry sharing this hash and check the stored id.
+        while pos < len(index) and int(index["hash"][pos]) == h:
+            offset, length = int(index["offset"][pos]), int(index["length"][pos])
+            record = self._read(offset, length)
+            if record is not None and record["chunk_id"] == chunk_id:
+                return offset, length
+            pos += 1
+        return None
+
+    def ids(self) -> List[str]:
+        """Return the ids of every chunk currently in the store."""
+        ids = []
+        for pos in range(len(self._index)):
+            record = self._read(int(self._index["offset"][pos]), int(self._index["length"][pos]))
+            if record is not None and record["chunk_id"] not in self._pending:
+                ids.append(record["chunk_id"])
+        ids.extend(chunk_id for chunk_id, loc in self._pending.items() if loc is not None)
+        return ids
+
+    def put_many(self, documents: List[Dict[str, Any]]):
+        """Append chunks to the data file. Call `flush` to persist the index."""
+        with self._lock, open(self.data_path, "ab") as f:
+            offset = f.tell()
+            for doc in documents:
+                line = json.dumps({
+                    "chunk_id": doc["chunk_id"],
+                    "source": doc["source"],
+                    "content": doc["content"],
+                    "context": doc.get("context", ""),
+                }).encode("utf-8") + b"\n"
+                f.write(line)
+                self._pending[doc["chunk_id"]] = (offset, len(line))
+                offset += len(line)
+
+    def delete(self, ids: List[str]):
+        """Drop chunks from the index. Their bytes stay in the data file until `compact`."""
+        with self._lock:
+            for chunk_id in ids:
+                self._pending[chunk_id] = None
+
+    def flush(self):
+        """
+        Merge pending writes and deletes into the on-disk index.
+
+        Entries of pending ids are dropped from the sorted index by hash and the
+        new ones inserted at their sorted positions, so only the records of
+        replaced or deleted chunks are read, never the whole store.
+        """
+        if not self._pending:
+            return
+        if os.path.exists(self.data_path):
+            self._map_data(os.path.getsize(self.data_path))  # Mapped outside the lock, which _map_data takes
+        with self._lock:
+            pending = self._pending
+            index = self._index
+            drop = np.isin(index["hash"], np.array([_hash_id(chunk_id) for chunk_id in pending], dtype="<u8"))
+            for pos in np.flatnonzero(drop):
+                # A different id may share the hash; keep its entry
+                offset, length = int(index["offset"][pos]), int(index["length"][pos])
+                if json.loads(self._data[offset:offset + length])["chunk_id"] not in pending:
+                    drop[pos] = False
+            kept = np.asarray(index[~drop])
+
+            written = [(_hash_id(chunk_id), loc[0], loc[1]) for chunk_id, loc in pending.items() if loc is not None]
+            added = np.sort(np.array(written, dtype=INDEX_DTYPE), order="hash")
+            merged = np.insert(kept, np.searchsorted(kept["hash"], added["hash"]), added)
+
+            tmp_path = self.index_path + ".tmp.npy"
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, self.index_path)
+            self._index = np.load(self.index_path, mmap_mode="r")
+            self._pending = {}
+
+    def compact(self):
+        """Rewrite the data file without deleted or superseded chunks."""
+        self.flush()
+        records = self.get_many(self.ids())
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+            self._data, self._data_size = None, 0
+            tmp_path = self.data_path + ".tmp"
+            os.replace(self.data_path, tmp_path)
+            self._index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.put_many(list(records.values()))
+        self.flush()
+        os.remove(tmp_path)
+
+    def get_many(self,
+                 ids: List[str],
+                 semantic_results: Optional[Dict] = None,
+                 bm25_results: Optional[List[Dict]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Resolve chunk ids to their stored records in a single batch.
+
+        Documents already returned by the semantic (Chroma) and BM25 (Elasticsearch)
+        queries are reused so only the remaining ids touch the data file. Ids that
+        cannot be resolved are left out of the returned mapping.
+        """
+        wanted = set(ids)
+        found: Dict[str, Dict[str, Any]] = {}
+
+        if bm25_results:
+            for hit in bm25_results:
+                source = hit["_source"]
+                if source["chunk_id"] in wanted:
+                    found[source["chunk_id"]] = {
+                        "chunk_id": source["chunk_id"],
+                        "source": source["source"],
+                        "content": source["content"],
+                        "context": source.get("context", ""),
+                    }
+
+        if semantic_results and semantic_results.get("documents"):
+            for doc_id, document, metadata in zip(
+                semantic_results["ids"][0],
+                semantic_results["documents"][0],
+                semantic_results["metadatas"][0],
+            ):
+                if doc_id in wanted and doc_id not in found:
+                    found[doc_id] = {
+                        "chunk_id": doc_id,
+                        "source": metadata["source"],
+                        "content": document,
+                        "context": "",
+                    }
+
+        for chunk_id in ids:
+            if chunk_id in found:
+                continue
+            loc = self._locate(chunk_id)
+            if loc is not None:
+                found[chunk_id] = self._read(*loc)
+
+        return found
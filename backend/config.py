@@ -6,10 +6,84 @@ load_dotenv() # Load environment variables from .env file
 class Config:
     PDF_DIR = "./data"
     CHROMA_DIR = "./chroma_db"
+    CHUNK_STORE_DIR = "./chunk_store"  # Local chunk content store used to resolve search results
+    LEXICAL_BACKEND = os.getenv("LEXICAL_BACKEND", "elasticsearch")  # "elasticsearch" or "local" (in-process BM25)
+    ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
+    BM25_INDEX_DIR = "./bm25_index"  # Used by the local lexical backend
+    ES_CONNECTIONS_PER_NODE = 20  # Pooled keep-alive connections to each Elasticsearch node
+    ES_REQUEST_TIMEOUT = 5.0  # Seconds before an Elasticsearch request is abandoned
+    ES_HEDGE_DELAY_MS = 0  # Send a second identical search if the first has not answered by then (0 disables)
+    # Vector index
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" or "mmap" (memory-mapped in-process index)
+    VECTOR_INDEX_DIR = "./vector_index"  # Used by the mmap vector backend
+    VECTOR_DTYPE = "float16"  # "float16" or "int8" (int8 candidates are rescored against a float16 copy)
+    VECTOR_RESCORE_FACTOR = 4  # int8 candidates kept per requested result before rescoring
+    VECTOR_IVF_MIN_ROWS = 200000  # Build coarse IVF lists once the index has this many chunks
+    VECTOR_IVF_NPROBE = 8  # IVF lists scanned per query
+    CONCURRENT_RETRIEVAL = True  # Query ChromaDB and Elasticsearch in parallel
+    RETRIEVER_TIMEOUT = 2.0  # Seconds to wait for each retriever before answering without it
+    RETRIEVAL_POOL_WORKERS = 16  # Threads running ChromaDB and Elasticsearch calls, shared by all requests
+    RETRIEVER_MAX_OVERDUE = 4  # Calls a retriever may have running past their deadline before new requests skip it
+    SIDECAR_SOCKET = os.getenv("SIDECAR_SOCKET", "")  # Use the search sidecar on this Unix socket instead of loading in-process
+    SIDECAR_CONNECTIONS = 16  # Pooled sidecar connections per API worker
+    SIDECAR_TIMEOUT = 30.0  # Seconds to wait for a sidecar reply
+    SHARD_ADDRESSES = [a for a in os.getenv("SHARD_ADDRESSES", "").split(",") if a]  # Search these shards (socket paths or host:port) instead of a local index
+    SHARD_DIR = "./shards"  # Stores of each shard built by `python -m backend.shards index`
+    SHARD_TIMEOUT = 3.0  # Seconds to wait for each shard before answering without it
+    SHARD_CANDIDATES = 20  # Candidates per retriever gathered from each shard before global fusion
+    STARTUP_RETRY_MAX = 30  # Max seconds between attempts to load and warm up the search system
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")  # "sentence-transformers" or "onnx"
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    EMBEDDING_MAX_LENGTH = 256  # Word pieces the model attends to
+    ONNX_MODEL_DIR = "./models/all-MiniLM-L6-v2-onnx"  # Written by `python -m backend.embeddings export`
+    ONNX_QUANTIZED = True  # Use the dynamically int8-quantized model
+    ONNX_THREADS = 0  # Intra-op threads for ONNX Runtime (0 = runtime default)
+    EMBEDDING_BATCH_WINDOW_MS = 3  # How long a query encode waits for others to batch with (0 disables)
+    EMBEDDING_MAX_BATCH_SIZE = 32  # Query encodes per batched forward pass
+    EXTRACTION_WORKERS = min(8, os.cpu_count() or 1)  # Processes used to extract and chunk PDFs (1 = in-process)
+    CHUNK_MODE = os.getenv("CHUNK_MODE", "sentences")  # "sentences" or "tokens" (sized in model word pieces); switching re-chunks every PDF
+    CHUNK_TOKENS = 256  # Word pieces per chunk in token mode, capped to fit EMBEDDING_MAX_LENGTH with special tokens
+    CHUNK_OVERLAP_TOKENS = 32  # Word pieces repeated at the start of the next chunk in token mode
+    EXTRACTION_TIMEOUT = 120  # Seconds allowed per PDF before it is skipped
+    INDEX_BATCH_SIZE = 64  # Chunks embedded and written per batch while indexing
+    INDEX_QUEUE_BATCHES = 4  # Batches buffered between indexing stages
+    INDEX_CHECKPOINT_BATCHES = 50  # Batches written between checkpoints of finished files while indexing
+    INDEX_CHECKPOINT_SECONDS = 60.0  # Longest time between checkpoints while indexing
+    MANIFEST_PATH = "./index_manifest.json"  # Content hashes and chunk ids of indexed PDFs
+    INDEX_GENERATION_PATH = "./index_generation"  # Corpus version counter shared by indexer and API
+    SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")  # Prebuilt index snapshot loaded at startup, unless already loaded
+    EMBEDDING_CACHE_SIZE = 1024  # Query embeddings kept in memory
+    EMBEDDING_CACHE_TTL = 3600  # Seconds
+    RESULT_CACHE_SIZE = 512  # Fused search results kept in memory, keyed by (query, k)
+    RESULT_CACHE_TTL = 300  # Seconds
+    COALESCE_REQUESTS = True  # Identical concurrent retrievals and LLM calls share one in-flight call
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Set your OpenAI API key in environment variables
     OPENAI_MODEL = "o1-mini-2024-09-12"  # Use o1-mini for cost-effective responses
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # Another OpenAI-compatible endpoint, e.g. benchmarks/fake_openai.py
+    OPENAI_MAX_CONNECTIONS = 100  # Concurrent connections to the OpenAI API per client
+    OPENAI_MAX_KEEPALIVE = 20  # Idle connections kept open for reuse
+    OPENAI_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle connection is kept
+    OPENAI_CONNECT_TIMEOUT = 5.0  # Seconds
+    OPENAI_READ_TIMEOUT = 60.0  # Seconds between bytes, so long streams are fine but a stall is not
+    RETRY_MAX_RETRIES = 2  # Retries of a failed upstream call on transient errors
+    RETRY_BACKOFF_BASE = 0.2  # Seconds; the n-th retry waits up to base * 2**n, randomly jittered
+    RETRY_BACKOFF_MAX = 5.0  # Seconds
+    BATCH_MAX_QUERIES = 10000  # Largest batch accepted by /search/batch and /chat/batch
+    BATCH_SEARCH_GROUP = 64  # Batch queries retrieved together per encode and store round trip
+    BATCH_LLM_CONCURRENCY = 8  # LLM calls in flight per /chat/batch request
+    RETRIEVAL_CONCURRENCY = 64  # Chat requests retrieving at once; more wait in a queue
+    RETRIEVAL_QUEUE_SIZE = 256  # Requests waiting to retrieve before new ones get 429
+    RETRIEVAL_QUEUE_TIMEOUT = 2.0  # Seconds a request waits to retrieve before it gets 503
+    LLM_CONCURRENCY = 32  # Chat requests generating an answer at once; more wait in a queue
+    LLM_QUEUE_SIZE = 128  # Requests waiting for the LLM before new ones get 429
+    LLM_QUEUE_TIMEOUT = 10.0  # Seconds a request waits for the LLM before it is shed
+    DEGRADED_RESPONSES = os.getenv("DEGRADED_RESPONSES", "false").lower() in ("1", "true", "yes")  # Shed LLM requests get sources without an answer
     MAX_CONTEXT_TOKENS = 2000  # Limit context size to manage API costs
     TEMPERATURE = 0.1  # Controls creativity of responses
     MAX_HISTORY = 3  # Number of conversation turns to keep in memory
+    SESSION_CACHE_SIZE = 1024  # Conversations kept server-side before the least recently used is evicted
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() in ("1", "true", "yes")  # Export OpenTelemetry spans
+    OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "rag-backend")
 
 config = Config()
\ No newline at end of file
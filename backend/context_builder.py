@@ -0,0 +1,93 @@
+import logging
+import re
+from typing import List, Dict, Any, Tuple
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends followed by whitespace; cheap enough to run per request
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+def _load_encoding(model: str):
+    """tiktoken encoding for the model, or None when tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+class ContextBuilder:
+    """
+    Packs retrieved chunks into a prompt context of at most max_tokens tokens.
+
+    Chunks are taken greedily in order of fused retrieval score. A chunk that
+    does not fit whole is trimmed at a sentence boundary. Sentences already
+    included from a higher-ranked chunk are skipped, so overlapping chunks do
+    not spend the budget twice.
+    """
+
+    def __init__(self, max_tokens: int = Config.MAX_CONTEXT_TOKENS, model: str = Config.OPENAI_MODEL):
+        self.max_tokens = max_tokens
+        self.encoding = _load_encoding(model)
+        if self.encoding is None:
+            logger.warning("tiktoken is not installed; estimating context tokens as characters / 4")
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def build(self, search_results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Return (context, results used, stats).
+
+        stats holds context_tokens, the exact token count of the context,
+        along with how many chunks were used, trimmed and dropped, and how many
+        duplicate sentences were skipped.
+        """
+        ranked = sorted(search_results, key=lambda res: res.get("score", 0.0), reverse=True)
+        seen = set()
+        sections, used = [], []
+        stats = {"chunks_used": 0, "chunks_trimmed": 0, "chunks_dropped": 0, "duplicate_sentences": 0}
+        # Separators between sections cost a token or two each; keep a little slack for them
+        remaining = self.max_tokens - 2 * len(ranked)
+
+        for res in ranked:
+            header = f"Source: {res['source']}\nContent: "
+            header_tokens = self.count_tokens(header)
+            if remaining - header_tokens <= 0:
+                stats["chunks_dropped"] += 1
+                continue
+
+            kept, trimmed = [], False
+            budget = remaining - header_tokens
+            for sentence in SENTENCE_BOUNDARY.split(res["content"].strip()):
+                key = " ".join(sentence.lower().split())
+                if not key:
+                    continue
+                if key in seen:
+                    stats["duplicate_sentences"] += 1
+                    continue
+                tokens = self.count_tokens(sentence) + 1  # Joining space
+                if tokens > budget:
+                    trimmed = True
+                    break
+                seen.add(key)
+                kept.append(sentence)
+                budget -= tokens
+
+            if not kept:
+                stats["chunks_dropped"] += 1
+                continue
+            sections.append(header + " ".join(kept))
+            used.append(res)
+            remaining = budget
+            stats["chunks_used"] += 1
+            stats["chunks_trimmed"] += int(trimmed)
+
+        context = "\n\n".join(sections)
+        stats["context_tokens"] = self.count_tokens(context)
+        return context, used, stats
@@ -1,73 +1,309 @@
+import logging
 import os
-from typing import List, Dict, Any
+import re
+import bisect
+import signal
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from pathlib import Path
 import pypdf
-import nltk
 from nltk.tokenize import sent_tokenize
+from .config import Config
+from .embeddings import load_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# End of a sentence: terminal punctuation and any closing quotes or brackets, then
+# whitespace before something that can start the next sentence. Token mode only
+# uses it to snap chunk cuts; sentence mode splits with NLTK so existing indexes
+# keep their boundaries.
+SENTENCE_END = re.compile(r"([.!?][\"'\u201d\u2019)\]]*)\s+(?=[\"'\u201c\u2018(\[]?[A-Z0-9])")
+
+def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) character offsets of each sentence, scanning text lazily."""
+    start = len(text) - len(text.lstrip())
+    for match in SENTENCE_END.finditer(text, start):
+        yield start, match.end(1)
+        start = match.end()
+    end = len(text.rstrip())
+    if end > start:
+        yield start, end
+
+class ExtractionTimeout(Exception):
+    """Raised when a single PDF takes longer than the per-file timeout."""
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+def alarm_available() -> bool:
+    """SIGALRM can interrupt work only on platforms that have it, and only in the main thread."""
+    return hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+
+def _process_pdf_worker(args) -> Dict[str, Any]:
+    """Process-pool entry point: extract and chunk one PDF under its own alarm."""
+    window_size, chunk_mode, chunk_tokens, overlap_tokens, pdf_path, timeout = args
+    logging.basicConfig(level=Config.LOG_LEVEL)  # Spawned workers do not inherit the parent's logging setup
+    processor = DocumentProcessor(window_size=window_size, workers=1, file_timeout=timeout, chunk_mode=chunk_mode,
+                                  chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    return processor._process_file_safely(Path(pdf_path))
 
 class DocumentProcessor:
-    def __init__(self, window_size: int = 3):
+    def __init__(self,
+                 window_size: int = 3,
+                 workers: int = Config.EXTRACTION_WORKERS,
+                 file_timeout: float = Config.EXTRACTION_TIMEOUT,
+                 chunk_mode: str = Config.CHUNK_MODE,
+                 chunk_tokens: int = Config.CHUNK_TOKENS,
+                 overlap_tokens: int = Config.CHUNK_OVERLAP_TOKENS,
+                 tokenizer=None):
+        if chunk_mode not in ("tokens", "sentences"):
+            raise ValueError(f"Unknown chunk mode: {chunk_mode}")
         self.window_size = window_size
-        
+        self.workers = workers
+        self.file_timeout = file_timeout
+        self.chunk_mode = chunk_mode
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._tokenizer = tokenizer  # Loaded on first use, so sentence mode never needs it
+        self._special_tokens: Optional[Tuple[List[int], List[int]]] = None
+        self.failed_files: List[str] = []  # Files that failed or timed out in the last process_files call
+
+    @property
+    def chunking(self) -> str:
+        """Identifies the chunking settings; files indexed under other settings are chunked again."""
+        if self.chunk_mode == "tokens":
+            return f"tokens:{Config.EMBEDDING_MODEL}:{self.chunk_tokens}:{self.overlap_tokens}:{self.window_size}"
+        return f"sentences:{self.window_size}"
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         with open(pdf_path, 'rb') as file:
             pdf_reader = pypdf.PdfReader(file)
-            text = ''
-            for page in pdf_reader.pages:
-                text += page.extract_text() + ' '
-        return text.strip()
-    
+            pages = [page.extract_text() for page in pdf_reader.pages]
+        return ' '.join(pages).strip()
+
+    def create_chunks(self, text: str) -> List[Dict[str, Any]]:
+        """Chunk text according to chunk_mode."""
+        if self.chunk_mode == "tokens":
+            return self.create_token_chunks(text)
+        return self.create_contextual_chunks(text)
+
     def create_contextual_chunks(self, text: str, chunk_size: int = 128) -> List[Dict[str, str]]:
-        """Create chunks with surrounding context."""
-        sentences = sent_tokenize(text)
+        """Create chunks of chunk_size sentences with surrounding context."""
+        sentences = iter(sent_tokenize(text))
+        previous = deque(maxlen=self.window_size)  # Sentences just before the current chunk
+        current = list(itertools.islice(sentences, chunk_size))
         chunks = []
-        
-        for i in range(0, len(sentences), chunk_size):
-            # Create main chunk
-            chunk_sentences = sentences[i:i + chunk_size]
-            chunk_text = ' '.join(chunk_sentences)
-            
-            # Create context (previous and next sentences)
-            start_idx = max(0, i - self.window_size)
-            end_idx = min(len(sentences), i + chunk_size + self.window_size)
-            context_sentences = sentences[start_idx:i] + sentences[i + chunk_size:end_idx]
-            context = ' '.join(context_sentences)
-            
+
+        while current:
+            following = list(itertools.islice(sentences, chunk_size))
+            # Context is the previous and next window_size sentences
+            context = list(previous) + following[:self.window_size]
             chunks.append({
-                'content': chunk_text,
-                'context': context
+                'content': ' '.join(current),
+                'context': ' '.join(context)
             })
-        
+            previous.extend(current)
+            current = following
+
+        return chunks
+
+    def _get_tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = load_tokenizer()
+        if self._special_tokens is None:
+            # The model's own template, e.g. [CLS] ... [SEP], found from the mask of a one-word input
+            sample = self._tokenizer.encode("a")
+            content = [i for i, special in enumerate(sample.special_tokens_mask) if not special]
+            self._special_tokens = (sample.ids[:content[0]], sample.ids[content[-1] + 1:])
+        return self._tokenizer
+
+    def create_token_chunks(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Create chunks of at most chunk_tokens word pieces of the embedding model.
+
+        The document is tokenized once and chunk boundaries are taken from the
+        token offsets. A chunk ends at the last sentence start in the second half
+        of its window when there is one, and the next chunk repeats up to
+        overlap_tokens tokens, starting at a sentence where possible. Each chunk
+        keeps its token ids, special tokens included, so indexing embeds it
+        without tokenizing again.
+        """
+        tokenizer = self._get_tokenizer()
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        ids, offsets = encoding.ids, encoding.offsets
+        prefix, suffix = self._special_tokens
+        size = max(1, min(self.chunk_tokens, Config.EMBEDDING_MAX_LENGTH - len(prefix) - len(suffix)))
+        overlap = min(self.overlap_tokens, size // 2)
+
+        spans = list(iter_sentence_spans(text))
+        span_starts = [start for start, _ in spans]
+        span_ends = [end for _, end in spans]
+        token_starts = [start for start, _ in offsets]
+        cuts = [bisect.bisect_left(token_starts, start) for start in span_starts]  # First token of each sentence
+
+        chunks = []
+        pos = 0
+        while pos < len(ids):
+            end = min(pos + size, len(ids))
+            if end < len(ids):
+                i = bisect.bisect_right(cuts, end) - 1
+                if i >= 0 and cuts[i] > pos + size // 2:
+                    end = cuts[i]
+            char_start, char_end = offsets[pos][0], offsets[end - 1][1]
+
+            # Context is the window_size sentences either side of the chunk
+            before = bisect.bisect_right(span_ends, char_start)
+            after = bisect.bisect_left(span_starts, char_end)
+            context = spans[max(0, before - self.window_size):before] + spans[after:after + self.window_size]
+            chunks.append({
+                'content': text[char_start:char_end],
+                'context': ' '.join(text[start:stop] for start, stop in context),
+                'token_ids': prefix + ids[pos:end] + suffix
+            })
+            if end == len(ids):
+                break
+
+            next_pos = end - overlap
+            i = bisect.bisect_left(cuts, next_pos)
+            if i < len(cuts) and cuts[i] < end:
+                next_pos = cuts[i]
+            pos = max(next_pos, pos + 1)
+
         return chunks
 
     def process_documents(self, pdf_dir: str) -> List[Dict[str, Any]]:
         """Process all PDFs with context."""
-        all_documents = []
-        pdf_files = list(Path(pdf_dir).glob('*.pdf'))
-        print(f"Found {len(pdf_files)} PDF files in {pdf_dir}")
-        
+        pdf_files = sorted(Path(pdf_dir).glob('*.pdf'))
+        logger.info("Found %d PDF files in %s", len(pdf_files), pdf_dir)
+
         if len(pdf_files) == 0:
             raise ValueError(f"No PDF files found in directory: {pdf_dir}")
-            
-        for pdf_file in pdf_files:
-            print(f"Processing: {pdf_file.name}")
-            text = self.extract_text_from_pdf(str(pdf_file))
-            print(f"Extracted {len(text)} characters from {pdf_file.name}")
-            
-            if not text.strip():
-                print(f"Warning: No text extracted from {pdf_file.name}")
-                continue
-                
-            chunks = self.create_contextual_chunks(text)
-            print(f"Created {len(chunks)} chunks from {pdf_file.name}")
-            
-            for i, chunk in enumerate(chunks):
-                all_documents.append({
-                    'source': pdf_file.name,
-                    'chunk_id': f"{pdf_file.stem}_chunk_{i}",
-                    'content': chunk['content'],
-                    'context': chunk['context']
-                })
-        
-        print(f"Total documents processed: {len(all_documents)}")
-        return all_documents
\ No newline at end of file
+
+        return self.process_files(pdf_files)
+
+    def process_file(self, pdf_file: Path) -> List[Dict[str, Any]]:
+        """Extract and chunk a single PDF."""
+        logger.debug("Processing: %s", pdf_file.name)
+        text = self.extract_text_from_pdf(str(pdf_file))
+        logger.debug("Extracted %d characters from %s", len(text), pdf_file.name)
+
+        if not text.strip():
+            logger.warning("No text extracted from %s", pdf_file.name)
+            return []
+
+        chunks = self.create_chunks(text)
+        logger.info("Created %d chunks from %s", len(chunks), pdf_file.name)
+
+        return [
+            {
+                'source': pdf_file.name,
+                'chunk_id': f"{pdf_file.stem}_chunk_{i}",
+                **chunk
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+
+    def process_files(self, pdf_files: List[Path]) -> List[Dict[str, Any]]:
+        """
+        Process the given PDFs with context.
+
+        With more than one worker the PDFs are extracted and chunked in a process
+        pool. Results keep the input order either way, so chunk ids are stable. A
+        PDF that raises or exceeds file_timeout is skipped and listed in
+        failed_files instead of aborting the run.
+        """
+        self.failed_files = []
+        all_documents = []
+        for pdf_file, documents, error in self.iter_files(pdf_files):
+            if error is not None:
+                self.failed_files.append(pdf_file.name)
+            all_documents.extend(documents)
+
+        logger.info("Total documents processed: %d", len(all_documents))
+        return all_documents
+
+    def iter_files(self, pdf_files: List[Path]) -> Iterator[Tuple[Path, List[Dict[str, Any]], Optional[str]]]:
+        """
+        Yield (pdf_file, chunks, error) for each PDF in input order.
+
+        Only a bounded number of files are in flight at once, so memory stays flat
+        no matter how many PDFs there are. error is None on success.
+
+        Files are processed in-process with one worker, or a single file, as
+        long as the per-file alarm can fire here. Otherwise (e.g. when called
+        from an indexing pipeline thread) they go through the pool, so a
+        hanging PDF cannot block the run.
+        """
+        parallel = self.workers > 1 and len(pdf_files) > 1
+        if pdf_files and (parallel or (self.file_timeout and not alarm_available())):
+            results = self._iter_files_parallel(pdf_files)
+        else:
+            results = (self._process_file_safely(pdf_file) for pdf_file in pdf_files)
+
+        for pdf_file, result in zip(pdf_files, results):
+            if result["error"] is not None:
+                logger.warning("Skipping %s: %s", pdf_file.name, result["error"])
+            yield pdf_file, result["documents"], result["error"]
+
+    def _process_file_safely(self, pdf_file: Path) -> Dict[str, Any]:
+        """process_file under a file_timeout alarm when one can fire, with errors returned rather than raised."""
+        use_alarm = bool(self.file_timeout) and alarm_available()
+        if use_alarm:
+            previous = signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, self.file_timeout)
+        try:
+            return {"documents": self.process_file(pdf_file), "error": None}
+        except ExtractionTimeout:
+            return {"documents": [], "error": f"timed out after {self.file_timeout}s"}
+        except Exception as e:
+            return {"documents": [], "error": str(e)}
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+
+    def _iter_files_parallel(self, pdf_files: List[Path]) -> Iterator[Dict[str, Any]]:
+        """
+        Run _process_pdf_worker over a spawn-based pool, yielding results in input order.
+
+        A worker stuck past its alarm fails only its own file: the pool is
+        replaced, and files that were in flight on it and not yet finished are
+        submitted again to the new one.
+        """
+        workers = max(1, min(self.workers, len(pdf_files)))
+        logger.info("Processing %d PDF files with %d worker processes", len(pdf_files), workers)
+        # Spawn rather than fork: the parent may already hold model threads and open clients
+        ctx = multiprocessing.get_context("spawn")
+        pool = ctx.Pool(processes=workers, maxtasksperchild=50)
+        tasks = iter([(self.window_size, self.chunk_mode, self.chunk_tokens, self.overlap_tokens, str(pdf_file), self.file_timeout)
+                      for pdf_file in pdf_files])
+        in_flight = deque()  # (task, async result) in input order
+        try:
+            # Keep at most two files per worker queued so finished chunks cannot pile up
+            for task in itertools.islice(tasks, workers * 2):
+                in_flight.append((task, pool.apply_async(_process_pdf_worker, (task,))))
+            while in_flight:
+                task, pending = in_flight.popleft()
+                try:
+                    # Workers enforce the per-file alarm; this only guards against a worker
+                    # stuck in native code where the alarm cannot fire.
+                    result = pending.get(timeout=self.file_timeout + 30)
+                except multiprocessing.TimeoutError:
+                    logger.warning("Worker hung on %s, restarting the extraction pool", Path(task[2]).name)
+                    result = {"documents": [], "error": f"worker hung for over {self.file_timeout + 30}s"}
+                    finished = [other.ready() for _, other in in_flight]
+                    pool.terminate()
+                    pool = ctx.Pool(processes=workers, maxtasksperchild=50)
+                    in_flight = deque(
+                        (other_task, other if done else pool.apply_async(_process_pdf_worker, (other_task,)))
+                        for (other_task, other), done in zip(in_flight, finished)
+                    )
+                for task in itertools.islice(tasks, 1):
+                    in_flight.append((task, pool.apply_async(_process_pdf_worker, (task,))))
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
@@ -1,11 +1,69 @@
-from elasticsearch import Elasticsearch
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from elasticsearch import Elasticsearch, ApiError
 from elasticsearch.helpers import bulk
-from typing import List, Dict, Any
+from elastic_transport import ConnectionError as TransportConnectionError, ConnectionTimeout
+from typing import List, Dict, Any, Optional
+from .config import Config
+from .retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+def is_retryable_es_error(error: BaseException) -> bool:
+    """Connection failures, timeouts and overload responses are worth retrying."""
+    if isinstance(error, (TransportConnectionError, ConnectionTimeout)):
+        return True
+    return isinstance(error, ApiError) and error.meta.status in (429, 502, 503, 504)
 
 class ElasticSearchManager:
-    def __init__(self, index_name: str = "documents"):
-        self.es = Elasticsearch("http://localhost:9200")
+    def __init__(self,
+                 index_name: str = "documents",
+                 url: str = Config.ELASTICSEARCH_URL,
+                 connections_per_node: int = Config.ES_CONNECTIONS_PER_NODE,
+                 request_timeout: float = Config.ES_REQUEST_TIMEOUT,
+                 hedge_delay_ms: float = Config.ES_HEDGE_DELAY_MS):
+        # Retries are done by self.retry_policy (jittered backoff) rather than the transport
+        self.es = Elasticsearch(
+            url,
+            connections_per_node=connections_per_node,
+            request_timeout=request_timeout,
+            max_retries=0,
+            retry_on_timeout=False
+        )
         self.index_name = index_name
+        self.retry_policy = RetryPolicy(is_retryable_es_error)
+        self.hedge_delay = hedge_delay_ms / 1000.0
+        self._hedge_pool = ThreadPoolExecutor(max_workers=connections_per_node, thread_name_prefix="es-hedge") \
+            if hedge_delay_ms > 0 else None
+        self._lock = threading.Lock()
+        self._hedges = 0  # Searches that sent a second request
+        self._hedge_wins = 0  # ... and were answered by it first
+
+    def ping(self) -> bool:
+        return self.es.ping()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Per-node connection use, read from each node's urllib3 pool."""
+        nodes = {}
+        for node in self.es.transport.node_pool.all():
+            pool = getattr(node, "pool", None)
+            if pool is None:
+                continue
+            free = pool.pool.qsize() if pool.pool is not None else 0
+            nodes[str(node.base_url)] = {
+                "in_use": pool.pool.maxsize - free if pool.pool is not None else 0,
+                "max_connections": pool.pool.maxsize if pool.pool is not None else 0,
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+        with self._lock:
+            hedging = {"delay_ms": self.hedge_delay * 1000, "hedged": self._hedges, "hedge_wins": self._hedge_wins}
+        return {"nodes": nodes, "retries": self.retry_policy.stats(), "hedging": hedging}
+
+    def flush(self):
+        """Elasticsearch persists writes itself; kept for interface parity with LocalBM25Index."""
         
     def create_index(self):
         """Create Elasticsearch index with appropriate mappings."""
@@ -37,21 +95,111 @@ class ElasticSearchManager:
             }
             for doc in documents
         ]
-        bulk(self.es, actions)
-
-    def search(self, query: str, size: int = 20) -> List[Dict[str, Any]]:
-        """Search using BM25 on both content and context."""
-        response = self.es.search(
-            index=self.index_name,
-            body={
-                "query": {
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["content^2", "context"],
-                        "type": "best_fields"
-                    }
-                },
-                "size": size
-            }
-        )
-        return response["hits"]["hits"]
\ No newline at end of file
+        self.retry_policy.call(bulk, self.es, actions)
+
+    def delete_documents(self, chunk_ids: List[str]):
+        """Delete documents by chunk id, ignoring ids that are already gone."""
+        actions = [
+            {"_op_type": "delete", "_index": self.index_name, "_id": chunk_id}
+            for chunk_id in chunk_ids
+        ]
+        self.retry_policy.call(bulk, self.es, actions, raise_on_error=False)
+
+    def search(self,
+               query: str,
+               size: int = 20,
+               timeout: Optional[str] = None,
+               request_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Search using BM25 on both content and context.
+
+        When `timeout` (e.g. "200ms") is given, Elasticsearch stops collecting at
+        that point and returns the hits gathered so far instead of failing.
+        request_timeout (seconds) is a client-side deadline for the whole call,
+        retries and hedges included, so a caller that stops waiting does not
+        leave a request holding its thread for ES_REQUEST_TIMEOUT.
+        With hedging enabled, a second identical request is sent if the first
+        has not answered within the hedge delay, and whichever answers first wins.
+        """
+        body = self._query_body(query, size, timeout)
+        deadline = time.monotonic() + request_timeout if request_timeout else None
+        if self._hedge_pool is None:
+            response = self.retry_policy.call(self._search, body, deadline)
+        else:
+            response = self.retry_policy.call(self._hedged_search, body, deadline)
+        if response.get("timed_out"):
+            logger.warning("Elasticsearch timed out, returning %d partial hits", len(response["hits"]["hits"]))
+        return response["hits"]["hits"]
+
+    def search_many(self, queries: List[str], size: int = 20, timeout: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Run several searches in one msearch round trip, returning the hits of each.
+
+        A query that fails on the Elasticsearch side gets no hits rather than
+        failing the others.
+        """
+        if not queries:
+            return []
+        searches = []
+        for query in queries:
+            searches.append({"index": self.index_name})
+            searches.append(self._query_body(query, size, timeout))
+        response = self.retry_policy.call(self.es.msearch, searches=searches)
+        results = []
+        for query, item in zip(queries, response["responses"]):
+            if "error" in item:
+                logger.warning("Elasticsearch search for %r failed: %s", query, item["error"])
+                results.append([])
+                continue
+            if item.get("timed_out"):
+                logger.warning("Elasticsearch timed out, returning %d partial hits", len(item["hits"]["hits"]))
+            results.append(item["hits"]["hits"])
+        return results
+
+    def _query_body(self, query: str, size: int, timeout: Optional[str]) -> Dict[str, Any]:
+        body = {
+            "query": {
+                "multi_match": {
+                    "query": query,
+                    "fields": ["content^2", "context"],
+                    "type": "best_fields"
+                }
+            },
+            "size": size
+        }
+        if timeout:
+            body["timeout"] = timeout
+        return body
+
+    def _search(self, body: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
+        client = self.es
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Elasticsearch search deadline passed")
+            client = self.es.options(request_timeout=remaining)
+        return client.search(index=self.index_name, body=body)
+
+    def _hedged_search(self, body: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
+        primary = self._hedge_pool.submit(self._search, body, deadline)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        hedge = self._hedge_pool.submit(self._search, body, deadline)
+        with self._lock:
+            self._hedges += 1
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
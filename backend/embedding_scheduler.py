@@ -0,0 +1,126 @@
+import time
+import queue
+import asyncio
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict, Any
+from .config import Config
+from .metrics import BATCH_SIZE_BUCKETS, record_embedding_batch
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent query encodes into single batched forward passes.
+
+    Each caller enqueues one text. A worker thread takes the first waiting text,
+    keeps collecting for up to window_ms after it arrived or until
+    max_batch_size texts are waiting, and encodes them in one call. Each caller
+    then gets its own row back.
+    """
+
+    def __init__(self,
+                 model,
+                 window_ms: float = Config.EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch_size: int = Config.EMBEDDING_MAX_BATCH_SIZE):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._batch_histogram = [0] * len(BATCH_SIZE_BUCKETS)
+        self._queue_waits = deque(maxlen=1000)  # Seconds between enqueue and encode, last 1000 requests
+        self._encode_times = deque(maxlen=1000)
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a future for its embedding vector."""
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Blocking encode with the same (n, dimension) shape as the underlying model."""
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    async def aencode(self, text: str) -> np.ndarray:
+        """Encode one text from asyncio code; returns a (1, dimension) array."""
+        vector = await asyncio.wrap_future(self.submit(text))
+        return vector[None, :]
+
+    def _collect(self) -> List[tuple]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                vectors = self.model.encode([text for text, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+            for row, (_, future, _) in enumerate(batch):
+                future.set_result(vectors[row])
+            self._record(batch, started, finished)
+
+    def _record(self, batch: List[tuple], started: float, finished: float):
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+                if len(batch) <= bound:
+                    self._batch_histogram[i] += 1
+                    break
+            else:
+                self._batch_histogram[-1] += 1
+            waits = [started - enqueued for _, _, enqueued in batch]
+            self._queue_waits.extend(waits)
+            self._encode_times.append(finished - started)
+        record_embedding_batch(len(batch), waits)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batch-size and queue-wait figures for tuning window_ms and max_batch_size.
+
+        Both are also exported as the rag_embedding_batch_size and
+        rag_embedding_queue_wait_seconds histograms on /metrics.
+        """
+        with self._lock:
+            waits = np.array(self._queue_waits) * 1000
+            encodes = np.array(self._encode_times) * 1000
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "batch_size_histogram": {
+                    f"<={bound}": count for bound, count in zip(BATCH_SIZE_BUCKETS, self._batch_histogram)
+                },
+                "queue_wait_ms": {
+                    "p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                    "p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                    "max": float(waits.max()) if len(waits) else 0.0,
+                },
+                "encode_ms": {
+                    "p50": float(np.percentile(encodes, 50)) if len(encodes) else 0.0,
+                    "p95": float(np.percentile(encodes, 95)) if len(encodes) else 0.0,
+                },
+                "queue_depth": self._queue.qsize(),
+            }
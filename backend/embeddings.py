@@ -0,0 +1,249 @@
+import logging
+import os
+import argparse
+import functools
+import inspect
+import numpy as np
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBackend:
+    """
+    Interface for the sentence encoder used for indexing and queries.
+
+    Backends that can embed pre-tokenized input also implement
+    encode_token_ids(token_ids, batch_size), which token-mode chunking uses to
+    skip a second tokenization of every chunk.
+    """
+
+    dimension: int = 384
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Return an (n, dimension) float32 array of L2-normalized embeddings."""
+        raise NotImplementedError
+
+def _hf_name(model_name: str) -> str:
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(model_name: str = Config.EMBEDDING_MODEL, model_dir: str = Config.ONNX_MODEL_DIR):
+    """
+    The embedding model's fast tokenizer, with truncation and padding off.
+
+    Reads tokenizer.json from the exported ONNX model directory when it exists,
+    otherwise fetches it from the Hugging Face hub. Loaded once per process.
+    """
+    from tokenizers import Tokenizer
+    path = os.path.join(model_dir, "tokenizer.json")
+    tokenizer = Tokenizer.from_file(path) if os.path.exists(path) else Tokenizer.from_pretrained(_hf_name(model_name))
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+def _length_sorted_batches(token_ids: List[List[int]], batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Yield (row indices, input_ids, attention_mask) in length order, so each batch is padded only to its longest input."""
+    order = np.argsort([len(ids) for ids in token_ids], kind="stable")
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        max_len = max(len(token_ids[i]) for i in batch)
+        input_ids = np.zeros((len(batch), max_len), dtype=np.int64)
+        attention_mask = np.zeros((len(batch), max_len), dtype=np.int64)
+        for row, i in enumerate(batch):
+            input_ids[row, :len(token_ids[i])] = token_ids[i]
+            attention_mask[row, :len(token_ids[i])] = 1
+        yield batch, input_ids, attention_mask
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """PyTorch sentence-transformers encoder (the original backend)."""
+
+    def __init__(self, model_name: str = Config.EMBEDDING_MODEL):
+        # Imported here so selecting another backend never loads torch
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=kwargs.get("show_progress_bar", False),
+            normalize_embeddings=True
+        )
+
+    def encode_token_ids(self, token_ids: List[List[int]], batch_size: int = 32) -> np.ndarray:
+        """Encode already tokenized inputs (special tokens included) without tokenizing them again."""
+        import torch
+        output = np.zeros((len(token_ids), self.dimension), dtype=np.float32)
+        for batch, input_ids, attention_mask in _length_sorted_batches(token_ids, batch_size):
+            features = {
+                "input_ids": torch.from_numpy(input_ids).to(self.model.device),
+                "attention_mask": torch.from_numpy(attention_mask).to(self.model.device),
+            }
+            with torch.no_grad():
+                pooled = self.model(features)["sentence_embedding"]
+            output[batch] = torch.nn.functional.normalize(pooled, dim=1).cpu().numpy()
+        return output
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    ONNX Runtime encoder for CPU serving.
+
+    Expects a directory produced by `export_onnx_model` holding model.onnx (and
+    optionally the int8 model_quantized.onnx) plus the tokenizer.json of the
+    original model. Mean pooling and normalization match all-MiniLM-L6-v2's
+    sentence-transformers pipeline. Inputs are sorted by token length before
+    batching so each batch is padded only to its own longest text.
+    """
+
+    def __init__(self,
+                 model_dir: str = Config.ONNX_MODEL_DIR,
+                 quantized: bool = Config.ONNX_QUANTIZED,
+                 max_length: int = Config.EMBEDDING_MAX_LENGTH,
+                 threads: int = Config.ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = "model_quantized.onnx" if quantized else "model.onnx"
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise ValueError(f"ONNX model not found: {model_path}. Run `python -m backend.embeddings export` first.")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {inp.name for inp in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        return self.encode_token_ids([encoding.ids for encoding in encodings], batch_size)
+
+    def encode_token_ids(self, token_ids: List[List[int]], batch_size: int = 32) -> np.ndarray:
+        """Encode already tokenized inputs (special tokens included), length-sorted into batches."""
+        output = np.zeros((len(token_ids), self.dimension), dtype=np.float32)
+        for batch, input_ids, attention_mask in _length_sorted_batches(token_ids, batch_size):
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, then L2 normalization
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            output[batch] = pooled
+        return output
+
+def create_embedding_backend(name: str = Config.EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """Build the embedding backend selected in Config."""
+    if name == "onnx":
+        return OnnxEmbeddingBackend()
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend()
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+def export_onnx_model(output_dir: str = Config.ONNX_MODEL_DIR,
+                      model_name: str = Config.EMBEDDING_MODEL,
+                      quantize: bool = True):
+    """Export the transformer to ONNX and optionally add a dynamically int8-quantized copy."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hf_name = _hf_name(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(hf_name)
+    model = AutoModel.from_pretrained(hf_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    # Inputs are traced positionally, so they must follow forward()'s parameter
+    # order (input_ids, attention_mask, token_type_ids for BERT), not the tokenizer's
+    parameters = list(inspect.signature(model.forward).parameters)
+    input_names = [name for name in parameters if name in sample]
+    if input_names != parameters[:len(input_names)]:
+        raise ValueError(f"{hf_name} takes its inputs in an unsupported order: {parameters}")
+    model_path = os.path.join(output_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    logger.info("Exported %s to %s", hf_name, model_path)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.join(output_dir, "model_quantized.onnx")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info("Wrote int8 model to %s", quantized_path)
+
+def check_parity(reference: EmbeddingBackend,
+                 candidate: EmbeddingBackend,
+                 texts: List[str],
+                 queries: Optional[List[str]] = None,
+                 k: int = 5) -> Dict[str, Any]:
+    """
+    Compare two backends on the same inputs.
+
+    Reports the cosine similarity between their embeddings of each text, and
+    the average overlap of the top-k texts retrieved for each query when each
+    backend searches its own embeddings.
+    """
+    # Default queries are short prefixes of the texts, which behave like real questions
+    queries = queries or [text[:200] for text in texts[:50]]
+    ref_docs, cand_docs = reference.encode(texts), candidate.encode(texts)
+    cosines = np.sum(ref_docs * cand_docs, axis=1)
+
+    ref_scores = reference.encode(queries) @ ref_docs.T
+    cand_scores = candidate.encode(queries) @ cand_docs.T
+    k = min(k, len(texts))
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :k]
+    cand_top = np.argsort(-cand_scores, axis=1)[:, :k]
+    overlaps = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+
+    return {
+        "texts": len(texts),
+        "queries": len(queries),
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        f"top{k}_overlap": float(np.mean(overlaps)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and validate the ONNX embedding backend.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Export the model to ONNX (requires torch)")
+    export.add_argument("--output", default=Config.ONNX_MODEL_DIR)
+    export.add_argument("--no-quantize", action="store_true")
+    parity = subparsers.add_parser("parity", help="Compare the ONNX backend with sentence-transformers")
+    parity.add_argument("--samples", type=int, default=500, help="Indexed chunks to compare on")
+    parity.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx_model(args.output, quantize=not args.no_quantize)
+    else:
+        from .chunk_store import ChunkStore
+        store = ChunkStore(Config.CHUNK_STORE_DIR)
+        chunks = store.get_many(store.ids()[:args.samples])
+        texts = [chunk["content"] + " " + chunk["context"] for chunk in chunks.values()]
+        if not texts:
+            raise ValueError("The chunk store is empty; index documents first")
+        print(check_parity(SentenceTransformerBackend(), OnnxEmbeddingBackend(), texts, k=args.k))
+
+if __name__ == "__main__":
+    main()
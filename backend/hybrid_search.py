@@ -1,62 +1,192 @@
 import os
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import chromadb
-from typing import List, Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
 from .document_processor import DocumentProcessor
-from .elasticsearch_manager import ElasticSearchManager
+from .bm25_index import create_lexical_index
+from .vector_index import create_vector_index
+from .chunk_store import ChunkStore
+from .manifest import IndexManifest
+from .snapshot import export_snapshot, import_snapshot
+from .indexing_pipeline import IndexingPipeline
+from .embeddings import create_embedding_backend
+from .embedding_scheduler import EmbeddingBatcher
+from .cache import TTLCache, normalize_query
+from .metrics import stage, record_error
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for a semantic retriever that did not answer in time
+EMPTY_SEMANTIC_RESULTS = {'ids': [[]], 'distances': [[]], 'documents': [[]], 'metadatas': [[]]}
+
+def fused_scores(semantic_results: Dict,
+                 bm25_results: List[Dict],
+                 semantic_weight: float = 0.8,
+                 bm25_weight: float = 0.2) -> Dict[str, float]:
+    """Weighted reciprocal-rank score of every retrieved chunk id."""
+    scores = {}
+    
+    # Process semantic search results
+    for rank, (doc_id, score) in enumerate(zip(
+        semantic_results['ids'][0], 
+        semantic_results['distances'][0]
+    )):
+        scores[doc_id] = scores.get(doc_id, 0) + (semantic_weight / (rank + 1))
+        
+    # Process BM25 results
+    for rank, hit in enumerate(bm25_results):
+        doc_id = hit["_source"]["chunk_id"]
+        scores[doc_id] = scores.get(doc_id, 0) + (bm25_weight / (rank + 1))
+    return scores
 
 class HybridSearchSystem:
-    def __init__(self, pdf_dir: str, chroma_dir: str = "./chroma_db"):
+    def __init__(self,
+                 pdf_dir: str,
+                 chroma_dir: str = "./chroma_db",
+                 chunk_store_dir: str = "./chunk_store",
+                 concurrent_retrieval: bool = Config.CONCURRENT_RETRIEVAL,
+                 retriever_timeout: float = Config.RETRIEVER_TIMEOUT,
+                 generation_path: str = Config.INDEX_GENERATION_PATH,
+                 manifest_path: str = Config.MANIFEST_PATH,
+                 embedding_model=None,
+                 collection=None,
+                 lexical_index=None):
+        # embedding_model, collection and lexical_index override the Config-selected backends (benchmarks use this)
         self.doc_processor = DocumentProcessor()
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.chroma_client = chromadb.PersistentClient(path=chroma_dir)
-        self.collection = self.chroma_client.get_or_create_collection("documents")
-        self.es_manager = ElasticSearchManager()
+        self.embedding_model = embedding_model or create_embedding_backend()
+        # Concurrent query encodes share batched forward passes unless the window is 0
+        self.query_encoder = EmbeddingBatcher(self.embedding_model) if Config.EMBEDDING_BATCH_WINDOW_MS > 0 else None
+        # A ChromaDB collection or the memory-mapped MmapVectorIndex, per Config.VECTOR_BACKEND
+        self.collection = collection if collection is not None else create_vector_index(chroma_dir)
+        # Elasticsearch or the in-process LocalBM25Index, per Config.LEXICAL_BACKEND
+        self.es_manager = lexical_index if lexical_index is not None else create_lexical_index()
+        self.chunk_store = ChunkStore(chunk_store_dir)
+        self.manifest = IndexManifest(manifest_path, chunking=self.doc_processor.chunking)
+        self.concurrent_retrieval = concurrent_retrieval
+        self.retriever_timeout = retriever_timeout
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=Config.RETRIEVAL_POOL_WORKERS, thread_name_prefix="retrieval")
+        # Calls still running after their request stopped waiting, per retriever; they keep a pool thread
+        self._overdue = {"semantic": 0, "bm25": 0}
+        self._overdue_lock = threading.Lock()
+        # Query embeddings do not depend on the corpus, so only fused results are tied to the index generation
+        self.embedding_cache = TTLCache(Config.EMBEDDING_CACHE_SIZE, Config.EMBEDDING_CACHE_TTL, name="embedding")
+        self.result_cache = TTLCache(Config.RESULT_CACHE_SIZE, Config.RESULT_CACHE_TTL, name="result")
+        self.generation_path = generation_path
+        self._generation = 0
+        self._generation_mtime = None
         
-    def index_documents(self, pdf_dir: str):
-        """Process and index documents in both ChromaDB and Elasticsearch."""
-        print(f"Starting document processing from directory: {pdf_dir}")
+    def index_documents(self, pdf_dir: str, pdf_files: Optional[List[Path]] = None) -> Dict[str, int]:
+        """
+        Incrementally index the PDFs in pdf_dir into ChromaDB and Elasticsearch.
+
+        pdf_files restricts the index to those PDFs of pdf_dir (a shard's
+        share of the corpus); indexed files not among them count as removed.
+
+        Only files that are new or whose content hash changed since the last run
+        are processed. They are streamed through an IndexingPipeline in fixed-size
+        batches, so memory stays flat and an interrupted build resumes where it
+        stopped. Chunks of changed files that no longer exist, and all chunks of
+        deleted files, are removed from both stores. Returns counts of the files
+        and chunks added, updated and removed.
+        """
+        logger.info("Starting document processing from directory: %s", pdf_dir)
         
         # Ensure the PDF directory exists
         if not os.path.exists(pdf_dir):
             raise ValueError(f"PDF directory does not exist: {pdf_dir}")
-        
-        # Process documents
-        documents = self.doc_processor.process_documents(pdf_dir)
-        
-        if not documents:
-            raise ValueError("No documents were processed successfully")
-        
-        print(f"Successfully processed {len(documents)} document chunks")
-        
-        # Index in Elasticsearch
-        print("Indexing in Elasticsearch...")
-        self.es_manager.create_index()
-        self.es_manager.index_documents(documents)
-        print("Elasticsearch indexing complete")
-        
-        # Generate embeddings and index in ChromaDB
-        print("Generating embeddings...")
-        texts = [doc["content"] + " " + doc["context"] for doc in documents]
-        print(f"Preparing to encode {len(texts)} texts")
-        
-        embeddings = self.embedding_model.encode(
-            texts,
-            batch_size=32,
-            show_progress_bar=True
-        )
-        print(f"Generated {len(embeddings)} embeddings")
-        
-        print("Indexing in ChromaDB...")
-        self.collection.add(
-            embeddings=embeddings.tolist(),
-            documents=[doc["content"] for doc in documents],
-            metadatas=[{"source": doc["source"], "chunk_id": doc["chunk_id"]} 
-                    for doc in documents],
-            ids=[doc["chunk_id"] for doc in documents]
-        )
-        print("ChromaDB indexing complete")
+
+        if pdf_files is None:
+            pdf_files = sorted(Path(pdf_dir).glob('*.pdf'))
+        if not pdf_files and not self.manifest.files:
+            raise ValueError(f"No PDF files found in directory: {pdf_dir}")
+
+        new_files, changed_files, removed_files, hashes = self.manifest.diff(pdf_files)
+        report = {
+            "files_added": len(new_files),
+            "files_updated": len(changed_files),
+            "files_removed": len(removed_files),
+            "files_unchanged": len(pdf_files) - len(new_files) - len(changed_files),
+            "files_failed": 0,
+            "chunks_added": 0,
+            "chunks_updated": 0,
+            "chunks_removed": 0,
+        }
+        logger.info("%d new, %d changed, %d removed PDF files", len(new_files), len(changed_files), len(removed_files))
+
+        # Drop everything indexed from files that no longer exist
+        for name in removed_files:
+            stale_ids = self.manifest.chunk_ids(name)
+            self.delete_chunks(stale_ids)
+            report["chunks_removed"] += len(stale_ids)
+            self.manifest.remove(name)
+        self.flush_stores()
+        self.manifest.save()
+
+        # Stream only new and changed documents through the pipeline
+        to_process = new_files + changed_files
+        try:
+            if to_process:
+                IndexingPipeline(self).run(to_process, hashes, report)
+        finally:
+            # Even a partial build has changed the stores
+            if to_process or removed_files:
+                self._bump_index_generation()
+        if not (to_process or removed_files):
+            logger.info("Index is up to date")
+        logger.info("Indexing report: %s", report)
+        return report
+
+    def embed_chunks(self, documents: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Embed chunks for indexing.
+
+        Token-mode chunks carry their token ids and are embedded from them when
+        the backend supports it; otherwise the text is embedded, with the context
+        appended for sentence-mode chunks.
+        """
+        if hasattr(self.embedding_model, "encode_token_ids") and all("token_ids" in doc for doc in documents):
+            return self.embedding_model.encode_token_ids([doc["token_ids"] for doc in documents], batch_size=32)
+        texts = [doc["content"] if "token_ids" in doc else doc["content"] + " " + doc["context"] for doc in documents]
+        return self.embedding_model.encode(texts, batch_size=32)
+
+    def export_snapshot(self, path: str) -> Dict[str, Any]:
+        """Write the whole index (chunks, embeddings, lexical index, manifest) to one snapshot file."""
+        return export_snapshot(self, path)
+
+    def load_snapshot(self, path: str, verify: bool = True, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Replace the index with a snapshot, without re-embedding anything.
+
+        Returns the snapshot metadata, or None if this snapshot was already
+        loaded and force is not set.
+        """
+        meta = import_snapshot(self, path, verify=verify, force=force)
+        if meta is not None:
+            self._bump_index_generation()
+        return meta
+
+    def flush_stores(self):
+        """Persist pending writes in the chunk store and the lexical and vector indexes."""
+        self.chunk_store.flush()
+        self.es_manager.flush()
+        # ChromaDB persists on every call; only the mmap index buffers writes
+        if hasattr(self.collection, "flush"):
+            self.collection.flush()
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """Remove chunks from ChromaDB, Elasticsearch and the chunk store."""
+        if not chunk_ids:
+            return
+        logger.info("Removing %d stale chunks", len(chunk_ids))
+        self.collection.delete(ids=chunk_ids)
+        self.es_manager.delete_documents(chunk_ids)
+        self.chunk_store.delete(chunk_ids)
         
     def reciprocal_rank_fusion(self, 
                               semantic_results: List[Dict], 
@@ -64,57 +194,442 @@ class HybridSearchSystem:
                               semantic_weight: float = 0.8,
                               bm25_weight: float = 0.2) -> List[str]:
         """Merge results using reciprocal rank fusion with weights."""
-        scores = {}
-        
-        # Process semantic search results
-        for rank, (doc_id, score) in enumerate(zip(
-            semantic_results['ids'][0], 
-            semantic_results['distances'][0]
-        )):
-            scores[doc_id] = scores.get(doc_id, 0) + (semantic_weight / (rank + 1))
-            
-        # Process BM25 results
-        for rank, hit in enumerate(bm25_results):
-            doc_id = hit["_source"]["chunk_id"]
-            scores[doc_id] = scores.get(doc_id, 0) + (bm25_weight / (rank + 1))
-            
-        # Sort by final scores
+        scores = self._fused_scores(semantic_results, bm25_results, semantic_weight, bm25_weight)
         return sorted(scores.keys(), key=lambda x: scores[x], reverse=True)
+
+    def _fused_scores(self,
+                      semantic_results: List[Dict],
+                      bm25_results: List[Dict],
+                      semantic_weight: float = 0.8,
+                      bm25_weight: float = 0.2) -> Dict[str, float]:
+        return fused_scores(semantic_results, bm25_results, semantic_weight, bm25_weight)
     
-    # To truncate the LLM's input to a maximum number of characters
-    def _truncate_text(self, text: str, max_chars: int = 5000) -> str:
-        """Helper function to truncate text to a maximum number of characters."""
-        return text if len(text) <= max_chars else text[:max_chars] + "..."
-    
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Perform hybrid search using both semantic search and BM25."""
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode([query])
-        
-        # Get results from both systems
-        semantic_results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
-            n_results=20
-        )
-        
-        bm25_results = self.es_manager.search(query, size=20)
-        
-        # Merge results
-        merged_ids = self.reciprocal_rank_fusion(semantic_results, bm25_results)
-        
-        # Return top k results
-        final_results = []
-        for doc_id in merged_ids[:k]:
+    def fetch_chunks(self,
+                     ids: List[str],
+                     semantic_results: Optional[Dict] = None,
+                     bm25_results: Optional[List[Dict]] = None) -> Dict[str, Dict[str, Any]]:
+        """Resolve chunk ids to content with at most one batched ChromaDB lookup."""
+        chunks = self.chunk_store.get_many(ids, semantic_results, bm25_results)
+        missing = [doc_id for doc_id in ids if doc_id not in chunks]
+        if missing:
+            # Chunks indexed before the chunk store existed only live in ChromaDB
             chroma_result = self.collection.get(
-                ids=[doc_id],
+                ids=missing,
                 include=['documents', 'metadatas']
             )
-            # truncated_content = self._truncate_text(chroma_result['documents'][0], max_chars=2000)
+            for doc_id, document, metadata in zip(
+                chroma_result['ids'],
+                chroma_result['documents'],
+                chroma_result['metadatas']
+            ):
+                chunks[doc_id] = {
+                    'chunk_id': doc_id,
+                    'source': metadata['source'],
+                    'content': document,
+                    'context': ''
+                }
+        return chunks
+
+    def _semantic_search(self, query_embedding: np.ndarray, n_results: int = 20) -> Dict:
+        """Query ChromaDB with a precomputed query embedding."""
+        with stage("semantic_search"):
+            return self.collection.query(
+                query_embeddings=query_embedding.tolist(),
+                n_results=n_results
+            )
+
+    def _bm25_search(self, query: str, size: int = 20) -> List[Dict]:
+        """
+        Query Elasticsearch, letting it return partial hits just inside our own deadline.
+
+        With concurrent retrieval the client call is also bounded by
+        retriever_timeout, so a request we stopped waiting for gives its
+        pool thread back instead of running to ES_REQUEST_TIMEOUT.
+        """
+        es_timeout = f"{int(self.retriever_timeout * 800)}ms" if self.concurrent_retrieval else None
+        request_timeout = self.retriever_timeout if self.concurrent_retrieval else None
+        with stage("bm25_search"):
+            return self.es_manager.search(query, size=size, timeout=es_timeout, request_timeout=request_timeout)
+
+    def _submit_retrievals(self, query: str, query_embedding: np.ndarray, n_results: int) -> Dict[str, Future]:
+        """
+        Start both retrievers on the retrieval pool.
+
+        A thread cannot be cancelled once it runs, so a call that outlives its
+        deadline keeps its pool thread until the store answers. A retriever
+        with RETRIEVER_MAX_OVERDUE such calls still running is skipped, as if it
+        had timed out, until some finish. A hung ChromaDB, which has no client
+        timeout, therefore holds only a few threads and leaves the rest of the
+        pool to the other retriever.
+        """
+        calls = {
+            "semantic": (self._semantic_search, query_embedding, n_results),
+            "bm25": (self._bm25_search, query, n_results),
+        }
+        futures = {}
+        for name, (fn, *args) in calls.items():
+            with self._overdue_lock:
+                skip = self._overdue[name] >= Config.RETRIEVER_MAX_OVERDUE
+            if skip:
+                record_error(f"{name}_skipped")
+                logger.warning("Skipping %s retriever: %d earlier calls are still running", name, self._overdue[name])
+            else:
+                futures[name] = self._retrieval_pool.submit(fn, *args)
+        return futures
+
+    def _mark_overdue(self, name: str, future: Future):
+        """Count a call nobody waits for any more until it finishes."""
+        record_error(f"{name}_timeout")
+        logger.warning("%s retriever timed out after %ss", name, self.retriever_timeout)
+        with self._overdue_lock:
+            self._overdue[name] += 1
+
+        def finished(_):
+            with self._overdue_lock:
+                self._overdue[name] -= 1
+
+        future.add_done_callback(finished)
+
+    def _retrieve_concurrently(self, query: str, query_embedding: np.ndarray,
+                               n_results: int = 20) -> Tuple[Dict, List[Dict], bool]:
+        """Fan out to ChromaDB and Elasticsearch on the retrieval pool, waiting at most retriever_timeout."""
+        futures = self._submit_retrievals(query, query_embedding, n_results)
+        wait(futures.values(), timeout=self.retriever_timeout)
+
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                self._mark_overdue(name, future)
+            elif future.exception() is not None:
+                logger.warning("%s retriever failed: %s", name, future.exception())
+            else:
+                results[name] = future.result()
+        return self._collect_retrievals(results)
+
+    async def _aretrieve_concurrently(self, query: str, query_embedding: np.ndarray) -> Tuple[Dict, List[Dict], bool]:
+        """Asyncio counterpart of _retrieve_concurrently."""
+        futures = self._submit_retrievals(query, query_embedding, 20)
+        waiters = [asyncio.wrap_future(future) for future in futures.values()]
+        if waiters:
+            await asyncio.wait(waiters, timeout=self.retriever_timeout)
+        for waiter in waiters:
+            # Errors are read from the futures below; mark them seen so asyncio does not log them
+            waiter.add_done_callback(lambda w: w.cancelled() or w.exception())
+
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                self._mark_overdue(name, future)
+            elif future.exception() is not None:
+                logger.warning("%s retriever failed: %s", name, future.exception())
+            else:
+                results[name] = future.result()
+        return self._collect_retrievals(results)
+
+    def _collect_retrievals(self, results: Dict[str, Any]) -> Tuple[Dict, List[Dict], bool]:
+        """Substitute empty results for retrievers that did not answer and flag whether both did."""
+        if not results:
+            raise RuntimeError("All retrievers failed")
+        semantic_results = results.get("semantic", EMPTY_SEMANTIC_RESULTS)
+        bm25_results = results.get("bm25", [])
+        return semantic_results, bm25_results, len(results) == 2
+
+    def _build_results(self,
+                       semantic_results: Dict,
+                       bm25_results: List[Dict],
+                       k: int) -> List[Dict[str, Any]]:
+        """Fuse both result lists and resolve the top k chunks."""
+        # Merge results
+        with stage("fusion"):
+            scores = self._fused_scores(semantic_results, bm25_results)
+            merged_ids = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)
+
+        # Remember which retrievers returned each chunk
+        found_by = {doc_id: ["semantic"] for doc_id in semantic_results['ids'][0]}
+        for hit in bm25_results:
+            found_by.setdefault(hit["_source"]["chunk_id"], []).append("bm25")
+
+        # Return top k results, resolving their text in one batch
+        top_ids = merged_ids[:k]
+        with stage("fetch_chunks"):
+            chunks = self.fetch_chunks(top_ids, semantic_results, bm25_results)
+
+        final_results = []
+        for doc_id in top_ids:
+            if doc_id not in chunks:
+                continue
+            # Prompt size is enforced later by the ContextBuilder, which uses the fused score
             final_results.append({
-                # 'content': truncated_content,
-                'content': chroma_result['documents'][0],
-                'source': chroma_result['metadatas'][0]['source'],
-                'chunk_id': doc_id
+                'content': chunks[doc_id]['content'],
+                'source': chunks[doc_id]['source'],
+                'chunk_id': doc_id,
+                'score': scores[doc_id],
+                'retrievers': found_by[doc_id]
             })
             
-        return final_results
\ No newline at end of file
+        return final_results
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encode a query, reusing cached embeddings for repeated questions."""
+        key = normalize_query(query)
+        query_embedding = self.embedding_cache.get(key)
+        if query_embedding is None:
+            with stage("query_encode"):
+                if self.query_encoder is not None:
+                    query_embedding = self.query_encoder.encode([query])
+                else:
+                    query_embedding = self.embedding_model.encode([query])
+            self.embedding_cache.put(key, query_embedding)
+        return query_embedding
+
+    def _cached_results(self, query: str, k: int) -> Tuple[Tuple[str, int], int, Optional[List[Dict[str, Any]]]]:
+        """Look up fused results for this query in the current index generation."""
+        key = (normalize_query(query), k)
+        generation = self.index_generation
+        cached = self.result_cache.get(key, generation)
+        if cached is not None:
+            cached = [dict(res) for res in cached]
+        return key, generation, cached
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Perform hybrid search using both semantic search and BM25.
+
+        With concurrent retrieval enabled both stores are queried in parallel and a
+        retriever that errors or misses its deadline is dropped, so the answer is
+        built from whichever side responded. Each result lists the retrievers that
+        returned it under 'retrievers'. Complete results are cached per index
+        generation; degraded ones are not.
+        """
+        key, generation, cached = self._cached_results(query, k)
+        if cached is not None:
+            return cached
+
+        # Generate query embedding
+        query_embedding = self._encode_query(query)
+        
+        # Get results from both systems
+        if self.concurrent_retrieval:
+            semantic_results, bm25_results, complete = self._retrieve_concurrently(query, query_embedding)
+        else:
+            semantic_results = self._semantic_search(query_embedding)
+            bm25_results = self._bm25_search(query)
+            complete = True
+
+        final_results = self._build_results(semantic_results, bm25_results, k)
+        if complete:
+            self.result_cache.put(key, [dict(res) for res in final_results], generation)
+        return final_results
+
+    async def asearch(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Asyncio variant of search that never blocks the event loop."""
+        key, generation, cached = self._cached_results(query, k)
+        if cached is not None:
+            return cached
+
+        embedding_key = normalize_query(query)
+        query_embedding = self.embedding_cache.get(embedding_key)
+        if query_embedding is None:
+            with stage("query_encode"):
+                if self.query_encoder is not None:
+                    query_embedding = await self.query_encoder.aencode(query)
+                else:
+                    query_embedding = await asyncio.to_thread(self.embedding_model.encode, [query])
+            self.embedding_cache.put(embedding_key, query_embedding)
+        semantic_results, bm25_results, complete = await self._aretrieve_concurrently(query, query_embedding)
+        final_results = await asyncio.to_thread(self._build_results, semantic_results, bm25_results, k)
+        if complete:
+            self.result_cache.put(key, [dict(res) for res in final_results], generation)
+        return final_results
+
+    def search_many(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Hybrid search for a batch of queries, returning the results of each in order.
+
+        Uncached queries are encoded in one batched pass. Both stores are then
+        queried once for all of them: a multi-query collection.query and a
+        lexical search_many (an Elasticsearch msearch). Each query is fused on
+        its own. There is no per-retriever deadline, since batches are not
+        latency-bound. A retriever that fails is dropped for the whole batch,
+        as in search, and those results are not cached.
+        """
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        pending = []  # (position, cache key, generation) of queries not answered from the cache
+        for i, query in enumerate(queries):
+            key, generation, cached = self._cached_results(query, k)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append((i, key, generation))
+        if not pending:
+            return results
+
+        pending_queries = [queries[i] for i, _, _ in pending]
+        query_embeddings = self._encode_queries(pending_queries)
+        retrieved, complete = self._retrieve_many(pending_queries, query_embeddings)
+        for (i, key, generation), (semantic_results, bm25_results) in zip(pending, retrieved):
+            results[i] = self._build_results(semantic_results, bm25_results, k)
+            if complete:
+                self.result_cache.put(key, [dict(res) for res in results[i]], generation)
+        return results
+
+    def _retrieve_many(self, queries: List[str], query_embeddings: np.ndarray,
+                       n_results: int = 20) -> Tuple[List[Tuple[Dict, List[Dict]]], bool]:
+        """
+        Query both stores once for a batch, returning each query's (semantic, bm25) results.
+
+        A retriever that fails is dropped for the whole batch; the flag tells
+        whether both answered.
+        """
+        futures = {
+            "semantic": self._retrieval_pool.submit(self._semantic_search_many, query_embeddings, n_results),
+            "bm25": self._retrieval_pool.submit(self._bm25_search_many, queries, n_results),
+        }
+        retrieved = {}
+        for name, future in futures.items():
+            try:
+                retrieved[name] = future.result()
+            except Exception as e:
+                logger.warning("%s retriever failed for a batch of %d queries: %s", name, len(queries), e)
+        if not retrieved:
+            raise RuntimeError("All retrievers failed")
+
+        per_query = []
+        for row in range(len(queries)):
+            semantic_results = EMPTY_SEMANTIC_RESULTS
+            if "semantic" in retrieved:
+                semantic_results = {field: [retrieved["semantic"][field][row]] for field in EMPTY_SEMANTIC_RESULTS}
+            bm25_results = retrieved["bm25"][row] if "bm25" in retrieved else []
+            per_query.append((semantic_results, bm25_results))
+        return per_query, len(retrieved) == 2
+
+    def retrieve(self, queries: List[str], query_embeddings: np.ndarray, n_results: int = 20) -> Dict[str, Any]:
+        """
+        Unfused candidates for queries embedded elsewhere, as a shard answers a ShardedSearchSystem.
+
+        For each query: the semantic (chunk id, distance) and BM25 (chunk id,
+        score) lists, best first, and the content and source of every
+        candidate. A single query gets the per-retriever deadline of search;
+        'complete' is false if a retriever was dropped.
+        """
+        if len(queries) == 1 and self.concurrent_retrieval:
+            semantic_results, bm25_results, complete = self._retrieve_concurrently(queries[0], query_embeddings, n_results)
+            retrieved = [(semantic_results, bm25_results)]
+        else:
+            retrieved, complete = self._retrieve_many(queries, query_embeddings, n_results)
+
+        candidates = []
+        for semantic_results, bm25_results in retrieved:
+            ids = list(dict.fromkeys(semantic_results['ids'][0] + [hit["_source"]["chunk_id"] for hit in bm25_results]))
+            with stage("fetch_chunks"):
+                chunks = self.fetch_chunks(ids, semantic_results, bm25_results)
+            candidates.append({
+                "semantic": [[doc_id, distance] for doc_id, distance
+                             in zip(semantic_results['ids'][0], semantic_results['distances'][0])],
+                "bm25": [[hit["_source"]["chunk_id"], hit["_score"]] for hit in bm25_results],
+                "chunks": {doc_id: {"content": chunk["content"], "source": chunk["source"]}
+                           for doc_id, chunk in chunks.items()},
+            })
+        return {"candidates": candidates, "complete": complete, "index_generation": self.index_generation}
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode queries in one batched pass, reusing cached embeddings."""
+        keys = [normalize_query(query) for query in queries]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            with stage("query_encode"):
+                encoded = self.embedding_model.encode([queries[i] for i in missing],
+                                                      batch_size=Config.EMBEDDING_MAX_BATCH_SIZE)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding[None, :]
+                self.embedding_cache.put(keys[i], embeddings[i])
+        return np.concatenate(embeddings)
+
+    def _semantic_search_many(self, query_embeddings: np.ndarray, n_results: int = 20) -> Dict:
+        with stage("semantic_search"):
+            return self.collection.query(
+                query_embeddings=query_embeddings.tolist(),
+                n_results=n_results
+            )
+
+    def _bm25_search_many(self, queries: List[str], size: int = 20) -> List[List[Dict]]:
+        with stage("bm25_search"):
+            return self.es_manager.search_many(queries, size=size)
+
+    async def asearch_many(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """search_many on a worker thread, so the event loop is never blocked."""
+        return await asyncio.to_thread(self.search_many, queries, k)
+
+    @property
+    def index_generation(self) -> int:
+        """
+        Version of the indexed corpus, bumped by every index_documents run.
+
+        It lives in a file rather than in memory so a server picks up rebuilds
+        made by a separate indexing process (backend/main.py).
+        """
+        try:
+            mtime = os.stat(self.generation_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        if mtime != self._generation_mtime:
+            with open(self.generation_path) as f:
+                self._generation = int(f.read().strip() or 0)
+            self._generation_mtime = mtime
+        return self._generation
+
+    def _bump_index_generation(self):
+        """Mark the corpus as changed so cached results from earlier generations are ignored."""
+        generation = self.index_generation + 1
+        tmp_path = self.generation_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, self.generation_path)
+        self.result_cache.clear()
+
+    def warmup(self, query: str = "What is covered in this bootcamp?") -> Dict[str, float]:
+        """
+        Run one encode and one query against each store, bypassing the caches.
+
+        The first forward pass and the first store queries pay for lazy
+        initialization (kernel selection, memory maps, connection setup), so
+        doing them here keeps that cost off the first user request. Raises if
+        the model or either store is unusable. Returns the time each step took in ms.
+        """
+        timings = {}
+        started = time.perf_counter()
+        query_embedding = self.embedding_model.encode([query])
+        # A second, batched encode exercises the shapes real traffic uses
+        self.embedding_model.encode([query, query + " " + query], batch_size=2)
+        timings["encode_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        self._semantic_search(query_embedding, n_results=5)
+        timings["semantic_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if not self.es_manager.ping():
+            raise RuntimeError("Lexical index is not reachable")
+        self.es_manager.search(query, size=5)
+        timings["bm25_ms"] = (time.perf_counter() - started) * 1000
+        return timings
+
+    def ping(self) -> bool:
+        return self.es_manager.ping()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.es_manager.pool_stats()
+
+    def embedding_stats(self) -> Dict[str, Any]:
+        if self.query_encoder is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_encoder.stats()}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counts for both cache tiers."""
+        return {
+            "index_generation": self.index_generation,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+        }
@@ -0,0 +1,224 @@
+import time
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # End-of-stream marker passed between stages
+
+class _FileDone:
+    """Marker that follows the last chunk of a file through the pipeline."""
+
+    def __init__(self, name: str, chunk_ids: List[str], error: Optional[str]):
+        self.name = name
+        self.chunk_ids = chunk_ids
+        self.error = error
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+class IndexingPipeline:
+    """
+    Streaming extract -> chunk -> embed -> write pipeline with bounded memory.
+
+    PDFs are chunked by the DocumentProcessor, embedded in fixed-size batches on
+    one thread and written to Elasticsearch, ChromaDB and the chunk store in the
+    same batches on another. The queues between stages are bounded, so only a
+    few batches are held in memory however large the corpus is.
+
+    The index manifest doubles as the checkpoint. Before a batch is written, its
+    files are recorded with no hash and every chunk id that may now exist.
+    Files whose last batch has landed are checkpointed every checkpoint_batches
+    batches or checkpoint_seconds, and once at the end: the stores are flushed,
+    then the files are recorded with their hashes. Flushing rewrites the
+    stores' indexes, so checkpointing per file would cost O(files x corpus). A
+    build that is interrupted resumes with only the files not yet
+    checkpointed, and their partial chunks are cleaned up as stale.
+    """
+
+    def __init__(self,
+                 search_system,
+                 batch_size: int = Config.INDEX_BATCH_SIZE,
+                 queue_batches: int = Config.INDEX_QUEUE_BATCHES,
+                 checkpoint_batches: int = Config.INDEX_CHECKPOINT_BATCHES,
+                 checkpoint_seconds: float = Config.INDEX_CHECKPOINT_SECONDS):
+        self.search_system = search_system
+        self.manifest = search_system.manifest
+        self.batch_size = batch_size
+        self.queue_batches = queue_batches
+        self.checkpoint_batches = checkpoint_batches
+        self.checkpoint_seconds = checkpoint_seconds
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def _put(self, q: queue.Queue, item: Any):
+        """Blocking put that gives up if another stage has failed."""
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue) -> Any:
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _run_stage(self, target, *args):
+        try:
+            target(*args)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+
+    def _produce(self, pdf_files: List[Path], chunk_queue: queue.Queue):
+        """Stage 1: extract and chunk PDFs, emitting chunks followed by a per-file marker."""
+        for pdf_file, documents, error in self.search_system.doc_processor.iter_files(pdf_files):
+            for doc in documents:
+                self._put(chunk_queue, doc)
+            self._put(chunk_queue, _FileDone(pdf_file.name, [doc["chunk_id"] for doc in documents], error))
+        self._put(chunk_queue, _DONE)
+
+    def _embed(self, chunk_queue: queue.Queue, batch_queue: queue.Queue):
+        """Stage 2: group chunks into fixed-size batches and embed each batch."""
+        batch: List[Dict[str, Any]] = []
+        finished: List[_FileDone] = []  # Files whose last chunk is in or before the current batch
+
+        def emit():
+            embeddings = None
+            if batch:
+                embeddings = self.search_system.embed_chunks(batch)
+            self._put(batch_queue, (list(batch), embeddings, list(finished)))
+            batch.clear()
+            finished.clear()
+
+        while True:
+            item = self._get(chunk_queue)
+            if item is _DONE:
+                break
+            if isinstance(item, _FileDone):
+                finished.append(item)
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                emit()
+        if batch or finished:
+            emit()
+        self._put(batch_queue, _DONE)
+
+    def _write(self, batch_queue: queue.Queue, hashes: Dict[str, str], report: Dict[str, int]):
+        """Stage 3: write each batch to all stores, checkpointing finished files now and then."""
+        original_ids = {}  # Chunk ids each file had before this run
+        pending: List[_FileDone] = []  # Finished files not yet checkpointed
+        batches_since_checkpoint = 0
+        last_checkpoint = time.monotonic()
+        es_ready = False
+        while True:
+            item = self._get(batch_queue)
+            if item is _DONE:
+                break
+            documents, embeddings, finished = item
+
+            if documents:
+                # Write-ahead: record every id that may exist before touching the stores
+                for doc in documents:
+                    name = doc["source"]
+                    if name not in original_ids:
+                        original_ids[name] = self.manifest.chunk_ids(name)
+                        self.manifest.record(name, None, list(original_ids[name]))
+                    entry_ids = self.manifest.chunk_ids(name)
+                    if doc["chunk_id"] not in entry_ids:
+                        entry_ids.append(doc["chunk_id"])
+                self.manifest.save()
+
+                if not es_ready:
+                    self.search_system.es_manager.create_index()
+                    es_ready = True
+                self.search_system.es_manager.index_documents(documents)
+                self.search_system.collection.upsert(
+                    embeddings=embeddings.tolist(),
+                    documents=[doc["content"] for doc in documents],
+                    metadatas=[{"source": doc["source"], "chunk_id": doc["chunk_id"]}
+                            for doc in documents],
+                    ids=[doc["chunk_id"] for doc in documents]
+                )
+                self.search_system.chunk_store.put_many(documents)
+                logger.info("Indexed batch of %d chunks", len(documents))
+
+            pending.extend(finished)
+            batches_since_checkpoint += 1
+            if pending and (batches_since_checkpoint >= self.checkpoint_batches
+                            or time.monotonic() - last_checkpoint >= self.checkpoint_seconds):
+                self._checkpoint(pending, original_ids, hashes, report)
+                batches_since_checkpoint = 0
+                last_checkpoint = time.monotonic()
+        self._checkpoint(pending, original_ids, hashes, report)
+
+    def _checkpoint(self,
+                    pending: List[_FileDone],
+                    original_ids: Dict[str, List[str]],
+                    hashes: Dict[str, str],
+                    report: Dict[str, int]):
+        """Flush the stores, then record the finished files as complete."""
+        if not pending:
+            return
+        for done in pending:
+            self._finish_file(done, original_ids, hashes, report)
+        self.search_system.flush_stores()
+        self.manifest.save()
+        logger.info("Checkpointed %d finished files", len(pending))
+        pending.clear()
+
+    def _finish_file(self,
+                     done: _FileDone,
+                     original_ids: Dict[str, List[str]],
+                     hashes: Dict[str, str],
+                     report: Dict[str, int]):
+        """Remove chunks a file no longer produces and record it as complete."""
+        if done.error is not None:
+            # Nothing was written for this file; keep its previous chunks for the next run
+            report["files_failed"] += 1
+            return
+        old_ids = original_ids.get(done.name, self.manifest.chunk_ids(done.name))
+        new_ids = set(done.chunk_ids)
+        # A file resumed from an interrupted run may list ids of a partial write here too
+        stale_ids = [chunk_id for chunk_id in self.manifest.chunk_ids(done.name) if chunk_id not in new_ids]
+        if stale_ids:
+            self.search_system.delete_chunks(stale_ids)
+        report["chunks_updated"] += len(new_ids & set(old_ids))
+        report["chunks_added"] += len(new_ids - set(old_ids))
+        report["chunks_removed"] += len(stale_ids)
+        self.manifest.record(done.name, hashes[done.name], done.chunk_ids)
+
+    def run(self, pdf_files: List[Path], hashes: Dict[str, str], report: Dict[str, int]):
+        """Stream pdf_files through the pipeline, updating report in place."""
+        chunk_queue = queue.Queue(maxsize=self.batch_size * self.queue_batches)
+        batch_queue = queue.Queue(maxsize=self.queue_batches)
+        stages = [
+            threading.Thread(target=self._run_stage, args=(self._produce, pdf_files, chunk_queue),
+                             name="index-extract", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._embed, chunk_queue, batch_queue),
+                             name="index-embed", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        self._run_stage(self._write, batch_queue, hashes, report)
+        if self._errors:
+            self._abort.set()
+        for stage in stages:
+            stage.join()
+        if self._errors:
+            raise self._errors[0]
@@ -1,25 +1,96 @@
 import os
+import time
+import logging
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
-from typing import List, Dict, Optional
-from .config import config
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
+from .config import config, Config
+from .retry import RetryPolicy
+from .metrics import stage, observe_stage, record_error, record_tokens
 import httpx
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def openai_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+def openai_timeout() -> httpx.Timeout:
+    # The read timeout applies between received bytes, so it bounds stalls rather than stream length
+    return httpx.Timeout(Config.OPENAI_READ_TIMEOUT, connect=Config.OPENAI_CONNECT_TIMEOUT)
+
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """Connection failures, timeouts, rate limits and 5xx responses are worth retrying."""
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+def pool_stats(http_client) -> Dict[str, int]:
+    """Connection counts read from httpx's underlying httpcore pool."""
+    pool = getattr(http_client._transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle,
+        "requests": len(getattr(pool, "_requests", [])),  # In flight or waiting for a connection
+        "max_connections": Config.OPENAI_MAX_CONNECTIONS,
+    }
+
 class CustomHTTPClient(httpx.Client):
     def __init__(self, *args, **kwargs):
         kwargs.pop("proxies", None)  # Remove the 'proxies' argument if present
+        kwargs.setdefault("limits", openai_limits())
+        kwargs.setdefault("timeout", openai_timeout())
+        super().__init__(*args, **kwargs)
+
+class CustomAsyncHTTPClient(httpx.AsyncClient):
+    def __init__(self, *args, **kwargs):
+        kwargs.pop("proxies", None)  # Remove the 'proxies' argument if present
+        kwargs.setdefault("limits", openai_limits())
+        kwargs.setdefault("timeout", openai_timeout())
         super().__init__(*args, **kwargs)
 
 class OpenAIClient:
     def __init__(self, api_key: str, model: str = "o1-mini-2024-09-12"):
         self.api_key = api_key
         self.model = model
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=CustomHTTPClient())
+        # One pooled keep-alive client per mode, shared by every request
+        self.http_client = CustomHTTPClient()
+        self.async_http_client = CustomAsyncHTTPClient()
+        # Retries are done by self.retry_policy (jittered backoff) rather than the SDK
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=Config.OPENAI_BASE_URL, http_client=self.http_client,
+                             timeout=openai_timeout(), max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=Config.OPENAI_BASE_URL, http_client=self.async_http_client,
+                                        timeout=openai_timeout(), max_retries=0)
+        self.retry_policy = RetryPolicy(is_retryable_openai_error)
         # openai.api_key = self.api_key
 
+    def _record_usage(self, usage):
+        if usage is not None:
+            record_tokens("prompt", usage.prompt_tokens)
+            record_tokens("completion", usage.completion_tokens)
+            logger.debug("LLM usage: %s prompt, %s completion tokens", usage.prompt_tokens, usage.completion_tokens)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "async_pool": pool_stats(self.async_http_client),
+            "sync_pool": pool_stats(self.http_client),
+            "retries": self.retry_policy.stats(),
+        }
+
+    def _build_messages(self, system_prompt: str, user_input: str, context: str, history: str = "") -> List[Dict[str, str]]:
+        """Combine system prompt, context, conversation history, and user input into a single user message."""
+        conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+        return [
+            {"role": "user", "content": f"{system_prompt}\n\n{context}\n\n{conversation}Question: {user_input}"},
+        ]
+
     def generate_response(
         self,
         system_prompt: str,
@@ -27,6 +98,7 @@ class OpenAIClient:
         context: str,
         temperature: float = 0.2,
         max_tokens: int = 2000,
+        history: str = "",
     ) -> Optional[str]:
         """
         Generate a response using OpenAI's o1-mini API.
@@ -37,26 +109,129 @@ class OpenAIClient:
             context (str): The retrieved context from the RAG system.
             temperature (float): Sampling temperature for creativity control.
             max_tokens (int): Maximum tokens to generate.
+            history (str): Earlier conversation, as rendered by a Session.
         
         Returns:
             Optional[str]: The generated response or None if an error occurs.
         """
         try:
             # Combine system prompt, context, and user input
-            messages = [
-                {"role": "user", "content": f"{system_prompt}\n\n{context}\n\nQuestion: {user_input}"},
-            ]
+            messages = self._build_messages(system_prompt, user_input, context, history)
 
             # Call OpenAI API
-            response = self.client.chat.completions.create(
+            response = self.retry_policy.call(
+                self.client.chat.completions.create,
                 model=self.model,
                 messages=messages,
                 max_completion_tokens=max_tokens,
             )
-            print(response)
+            self._record_usage(response.usage)
             # Extract and return the generated response
             return response.choices[0].message.content.strip()
 
         except Exception as e:
-            print(f"Error generating response: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error generating response: %s", e)
+            return None
+
+    async def agenerate_response(
+        self,
+        system_prompt: str,
+        user_input: str,
+        context: str,
+        temperature: float = 0.2,
+        max_tokens: int = 2000,
+        history: str = "",
+    ) -> Optional[str]:
+        """
+        Async variant of generate_response that does not hold a worker thread.
+
+        Transient errors are retried with backoff. Errors that remain are
+        raised, so the API can tell an upstream timeout from other failures.
+
+        Returns:
+            Optional[str]: The generated response, or None if it was empty.
+        """
+        with stage("llm"):
+            response = await self.retry_policy.acall(
+                self.async_client.chat.completions.create,
+                model=self.model,
+                messages=self._build_messages(system_prompt, user_input, context, history),
+                max_completion_tokens=max_tokens,
+            )
+        self._record_usage(response.usage)
+        return (response.choices[0].message.content or "").strip() or None
+
+    async def stream_response(
+        self,
+        system_prompt: str,
+        user_input: str,
+        context: str,
+        max_tokens: int = 2000,
+        history: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Stream the completion, yielding text deltas as the API produces them.
+
+        Unlike generate_response, errors are raised to the caller so a stream
+        that has already started can report the failure to its client. Only
+        opening the stream is retried; a stream that fails part way is not.
+        """
+        # Timed by hand: a stage() span held open across yields would stay the
+        # current OTel context of whatever code the consumer runs in between
+        started = time.perf_counter()
+        first_token = True
+        try:
+            stream = await self.retry_policy.acall(
+                self.async_client.chat.completions.create,
+                model=self.model,
+                messages=self._build_messages(system_prompt, user_input, context, history),
+                max_completion_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    # Sent as a final chunk with no choices
+                    self._record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        observe_stage("llm_first_token", time.perf_counter() - started)
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            # Not GeneratorExit or CancelledError: a consumer closing the stream early is not a failure
+            record_error("llm_stream")
+            raise
+        finally:
+            observe_stage("llm_stream", time.perf_counter() - started)
+
+    async def asummarize(self, previous_summary: str, turns: List[Tuple[str, str]], max_tokens: int = 1000) -> Optional[str]:
+        """
+        Fold conversation turns into a running summary.
+
+        Only the previous summary and the new turns are sent, so the cost of a
+        call does not grow with the length of the conversation.
+
+        Returns:
+            Optional[str]: The updated summary or None if an error occurs.
+        """
+        transcript = "\n".join(f"User: {user_msg}\nAssistant: {bot_msg}" for user_msg, bot_msg in turns)
+        prompt = (
+            "Update the summary of a conversation between a user and an assistant. "
+            "Keep the facts, names and open questions a later answer may depend on, in at most 150 words.\n\n"
+            f"Current summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+        )
+        try:
+            with stage("llm_summarize"):
+                response = await self.retry_policy.acall(
+                    self.async_client.chat.completions.create,
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_completion_tokens=max_tokens,
+                )
+            self._record_usage(response.usage)
+            return response.choices[0].message.content.strip() or None
+
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e)
+            return None
@@ -1,7 +1,10 @@
+import logging
 from hybrid_search import HybridSearchSystem
 from config import Config
 
 def main():
+    # Indexing progress is logged by the backend modules
+    logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     # Configuration
     PDF_DIR = Config.PDF_DIR
     CHROMA_DIR = Config.CHROMA_DIR
@@ -9,16 +12,16 @@ def main():
     print("Starting initialization...")
     try:
         # Initialize system
-        system = HybridSearchSystem(PDF_DIR, CHROMA_DIR)
+        system = HybridSearchSystem(PDF_DIR, CHROMA_DIR, Config.CHUNK_STORE_DIR)
         print("System initialized successfully")
         
-        print("Checking Elasticsearch connection...")
-        if not system.es_manager.es.ping():
+        print(f"Checking {Config.LEXICAL_BACKEND} lexical index...")
+        if not system.es_manager.ping():
             raise Exception("Cannot connect to Elasticsearch")
-        print("Elasticsearch connection successful")
+        print("Lexical index ready")
         
         print("Starting document indexing...")
-        # Index documents (run only once)
+        # Index new or changed documents (safe to re-run)
         system.index_documents(PDF_DIR)
         print("Document indexing completed")
         
@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+
+class IndexManifest:
+    """
+    Persisted record of the indexed PDFs: content hash, chunking settings and chunk ids per file.
+
+    A file chunked under settings other than `chunking` counts as changed, so
+    switching chunk mode or size re-chunks the corpus on the next run.
+    """
+
+    def __init__(self, path: str = "./index_manifest.json", chunking: Optional[str] = None):
+        self.path = path
+        self.chunking = chunking
+        self.files: Dict[str, Dict[str, Any]] = {}  # file name -> {"sha256": ..., "chunking": ..., "chunk_ids": [...]}
+        self.snapshot: Optional[str] = None  # Id of the snapshot the index was last loaded from
+        self.load()
+
+    def load(self):
+        """Read the manifest from disk again, e.g. after another process has written it."""
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.snapshot = data.get("snapshot")
+
+    @staticmethod
+    def file_hash(path: Path) -> str:
+        """SHA-256 of a file's contents, read in blocks."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def diff(self, pdf_files: List[Path]) -> Tuple[List[Path], List[Path], List[str], Dict[str, str]]:
+        """
+        Compare the PDFs on disk with the manifest.
+
+        Returns the new files, the changed files, the names of files that have
+        been removed since the last run, and the current hash of every file.
+        """
+        hashes = {pdf_file.name: self.file_hash(pdf_file) for pdf_file in pdf_files}
+        new_files = [p for p in pdf_files if p.name not in self.files]
+        changed_files = [
+            p for p in pdf_files
+            if p.name in self.files and (self.files[p.name]["sha256"] != hashes[p.name]
+                                         or self.files[p.name].get("chunking") != self.chunking)
+        ]
+        removed = [name for name in self.files if name not in hashes]
+        return new_files, changed_files, removed, hashes
+
+    def chunk_ids(self, name: str) -> List[str]:
+        return self.files.get(name, {}).get("chunk_ids", [])
+
+    def record(self, name: str, sha256: str, chunk_ids: List[str]):
+        self.files[name] = {"sha256": sha256, "chunking": self.chunking, "chunk_ids": chunk_ids}
+
+    def remove(self, name: str):
+        self.files.pop(name, None)
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run never leaves it half written."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "snapshot": self.snapshot, "files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
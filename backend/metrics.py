@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+from prometheus_client import Counter, Gauge, Histogram
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Fine buckets at the low end for in-process stages, coarse ones for LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of answering a request",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "rag_request_duration_seconds",
+    "End-to-end request time, including streamed bodies",
+    ["route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge("rag_requests_in_flight", "Requests being handled, including open streams")
+ERRORS = Counter("rag_stage_errors_total", "Errors raised by each stage", ["stage"])
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"])
+TOKENS = Counter("rag_tokens_total", "Tokens sent to and received from the LLM", ["kind"])
+COALESCED = Counter("rag_coalesced_requests_total", "Calls that joined an identical call already in flight", ["flight"])
+ADMISSION_ACTIVE = Gauge("rag_admission_active", "Requests holding a slot in each admission stage", ["stage"])
+ADMISSION_QUEUE = Gauge("rag_admission_queue_depth", "Requests waiting for a slot in each admission stage", ["stage"])
+ADMISSION_SHED = Counter("rag_admission_shed_total", "Requests turned away by each admission stage", ["stage", "reason"])
+# Upper bounds of the embedding batch-size buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size",
+    "Query texts encoded per batched forward pass of the embedding batcher",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+EMBEDDING_QUEUE_WAIT = Histogram(
+    "rag_embedding_queue_wait_seconds",
+    "Time a query text waits in the embedding batcher before its batch is encoded",
+    buckets=LATENCY_BUCKETS,
+)
+
+_tracer = None
+
+def setup_tracing(app):
+    """
+    Emit OpenTelemetry spans for requests and stages when Config.OTEL_ENABLED is set.
+
+    Spans go to the OTLP endpoint from the standard OTEL_EXPORTER_OTLP_*
+    variables. Tracing is skipped with a warning if the packages are missing.
+    """
+    global _tracer
+    if not Config.OTEL_ENABLED:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    except ImportError as e:
+        logger.warning("OpenTelemetry is enabled but not installed (%s); tracing is off", e)
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": Config.OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,healthz,readyz")
+    _tracer = trace.get_tracer("backend")
+    logger.info("OpenTelemetry tracing enabled")
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block into rag_stage_duration_seconds, count its errors and wrap it in a span if tracing."""
+    started = time.perf_counter()
+    span = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if span is not None:
+        span.__enter__()
+    try:
+        yield
+    except BaseException as e:
+        # A stream closed early by its consumer, or a call nobody waits for any more, is not a failure
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            ERRORS.labels(name).inc()
+        if span is not None:
+            span.__exit__(type(e), e, e.__traceback__)
+            span = None
+        raise
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+def observe_stage(name: str, seconds: float):
+    """Record a stage timed by the caller, e.g. time to first streamed token."""
+    STAGE_LATENCY.labels(name).observe(seconds)
+
+def record_error(name: str):
+    ERRORS.labels(name).inc()
+
+def record_cache(cache: Optional[str], hit: bool):
+    if cache:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_tokens(kind: str, count: Optional[int]):
+    if count:
+        TOKENS.labels(kind).inc(count)
+
+def record_coalesced(flight: str):
+    COALESCED.labels(flight).inc()
+
+def record_embedding_batch(size: int, queue_waits: Iterable[float]):
+    EMBEDDING_BATCH_SIZE.observe(size)
+    for wait in queue_waits:
+        EMBEDDING_QUEUE_WAIT.observe(wait)
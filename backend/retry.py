@@ -0,0 +1,76 @@
+import logging
+import time
+import random
+import asyncio
+import threading
+from typing import Callable, Dict, Any, Iterator
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class RetryPolicy:
+    """
+    Retries a call on transient errors with full-jitter exponential backoff.
+
+    The n-th retry sleeps a random time between 0 and min(cap, base * 2**n),
+    so clients that failed together do not retry in lockstep. Only errors for
+    which `retryable(error)` is true are retried; anything else, and the last
+    transient error, is raised to the caller.
+    """
+
+    def __init__(self,
+                 retryable: Callable[[BaseException], bool],
+                 max_retries: int = Config.RETRY_MAX_RETRIES,
+                 base: float = Config.RETRY_BACKOFF_BASE,
+                 cap: float = Config.RETRY_BACKOFF_MAX):
+        self.retryable = retryable
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+        self._failures = 0
+
+    def delays(self) -> Iterator[float]:
+        for attempt in range(self.max_retries):
+            yield random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        self._count("_calls")
+        delays = self.delays()
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = next(delays, None)
+                if delay is None or not self.retryable(e):
+                    self._count("_failures")
+                    raise
+                self._count("_retries")
+                logger.warning("%s: %s; retrying in %.2fs", type(e).__name__, e, delay)
+                time.sleep(delay)
+
+    async def acall(self, fn: Callable, *args, **kwargs) -> Any:
+        """Like call, for a coroutine function."""
+        self._count("_calls")
+        delays = self.delays()
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = next(delays, None)
+                if delay is None or not self.retryable(e):
+                    self._count("_failures")
+                    raise
+                self._count("_retries")
+                logger.warning("%s: %s; retrying in %.2fs", type(e).__name__, e, delay)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self._calls, "retries": self._retries, "failures": self._failures}
@@ -0,0 +1,92 @@
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Callable, Awaitable
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# summarizer(previous_summary, turns_to_fold) -> new summary, or None if it failed
+Summarizer = Callable[[str, List[Tuple[str, str]]], Awaitable[Optional[str]]]
+
+class Session:
+    """Conversation state: the most recent turns verbatim plus a summary of everything older."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: List[Tuple[str, str]] = []  # (user_input, assistant_response) pairs
+        self.summary = ""
+        self.lock = asyncio.Lock()  # Serializes updates from overlapping requests
+
+    def render(self) -> str:
+        """Format the history for the prompt; empty for a new conversation."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        for user_msg, bot_msg in self.turns:
+            parts.append(f"User: {user_msg}\nAssistant: {bot_msg}")
+        return "\n\n".join(parts)
+
+class SessionStore:
+    """
+    In-memory LRU store of conversation sessions.
+
+    Each session keeps its last max_history turns verbatim. When a new turn
+    pushes older ones out, they are folded into the session's rolling summary
+    with one LLM call over the previous summary and just those turns. The
+    summary is therefore never rebuilt from the whole transcript. If that call
+    fails, the turns are dropped anyway and the previous summary kept, so a
+    failing summarizer cannot let a session grow without bound. When more
+    than max_sessions sessions exist, the least recently used one is evicted.
+
+    Sessions live in the process that created them, so running several
+    uvicorn workers requires sticky routing by session id.
+    """
+
+    def __init__(self,
+                 max_sessions: int = Config.SESSION_CACHE_SIZE,
+                 max_history: int = Config.MAX_HISTORY):
+        self.max_sessions = max_sessions
+        self.max_history = max_history
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.dropped_turns = 0  # Turns pushed out while the summarizer was failing
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """Return the session for session_id, creating it (with a fresh id if none is given)."""
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    async def record_turn(self, session: Session, user_input: str, response: str, summarizer: Summarizer):
+        """Append a turn and fold any turns beyond max_history into the summary."""
+        async with session.lock:
+            session.turns.append((user_input, response))
+            overflow = session.turns[:-self.max_history] if self.max_history else list(session.turns)
+            if not overflow:
+                return
+            summary = await summarizer(session.summary, overflow)
+            if summary is None:
+                logger.warning("Summarizing session %s failed; dropping %d turns and keeping the previous summary",
+                               session.session_id, len(overflow))
+                self.dropped_turns += len(overflow)
+            else:
+                session.summary = summary
+            session.turns = session.turns[len(overflow):]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions,
+                    "dropped_turns": self.dropped_turns}
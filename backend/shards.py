@@ -0,0 +1,291 @@
+"""
+Sharded corpus: each shard indexes and serves a share of the PDFs, a coordinator fans queries out.
+
+PDFs are assigned to shards by a hash of their file name, so every shard
+keeps its own vector index, lexical index, chunk store and manifest, and
+rebuilds incrementally like a single-node index. A shard is a HybridSearchSystem
+served by a SidecarServer, on a Unix socket or on host:port:
+
+    python -m backend.shards index --shards 4
+    python -m backend.shards serve --shard 0 --address 10.0.0.5:7100
+    SHARD_ADDRESSES=10.0.0.5:7100,10.0.0.6:7100,... uvicorn backend.api:app
+
+The API then uses a ShardedSearchSystem, which embeds each query once, sends
+the embedding to every shard, and fuses the gathered candidates globally.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from .config import Config
+from .hybrid_search import HybridSearchSystem, fused_scores
+from .bm25_index import create_lexical_index
+from .vector_index import create_vector_index
+from .document_processor import DocumentProcessor
+from .embeddings import create_embedding_backend
+from .embedding_scheduler import EmbeddingBatcher
+from .cache import TTLCache, normalize_query
+from .sidecar import RemoteSearchSystem, SidecarServer, SidecarError, parse_address
+from .metrics import stage, record_error
+
+logger = logging.getLogger(__name__)
+
+def shard_of(name: str, shards: int) -> int:
+    """Shard a PDF belongs to, stable across processes and hosts."""
+    return int(hashlib.sha1(name.encode("utf-8")).hexdigest(), 16) % shards
+
+def shard_files(pdf_dir: str, shard: int, shards: int) -> List[Path]:
+    return [pdf_file for pdf_file in sorted(Path(pdf_dir).glob('*.pdf')) if shard_of(pdf_file.name, shards) == shard]
+
+def open_shard(shard: int, root: str = Config.SHARD_DIR) -> HybridSearchSystem:
+    """The HybridSearchSystem of one shard, with all of its stores under root/shard-NNN."""
+    directory = os.path.join(root, f"shard-{shard:03d}")
+    os.makedirs(directory, exist_ok=True)
+    return HybridSearchSystem(
+        Config.PDF_DIR,
+        chroma_dir=os.path.join(directory, "chroma_db"),
+        chunk_store_dir=os.path.join(directory, "chunk_store"),
+        generation_path=os.path.join(directory, "index_generation"),
+        manifest_path=os.path.join(directory, "index_manifest.json"),
+        collection=create_vector_index(os.path.join(directory, "chroma_db"),
+                                       index_dir=os.path.join(directory, "vector_index")),
+        lexical_index=create_lexical_index(index_dir=os.path.join(directory, "bm25_index"),
+                                           index_name=f"documents-shard-{shard:03d}"),
+    )
+
+def _index_shard(shard: int, shards: int, pdf_dir: str, workers: int) -> Dict[str, int]:
+    """Worker process: index one shard's share of pdf_dir."""
+    logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    system = open_shard(shard)
+    system.doc_processor = DocumentProcessor(workers=workers)
+    pdf_files = shard_files(pdf_dir, shard, shards)
+    if not pdf_files and not system.manifest.files:
+        logger.info("Shard %d has no PDFs", shard)
+        return {}
+    return system.index_documents(pdf_dir, pdf_files)
+
+def index_shards(pdf_dir: str, shards: int, parallel: Optional[int] = None) -> List[Dict[str, int]]:
+    """
+    Build or update every shard, `parallel` shards at a time (default: all), and return their reports.
+
+    Each shard is built in its own process with its own embedding model; the
+    extraction workers of Config.EXTRACTION_WORKERS are split between them.
+    """
+    parallel = min(parallel or shards, shards)
+    workers = max(1, Config.EXTRACTION_WORKERS // parallel)
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_index_shard, shard, shards, pdf_dir, workers) for shard in range(shards)]
+        return [future.result() for future in futures]
+
+def merge_candidates(replies: List[Dict[str, Any]], n_results: int) -> Tuple[Dict, List[Dict], Dict[str, Dict[str, str]]]:
+    """
+    Merge one query's per-shard candidates into global semantic and BM25 rankings.
+
+    Semantic distances are comparable across shards, so the merged list is
+    the true global top n_results. BM25 scores use each shard's own term
+    statistics; with PDFs spread by hash those are close, but not identical,
+    to a single index's.
+    """
+    semantic = sorted((pair for reply in replies for pair in reply["semantic"]), key=lambda pair: pair[1])[:n_results]
+    bm25 = sorted((pair for reply in replies for pair in reply["bm25"]), key=lambda pair: pair[1], reverse=True)[:n_results]
+    chunks = {}
+    for reply in replies:
+        chunks.update(reply["chunks"])
+    semantic_results = {'ids': [[doc_id for doc_id, _ in semantic]], 'distances': [[distance for _, distance in semantic]]}
+    bm25_results = [{"_source": {"chunk_id": doc_id}, "_score": score} for doc_id, score in bm25]
+    return semantic_results, bm25_results, chunks
+
+class ShardedSearchSystem:
+    """
+    Scatter-gather hybrid search over shards served by SidecarServers.
+
+    Queries are embedded here, once, and every shard gets the embedding with
+    the query text. Each returns its top Config.SHARD_CANDIDATES per retriever,
+    and the weighted reciprocal rank fusion of HybridSearchSystem runs over the
+    merged lists. A shard that errors or misses Config.SHARD_TIMEOUT is left
+    out and the answer is built from the others; only if none answers is a
+    RuntimeError raised. Fused results are not cached, since each shard's
+    corpus changes independently.
+    """
+
+    def __init__(self,
+                 addresses: List[str],
+                 timeout: float = Config.SHARD_TIMEOUT,
+                 n_results: int = Config.SHARD_CANDIDATES,
+                 embedding_model=None):
+        if not addresses:
+            raise ValueError("ShardedSearchSystem needs at least one shard address")
+        self.addresses = addresses
+        self.shards = [RemoteSearchSystem(address) for address in addresses]
+        self.timeout = timeout
+        self.n_results = n_results
+        self.embedding_model = embedding_model or create_embedding_backend()
+        self.query_encoder = EmbeddingBatcher(self.embedding_model) if Config.EMBEDDING_BATCH_WINDOW_MS > 0 else None
+        self.embedding_cache = TTLCache(Config.EMBEDDING_CACHE_SIZE, Config.EMBEDDING_CACHE_TTL, name="embedding")
+        self._partial = 0  # Answers built without every shard
+
+    async def _aencode_query(self, query: str) -> np.ndarray:
+        key = normalize_query(query)
+        query_embedding = self.embedding_cache.get(key)
+        if query_embedding is None:
+            with stage("query_encode"):
+                if self.query_encoder is not None:
+                    query_embedding = await self.query_encoder.aencode(query)
+                else:
+                    query_embedding = await asyncio.to_thread(self.embedding_model.encode, [query])
+            self.embedding_cache.put(key, query_embedding)
+        return query_embedding
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        keys = [normalize_query(query) for query in queries]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            with stage("query_encode"):
+                encoded = self.embedding_model.encode([queries[i] for i in missing],
+                                                      batch_size=Config.EMBEDDING_MAX_BATCH_SIZE)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding[None, :]
+                self.embedding_cache.put(keys[i], embeddings[i])
+        return np.concatenate(embeddings)
+
+    async def _scatter(self, queries: List[str], query_embeddings: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """Each query's candidates from every shard that answered in time."""
+        with stage("shard_scatter"):
+            outcomes = await asyncio.gather(
+                *(asyncio.wait_for(shard.aretrieve(queries, query_embeddings, self.n_results), timeout=self.timeout)
+                  for shard in self.shards),
+                return_exceptions=True
+            )
+        per_query: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        complete = True
+        for address, outcome in zip(self.addresses, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                record_error("shard_timeout")
+                logger.warning("Shard %s timed out after %ss", address, self.timeout)
+                complete = False
+            elif isinstance(outcome, BaseException):
+                record_error("shard")
+                logger.warning("Shard %s failed: %s", address, outcome)
+                complete = False
+            else:
+                complete = complete and outcome["complete"]
+                for candidates, shard_candidates in zip(per_query, outcome["candidates"]):
+                    candidates.append(shard_candidates)
+        if not per_query[0]:
+            raise RuntimeError("All shards failed")
+        if not complete:
+            self._partial += 1
+        return per_query
+
+    def _fuse(self, replies: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """Global fusion of one query's shard candidates, in the result format of HybridSearchSystem.search."""
+        with stage("fusion"):
+            semantic_results, bm25_results, chunks = merge_candidates(replies, self.n_results)
+            scores = fused_scores(semantic_results, bm25_results)
+            top_ids = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)[:k]
+
+        found_by = {doc_id: ["semantic"] for doc_id in semantic_results['ids'][0]}
+        for hit in bm25_results:
+            found_by.setdefault(hit["_source"]["chunk_id"], []).append("bm25")
+        return [{
+            'content': chunks[doc_id]['content'],
+            'source': chunks[doc_id]['source'],
+            'chunk_id': doc_id,
+            'score': scores[doc_id],
+            'retrievers': found_by[doc_id]
+        } for doc_id in top_ids if doc_id in chunks]
+
+    async def asearch(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        query_embedding = await self._aencode_query(query)
+        per_query = await self._scatter([query], query_embedding)
+        return self._fuse(per_query[0], k)
+
+    async def asearch_many(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """One scatter for the whole batch: each shard gets every query and embedding in one request."""
+        query_embeddings = await asyncio.to_thread(self._encode_queries, queries)
+        per_query = await self._scatter(queries, query_embeddings)
+        return [self._fuse(replies, k) for replies in per_query]
+
+    def warmup(self) -> Dict[str, float]:
+        """Warm the local model and check the shards; raises only if no shard answers."""
+        timings = {}
+        started = time.perf_counter()
+        self.embedding_model.encode(["What is covered in this bootcamp?"])
+        timings["encode_ms"] = (time.perf_counter() - started) * 1000
+        reachable = 0
+        for address, shard in zip(self.addresses, self.shards):
+            started = time.perf_counter()
+            try:
+                shard.warmup()
+                reachable += 1
+            except SidecarError as e:
+                logger.warning("Shard %s is not available: %s", address, e)
+            timings[f"shard_{address}_ms"] = (time.perf_counter() - started) * 1000
+        if not reachable:
+            raise RuntimeError("No shard is reachable")
+        return timings
+
+    def ping(self) -> bool:
+        return any(shard.ping() for shard in self.shards)
+
+    def _shard_stats(self, method: str) -> Dict[str, Any]:
+        stats = {}
+        for address, shard in zip(self.addresses, self.shards):
+            try:
+                stats[address] = getattr(shard, method)()
+            except SidecarError as e:
+                stats[address] = {"error": str(e)}
+        return stats
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "partial_answers": self._partial,
+            "shards": self._shard_stats("cache_stats"),
+        }
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self._shard_stats("pool_stats")
+
+    def embedding_stats(self) -> Dict[str, Any]:
+        if self.query_encoder is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_encoder.stats()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or serve the shards of a sharded index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("index", help="Index Config.PDF_DIR into SHARD_DIR, one process per shard")
+    build.add_argument("--shards", type=int, required=True)
+    build.add_argument("--parallel", type=int, default=None, help="Shards built at once (default: all)")
+    serve = subparsers.add_parser("serve", help="Serve one shard to coordinators")
+    serve.add_argument("--shard", type=int, required=True)
+    serve.add_argument("--address", required=True, help="Unix socket path or host:port")
+    args = parser.parse_args()
+    logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "index":
+        for shard, report in enumerate(index_shards(Config.PDF_DIR, args.shards, args.parallel)):
+            logger.info("Shard %d: %s", shard, report)
+        return
+    system = open_shard(args.shard)
+    logger.info("Warmup: %s", system.warmup())
+    server = SidecarServer(system, args.address)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if parse_address(args.address) is None and os.path.exists(args.address):
+            os.unlink(args.address)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Embedding and retrieval sidecar shared by several API workers.
+
+One sidecar process loads the embedding model and opens the indexes. API
+workers started with Config.SIDECAR_SOCKET set use a RemoteSearchSystem
+instead of loading their own, so a node running many uvicorn workers holds
+the model, caches and store clients once.
+
+    python -m backend.sidecar --socket /tmp/rag-sidecar.sock
+    SIDECAR_SOCKET=/tmp/rag-sidecar.sock uvicorn backend.api:app --workers 8
+
+Wire format: every message is one frame, a 9-byte header followed by a
+UTF-8 JSON body and a binary blob:
+
+    !B  opcode (requests) or status (replies)
+    !I  length of the JSON body
+    !I  length of the blob
+
+Only embeddings use the blob, as raw little-endian float32 rows whose shape
+is given in the JSON body. A connection carries one request at a time;
+clients keep a pool of connections for concurrency.
+
+Addresses are Unix socket paths, or "host:port" for TCP, which is how the
+shards of a ShardedSearchSystem (backend/shards.py) on other hosts are served.
+"""
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import asyncio
+import logging
+import argparse
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!BII")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# Request opcodes
+OP_PING = 1
+OP_ENCODE = 2
+OP_SEARCH = 3
+OP_SEARCH_MANY = 4
+OP_STATS = 5
+OP_RETRIEVE = 6  # Unfused per-shard candidates for queries embedded by the caller
+
+# Reply statuses
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+class SidecarError(RuntimeError):
+    """An error raised by the sidecar while handling a request."""
+
+class SidecarUnavailable(SidecarError):
+    """The sidecar could not be reached, or closed the connection mid-request."""
+
+def parse_address(address: str) -> Optional[Tuple[str, int]]:
+    """(host, port) for a "host:port" address, or None for a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host, int(port)
+    return None
+
+def encode_frame(code: int, body: Optional[Dict[str, Any]] = None, blob: bytes = b"") -> bytes:
+    payload = json.dumps(body or {}, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(code, len(payload), len(blob)) + payload + blob
+
+def _decode_header(header: bytes) -> Tuple[int, int, int]:
+    code, body_len, blob_len = HEADER.unpack(header)
+    if body_len + blob_len > MAX_FRAME_BYTES:
+        raise SidecarError(f"Frame of {body_len + blob_len} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    return code, body_len, blob_len
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, Any], bytes]:
+    """Read one frame; raises asyncio.IncompleteReadError when the peer has closed the connection."""
+    code, body_len, blob_len = _decode_header(await reader.readexactly(HEADER.size))
+    body = json.loads(await reader.readexactly(body_len)) if body_len else {}
+    blob = await reader.readexactly(blob_len) if blob_len else b""
+    return code, body, blob
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise SidecarUnavailable("Sidecar closed the connection")
+        data += chunk
+    return bytes(data)
+
+def read_frame_sync(sock: socket.socket) -> Tuple[int, Dict[str, Any], bytes]:
+    code, body_len, blob_len = _decode_header(_recv_exactly(sock, HEADER.size))
+    body = json.loads(_recv_exactly(sock, body_len)) if body_len else {}
+    blob = _recv_exactly(sock, blob_len) if blob_len else b""
+    return code, body, blob
+
+def pack_embeddings(embeddings: np.ndarray) -> Tuple[Dict[str, Any], bytes]:
+    embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+    return {"shape": list(embeddings.shape)}, embeddings.tobytes()
+
+def unpack_embeddings(body: Dict[str, Any], blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f4").reshape(body["shape"]).astype(np.float32)
+
+def _reply(code: int, body: Dict[str, Any], blob: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """Raise SidecarError for an error reply, otherwise return its body and blob."""
+    if code != STATUS_OK:
+        raise SidecarError(f"{body.get('type', 'Error')}: {body.get('message', '')}")
+    return body, blob
+
+class SidecarServer:
+    """Serves one HybridSearchSystem to many API workers over a Unix socket or TCP."""
+
+    def __init__(self, search_system, socket_path: str = Config.SIDECAR_SOCKET):
+        self.search_system = search_system
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = 0
+        self._requests = 0
+
+    async def start(self):
+        tcp_address = parse_address(self.socket_path)
+        if tcp_address is not None:
+            self._server = await asyncio.start_server(self._handle_connection, *tcp_address)
+        else:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)  # Left behind by a previous run
+            self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+            os.chmod(self.socket_path, 0o660)
+        logger.info("Sidecar listening on %s", self.socket_path)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if parse_address(self.socket_path) is None and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    op, body, blob = await read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                self._requests += 1
+                try:
+                    reply_body, reply_blob = await self._dispatch(op, body, blob)
+                    writer.write(encode_frame(STATUS_OK, reply_body, reply_blob))
+                except Exception as e:
+                    logger.warning("Sidecar request %d failed: %s", op, e)
+                    writer.write(encode_frame(STATUS_ERROR, {"type": type(e).__name__, "message": str(e)}))
+                await writer.drain()
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _dispatch(self, op: int, body: Dict[str, Any], blob: bytes) -> Tuple[Dict[str, Any], bytes]:
+        system = self.search_system
+        if op == OP_PING:
+            return {"ok": await asyncio.to_thread(system.ping)}, b""
+        if op == OP_ENCODE:
+            if system.query_encoder is not None and body["texts"]:
+                # Encodes from every client share the batcher's forward passes with the sidecar's own searches
+                rows = await asyncio.gather(*(system.query_encoder.aencode(text) for text in body["texts"]))
+                return pack_embeddings(np.concatenate(rows))
+            embeddings = await asyncio.to_thread(system.embedding_model.encode, body["texts"],
+                                                 batch_size=Config.EMBEDDING_MAX_BATCH_SIZE)
+            return pack_embeddings(embeddings)
+        if op == OP_SEARCH:
+            return {"results": await system.asearch(body["query"], body.get("k", 5))}, b""
+        if op == OP_SEARCH_MANY:
+            return {"results": await system.asearch_many(body["queries"], body.get("k", 5))}, b""
+        if op == OP_RETRIEVE:
+            return await asyncio.to_thread(system.retrieve, body["queries"], unpack_embeddings(body, blob),
+                                           body.get("n_results", 20)), b""
+        if op == OP_STATS:
+            return {
+                "cache": system.cache_stats(),
+                "pool": system.pool_stats(),
+                "embedding": system.embedding_stats(),
+                "sidecar": {"connections": self._connections, "requests": self._requests},
+            }, b""
+        raise ValueError(f"Unknown opcode {op}")
+
+class RemoteSearchSystem:
+    """
+    Client of a SidecarServer with the parts of HybridSearchSystem the API uses.
+
+    Async calls share a pool of up to `connections` sockets, opened on demand
+    and reused across requests. Sync calls (the stats routes and warmup, which
+    run on threads) open a short-lived socket each. A sidecar that cannot be
+    reached raises SidecarUnavailable, a RuntimeError, which the API turns
+    into 503.
+    """
+
+    def __init__(self,
+                 socket_path: str = Config.SIDECAR_SOCKET,
+                 connections: int = Config.SIDECAR_CONNECTIONS,
+                 timeout: float = Config.SIDECAR_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]" = queue.LifoQueue()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._connections = connections
+
+    # Transport
+
+    def call(self, op: int, body: Optional[Dict[str, Any]] = None, blob: bytes = b"") -> Tuple[Dict[str, Any], bytes]:
+        """Blocking request over a fresh connection."""
+        tcp_address = parse_address(self.socket_path)
+        try:
+            if tcp_address is not None:
+                sock = socket.create_connection(tcp_address, timeout=self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            else:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+            with sock:
+                sock.sendall(encode_frame(op, body, blob))
+                return _reply(*read_frame_sync(sock))
+        except OSError as e:
+            raise SidecarUnavailable(f"Sidecar at {self.socket_path} is unavailable: {e}") from e
+
+    async def acall(self, op: int, body: Optional[Dict[str, Any]] = None, blob: bytes = b"") -> Tuple[Dict[str, Any], bytes]:
+        """Request over a pooled connection. A connection is discarded if anything goes wrong mid-request."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._connections)
+        async with self._slots:
+            try:
+                reader, writer = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    tcp_address = parse_address(self.socket_path)
+                    if tcp_address is not None:
+                        reader, writer = await asyncio.open_connection(*tcp_address)
+                    else:
+                        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                except OSError as e:
+                    raise SidecarUnavailable(f"Sidecar at {self.socket_path} is unavailable: {e}") from e
+            try:
+                writer.write(encode_frame(op, body, blob))
+                await writer.drain()
+                reply = await asyncio.wait_for(read_frame(reader), timeout=self.timeout)
+            except BaseException as e:
+                writer.close()
+                if isinstance(e, (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError)):
+                    raise SidecarUnavailable(f"Sidecar request failed: {type(e).__name__}: {e}") from e
+                raise
+            self._idle.put((reader, writer))
+        return _reply(*reply)
+
+    # HybridSearchSystem interface
+
+    async def asearch(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        body, _ = await self.acall(OP_SEARCH, {"query": query, "k": k})
+        return body["results"]
+
+    async def asearch_many(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        body, _ = await self.acall(OP_SEARCH_MANY, {"queries": queries, "k": k})
+        return body["results"]
+
+    async def aretrieve(self, queries: List[str], query_embeddings: np.ndarray, n_results: int = 20) -> Dict[str, Any]:
+        """The sidecar's HybridSearchSystem.retrieve for queries embedded here."""
+        shape, blob = pack_embeddings(query_embeddings)
+        body, _ = await self.acall(OP_RETRIEVE, {"queries": queries, "n_results": n_results, **shape}, blob)
+        return body
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        return unpack_embeddings(*await self.acall(OP_ENCODE, {"texts": texts}))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return unpack_embeddings(*self.call(OP_ENCODE, {"texts": texts}))
+
+    def warmup(self) -> Dict[str, float]:
+        """
+        Check that the sidecar answers and its lexical index is reachable; raises otherwise.
+
+        The sidecar warms its own model and stores before it starts listening,
+        so there is nothing to warm here.
+        """
+        started = time.perf_counter()
+        if not self.call(OP_PING)[0]["ok"]:
+            raise SidecarError("Sidecar's lexical index is not reachable")
+        return {"sidecar_ms": (time.perf_counter() - started) * 1000}
+
+    def ping(self) -> bool:
+        try:
+            return self.call(OP_PING)[0]["ok"]
+        except SidecarError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return self.call(OP_STATS)[0]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.stats()["cache"]
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {**self.stats()["pool"], "sidecar": self.socket_path}
+
+    def embedding_stats(self) -> Dict[str, Any]:
+        return self.stats()["embedding"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model and indexes to API workers over a Unix socket.")
+    parser.add_argument("--socket", default=Config.SIDECAR_SOCKET or "/tmp/rag-sidecar.sock")
+    args = parser.parse_args()
+    logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from .hybrid_search import HybridSearchSystem
+    system = HybridSearchSystem(Config.PDF_DIR, Config.CHROMA_DIR, Config.CHUNK_STORE_DIR)
+    if Config.SNAPSHOT_PATH:
+        system.load_snapshot(Config.SNAPSHOT_PATH)
+    logger.info("Warmup: %s", system.warmup())
+    server = SidecarServer(system, args.socket)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if parse_address(args.socket) is None and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+from .metrics import record_coalesced
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async calls into one.
+
+    The first caller for a key starts the call as a task of its own. Callers
+    arriving while it runs wait on the same task and get its result or
+    exception. Waiters are reference counted: a waiter that is cancelled
+    (e.g. its client disconnected) only stops waiting, and the call itself is
+    cancelled once no waiters are left. Nothing is kept after the call ends;
+    caching finished results is the caches' job.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of fn(), sharing one in-flight call per key."""
+        if not self.enabled:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            record_coalesced(self.name)
+        call.waiters += 1
+        try:
+            # shield: cancelling this waiter must not cancel the call the others share
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)  # A caller arriving now starts afresh rather than join a cancelled call
+                call.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "started": self._started, "coalesced": self._coalesced}
+
+class _Broadcast:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        # Wake everyone waiting on the current event and give later waits a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class StreamFlight:
+    """
+    SingleFlight for async streams: concurrent identical streams share one upstream.
+
+    The first subscriber for a key starts a task that drains the upstream
+    iterator into a buffer. Every subscriber reads the buffer from the start,
+    so one that joins late still gets the whole stream, then follows new
+    items as they arrive. An upstream error is raised to every subscriber.
+    The upstream is closed once the last subscriber leaves.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    def _forget(self, key: Hashable, broadcast: _Broadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[Any]]):
+        upstream = fn()
+        try:
+            async for item in upstream:
+                broadcast.items.append(item)
+                broadcast.notify()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            self._forget(key, broadcast)
+            broadcast.notify()
+            if hasattr(upstream, "aclose"):
+                await upstream.aclose()
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Yield the items of fn(), sharing one upstream iterator per key."""
+        if not self.enabled:
+            async for item in fn():
+                yield item
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            record_coalesced(self.name)
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(broadcast.items):
+                    yield broadcast.items[position]
+                    position += 1
+                    continue
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                self._forget(key, broadcast)
+                broadcast.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._streams), "started": self._started, "coalesced": self._coalesced}
@@ -0,0 +1,278 @@
+"""
+Single-file index snapshots: build the index once, ship it, load it without re-embedding.
+
+A snapshot is an uncompressed tar holding:
+
+    SNAPSHOT.json    format version, embedding model, dimension, counts and
+                     the SHA-256 of every other member
+    chunks.jsonl     one chunk per line (chunk_id, source, content, context)
+    embeddings.npy   float32 (chunks x dimension), rows in chunks.jsonl order
+    lexical/         a LocalBM25Index version built from the chunks
+    manifest.json    the index manifest, so incremental indexing carries on
+
+The tar is not compressed, so embeddings.npy is memory-mapped straight out
+of it on import.
+
+    python -m backend.snapshot export index.snapshot.tar
+    python -m backend.snapshot import index.snapshot.tar
+"""
+import os
+import io
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import tarfile
+import argparse
+import tempfile
+import itertools
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional
+from .config import Config
+from .bm25_index import LocalBM25Index
+from .manifest import IndexManifest
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+META_NAME = "SNAPSHOT.json"
+BATCH_ROWS = 1024  # Chunks copied per step on export and import
+
+class SnapshotError(ValueError):
+    """A snapshot that is corrupt, of an unknown version, or built for another embedding model."""
+
+def _batches(items: List[Any], size: int = BATCH_ROWS) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _file_hash(fileobj) -> str:
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(1 << 20), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+def _chunk_embeddings(collection, ids: List[str]) -> Dict[str, np.ndarray]:
+    result = collection.get(ids=ids, include=["embeddings"])
+    return {chunk_id: np.asarray(embedding, dtype=np.float32)
+            for chunk_id, embedding in zip(result["ids"], result["embeddings"])}
+
+def export_snapshot(search_system, path: str) -> Dict[str, Any]:
+    """
+    Write the search system's index to a snapshot at path and return its metadata.
+
+    Chunk texts come from the chunk store and embeddings from the vector store,
+    so nothing is re-embedded. The file is written next to path and renamed
+    into place, so readers never see a partial snapshot.
+    """
+    search_system.flush_stores()
+    chunk_store = search_system.chunk_store
+    ids = chunk_store.ids()
+    if not ids:
+        raise SnapshotError("The index is empty; run index_documents first")
+    dimension = search_system.embedding_model.dimension
+
+    with tempfile.TemporaryDirectory(prefix="snapshot-") as workdir:
+        embeddings = np.lib.format.open_memmap(os.path.join(workdir, "embeddings.npy"), mode="w+",
+                                               dtype=np.float32, shape=(len(ids), dimension))
+        lexical = LocalBM25Index(os.path.join(workdir, "lexical-build"))
+        row = 0
+        with open(os.path.join(workdir, "chunks.jsonl"), "w", encoding="utf-8") as chunks_file:
+            for batch in _batches(ids):
+                chunks = chunk_store.get_many(batch)
+                vectors = _chunk_embeddings(search_system.collection, batch)
+                missing = [chunk_id for chunk_id in batch if chunk_id not in chunks or chunk_id not in vectors]
+                if missing:
+                    raise SnapshotError(f"{len(missing)} chunks are missing from the stores, e.g. {missing[0]}; reindex first")
+                documents = [chunks[chunk_id] for chunk_id in batch]
+                for doc in documents:
+                    chunks_file.write(json.dumps({
+                        "chunk_id": doc["chunk_id"],
+                        "source": doc["source"],
+                        "content": doc["content"],
+                        "context": doc.get("context", ""),
+                    }) + "\n")
+                embeddings[row:row + len(batch)] = np.stack([vectors[chunk_id] for chunk_id in batch])
+                row += len(batch)
+                lexical.index_documents(documents)
+        embeddings.flush()
+        del embeddings
+        lexical.export_version(os.path.join(workdir, "lexical"))
+        shutil.rmtree(os.path.join(workdir, "lexical-build"))
+        with open(os.path.join(workdir, "manifest.json"), "w") as f:
+            json.dump({"files": search_system.manifest.files}, f)
+
+        members = ["chunks.jsonl", "embeddings.npy", "manifest.json"] + sorted(
+            f"lexical/{name}" for name in os.listdir(os.path.join(workdir, "lexical"))
+        )
+        checksums = {}
+        for name in members:
+            with open(os.path.join(workdir, name), "rb") as f:
+                checksums[name] = _file_hash(f)
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "embedding_model": Config.EMBEDDING_MODEL,
+            "dimension": dimension,
+            "chunks": len(ids),
+            "files": checksums,
+        }
+        meta["snapshot_id"] = hashlib.sha256(json.dumps(checksums, sort_keys=True).encode()).hexdigest()[:16]
+
+        tmp_path = path + ".tmp"
+        with tarfile.open(tmp_path, "w") as tar:
+            # Metadata first, so a reader can check it before reading anything else
+            meta_bytes = json.dumps(meta, indent=2).encode("utf-8")
+            info = tarfile.TarInfo(META_NAME)
+            info.size = len(meta_bytes)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(meta_bytes))
+            for name in members:
+                tar.add(os.path.join(workdir, name), arcname=name)
+        os.replace(tmp_path, path)
+    logger.info("Wrote snapshot %s of %d chunks to %s", meta["snapshot_id"], len(ids), path)
+    return meta
+
+def _map_embeddings(path: str, member: tarfile.TarInfo) -> np.ndarray:
+    """Memory-map an .npy member of an uncompressed tar without extracting it."""
+    with open(path, "rb") as f:
+        f.seek(member.offset_data)
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        header_size = f.tell() - member.offset_data
+    if fortran_order:
+        raise SnapshotError("embeddings.npy must be C-ordered")
+    return np.memmap(path, dtype=dtype, mode="r", offset=member.offset_data + header_size, shape=shape)
+
+@contextmanager
+def _import_lock(manifest_path: str) -> Iterator[None]:
+    """Exclusive lock on the stores behind a manifest, held across processes (e.g. uvicorn workers)."""
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(directory, exist_ok=True)
+    with open(manifest_path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def import_snapshot(search_system, path: str, verify: bool = True, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Load a snapshot into the search system's stores, replacing the indexed corpus.
+
+    Use HybridSearchSystem.load_snapshot, which also invalidates cached
+    results. Embeddings are copied into the vector store as they are. The lexical
+    index is installed from the snapshot with the local backend, or
+    bulk-indexed from the chunks into Elasticsearch. Chunks that are indexed
+    but not in the snapshot are removed. With verify, every member's
+    checksum is checked before any store is touched. Unless force is set, a
+    snapshot that was already loaded is skipped and None is returned;
+    otherwise returns the snapshot metadata.
+
+    Imports into the same stores hold an exclusive file lock, and the "already
+    loaded" check reads the manifest under it. When several workers start with
+    the same snapshot, one imports it and the others wait, then skip it.
+    """
+    with _import_lock(search_system.manifest.path):
+        # Another process may have imported while this one waited for the lock
+        search_system.manifest.load()
+        search_system.chunk_store.reload()
+        return _import_snapshot(search_system, path, verify, force)
+
+def _import_snapshot(search_system, path: str, verify: bool, force: bool) -> Optional[Dict[str, Any]]:
+    started = time.perf_counter()
+    with tarfile.open(path, "r") as tar:
+        meta = json.load(tar.extractfile(META_NAME))
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format {meta.get('format_version')} (expected {FORMAT_VERSION})")
+        if meta["embedding_model"] != Config.EMBEDDING_MODEL or meta["dimension"] != search_system.embedding_model.dimension:
+            raise SnapshotError(f"Snapshot was built with {meta['embedding_model']} ({meta['dimension']} dimensions), "
+                                f"this index uses {Config.EMBEDDING_MODEL} ({search_system.embedding_model.dimension})")
+        manifest: IndexManifest = search_system.manifest
+        if not force and manifest.snapshot == meta["snapshot_id"]:
+            logger.info("Snapshot %s is already loaded", meta["snapshot_id"])
+            return None
+
+        members = {member.name: member for member in tar.getmembers()}
+        missing = [name for name in meta["files"] if name not in members]
+        if missing:
+            raise SnapshotError(f"Snapshot is missing {', '.join(missing)}")
+        if verify:
+            for name, checksum in meta["files"].items():
+                if _file_hash(tar.extractfile(members[name])) != checksum:
+                    raise SnapshotError(f"Checksum mismatch for {name}; the snapshot is corrupt")
+
+        snapshot_manifest = json.load(tar.extractfile(members["manifest.json"]))["files"]
+        embeddings = _map_embeddings(path, members["embeddings.npy"])
+        if len(embeddings) != meta["chunks"]:
+            raise SnapshotError(f"Snapshot lists {meta['chunks']} chunks but has {len(embeddings)} embeddings")
+
+        local_lexical = isinstance(search_system.es_manager, LocalBM25Index)
+        if not local_lexical:
+            search_system.es_manager.create_index()
+        snapshot_ids = set()
+        lines = tar.extractfile(members["chunks.jsonl"])
+        start = 0
+        while True:
+            batch = [json.loads(line) for line in itertools.islice(lines, BATCH_ROWS)]
+            if not batch:
+                break
+            search_system.collection.upsert(
+                ids=[doc["chunk_id"] for doc in batch],
+                embeddings=np.asarray(embeddings[start:start + len(batch)], dtype=np.float32).tolist(),
+                documents=[doc["content"] for doc in batch],
+                metadatas=[{"source": doc["source"], "chunk_id": doc["chunk_id"]} for doc in batch],
+            )
+            search_system.chunk_store.put_many(batch)
+            if not local_lexical:
+                search_system.es_manager.index_documents(batch)
+            snapshot_ids.update(doc["chunk_id"] for doc in batch)
+            start += len(batch)
+        del embeddings
+        if start != meta["chunks"]:
+            raise SnapshotError(f"Snapshot lists {meta['chunks']} chunks but chunks.jsonl has {start}")
+
+        if local_lexical:
+            with tempfile.TemporaryDirectory(prefix="snapshot-") as workdir:
+                for name in meta["files"]:
+                    if name.startswith("lexical/"):
+                        with open(os.path.join(workdir, os.path.basename(name)), "wb") as f:
+                            shutil.copyfileobj(tar.extractfile(members[name]), f)
+                search_system.es_manager.install_version(workdir)
+
+    # Drop whatever the previous index had that the snapshot does not
+    stale_ids = [chunk_id for name in list(manifest.files)
+                 for chunk_id in manifest.chunk_ids(name) if chunk_id not in snapshot_ids]
+    search_system.delete_chunks(stale_ids)
+    search_system.flush_stores()
+    manifest.files = snapshot_manifest
+    manifest.snapshot = meta["snapshot_id"]
+    manifest.save()
+    logger.info("Loaded snapshot %s (%d chunks) in %.1fs", meta["snapshot_id"], start, time.perf_counter() - started)
+    return meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a prebuilt index snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Write the current index to a snapshot file")
+    export.add_argument("path")
+    load = subparsers.add_parser("import", help="Replace the current index with a snapshot")
+    load.add_argument("path")
+    load.add_argument("--no-verify", action="store_true", help="Skip the checksum pass")
+    load.add_argument("--force", action="store_true", help="Import even if this snapshot is already loaded")
+    args = parser.parse_args()
+    logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from .hybrid_search import HybridSearchSystem
+    system = HybridSearchSystem(Config.PDF_DIR, Config.CHROMA_DIR, Config.CHUNK_STORE_DIR)
+    if args.command == "export":
+        print(json.dumps(system.export_snapshot(args.path), indent=2))
+    else:
+        meta = system.load_snapshot(args.path, verify=not args.no_verify, force=args.force)
+        print("Already loaded" if meta is None else json.dumps(meta, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import os
+import json
+import shutil
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+from .config import Config
+
+class MmapVectorIndex:
+    """
+    Memory-mapped vector index with the subset of the ChromaDB collection API
+    used by HybridSearchSystem (query / get / upsert / delete / count).
+
+    Embeddings live in contiguous float16 or int8 matrices, stored as .npy and
+    opened with mmap. Every uvicorn worker on a node therefore shares the same
+    page cache instead of holding its own copy. Documents and metadata are JSON
+    records in a mapped records.dat, located through a mapped offsets.npy, so
+    only the rows a query returns are decoded; just the ids are kept in memory.
+    Search is an exact dot product, done in blocks, with top-k taken by
+    argpartition. int8 rows carry a per-row scale. The best candidates are then
+    rescored against a float16 copy, and only those rows of the copy are read.
+
+    Writes are buffered until flush, which appends an immutable segment and
+    records deleted rows of older segments as tombstones; queries see them
+    after the flush. Segments are merged once there are too many or too much
+    of them is deleted. A merged segment with at least ivf_min_rows rows gets
+    coarse IVF lists. Its rows are stored grouped by their nearest centroid,
+    and a query only scans the nprobe closest lists.
+    """
+
+    def __init__(self,
+                 index_dir: str = Config.VECTOR_INDEX_DIR,
+                 dtype: str = Config.VECTOR_DTYPE,
+                 ivf_min_rows: int = Config.VECTOR_IVF_MIN_ROWS,
+                 nprobe: int = Config.VECTOR_IVF_NPROBE,
+                 rescore_factor: int = Config.VECTOR_RESCORE_FACTOR,
+                 max_segments: int = 8,
+                 block_rows: int = 65536):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.index_dir = index_dir
+        self.dtype = dtype
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.rescore_factor = rescore_factor
+        self.max_segments = max_segments
+        self.block_rows = block_rows
+        self._lock = threading.RLock()
+        self._version = None
+        self._segments: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, tuple] = {}  # id -> (segment index, row) for live rows
+        self._removed = set()  # Ids deleted since the last flush
+        self._added: Dict[str, tuple] = {}  # id -> (embedding, document, metadata) upserted since the last flush
+        self._load()
+
+    # Persistence
+
+    def _current_path(self) -> str:
+        return os.path.join(self.index_dir, "CURRENT")
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(self._current_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load_segment(self, name: str, deleted_rows: List[int]) -> Dict[str, Any]:
+        path = os.path.join(self.index_dir, name)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+
+        def optional(file_name):
+            file_path = os.path.join(path, file_name)
+            return np.load(file_path, mmap_mode="r") if os.path.exists(file_path) else None
+
+        live = np.ones(len(meta["ids"]), dtype=bool)
+        live[deleted_rows] = False
+        return {
+            "name": name,
+            "ids": meta["ids"],
+            "records": np.memmap(os.path.join(path, "records.dat"), dtype=np.uint8, mode="r"),
+            "offsets": offsets,
+            "vectors": np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+            "scales": optional("scales.npy"),
+            "rescore": optional("rescore.npy"),
+            "centroids": optional("centroids.npy"),
+            "list_offsets": optional("list_offsets.npy"),
+            "live": live,
+        }
+
+    def _load(self):
+        while True:
+            version = self._read_current()
+            if version is None or version == self._version:
+                return
+            try:
+                with open(os.path.join(self.index_dir, f"{version}.json")) as f:
+                    layout = json.load(f)
+                segments = [self._load_segment(name, layout["deleted"].get(name, [])) for name in layout["segments"]]
+                break
+            except FileNotFoundError:
+                # Writers keep the previous version's files, so this only happens when two
+                # flushes land while this one loads; start again from the new CURRENT
+                if self._read_current() == version:
+                    raise
+        row_of = {}
+        for seg_index, segment in enumerate(segments):
+            for row in np.flatnonzero(segment["live"]):
+                row_of[segment["ids"][row]] = (seg_index, int(row))
+        with self._lock:
+            self._segments, self._row_of, self._version = segments, row_of, version
+
+    def _maybe_reload(self):
+        """Pick up a newer on-disk version written by another process."""
+        if self._read_current() != self._version:
+            self._load()
+
+    def _dense(self, segment: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+        """Float32 embeddings for the given rows of a segment."""
+        source = segment["rescore"] if segment["rescore"] is not None else segment["vectors"]
+        return np.asarray(source[rows], dtype=np.float32)
+
+    @staticmethod
+    def _raw_record(segment: Dict[str, Any], row: int) -> bytes:
+        offsets = segment["offsets"]
+        return bytes(segment["records"][offsets[row]:offsets[row + 1]])
+
+    def _record(self, segment: Dict[str, Any], row: int) -> Dict[str, Any]:
+        """The document and metadata of one row, decoded from the mapped records file."""
+        return json.loads(self._raw_record(segment, row))
+
+    def _write_segment(self, name: str, ids: List[str], embeddings: np.ndarray, records: List[bytes]):
+        if len(ids) >= self.ivf_min_rows:
+            centroids, assignment = self._train_ivf(embeddings)
+            order = np.argsort(assignment, kind="stable")
+            embeddings = embeddings[order]
+            ids = [ids[i] for i in order]
+            records = [records[i] for i in order]
+            counts = np.bincount(assignment, minlength=len(centroids))
+        else:
+            centroids = None
+
+        path = os.path.join(self.index_dir, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        if self.dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127.0
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            np.save(os.path.join(path, "vectors.npy"), np.round(embeddings / scales[:, None]).astype(np.int8))
+            np.save(os.path.join(path, "scales.npy"), scales)
+            np.save(os.path.join(path, "rescore.npy"), embeddings.astype(np.float16))
+        else:
+            np.save(os.path.join(path, "vectors.npy"), embeddings.astype(np.float16))
+        if centroids is not None:
+            np.save(os.path.join(path, "centroids.npy"), centroids)
+            np.save(os.path.join(path, "list_offsets.npy"), np.concatenate([[0], np.cumsum(counts)]))
+        with open(os.path.join(path, "records.dat"), "wb") as f:
+            for record in records:
+                f.write(record)
+        np.save(os.path.join(path, "offsets.npy"), np.concatenate([[0], np.cumsum([len(r) for r in records])]).astype(np.uint64))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dtype": self.dtype, "ids": ids}, f)
+
+    def flush(self):
+        """
+        Write pending upserts and deletes as a new version and switch CURRENT to it.
+
+        Files of the version being replaced are kept until the next flush, so
+        other processes still opening it do not find them gone; only older
+        versions are removed.
+        """
+        with self._lock:
+            if not self._added and not self._removed:
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            number = int((self._version or "v0")[1:]) + 1
+            version = f"v{number}"
+
+            # Tombstone older rows that were deleted or replaced
+            lives = [segment["live"].copy() for segment in self._segments]
+            for chunk_id in list(self._removed) + list(self._added):
+                if chunk_id in self._row_of:
+                    seg_index, row = self._row_of[chunk_id]
+                    lives[seg_index][row] = False
+            segments = [(segment, live) for segment, live in zip(self._segments, lives) if live.any()]
+
+            ids, records, parts = [], [], []
+            total_rows = sum(len(segment["ids"]) for segment, _ in segments) + len(self._added)
+            live_rows = sum(int(live.sum()) for _, live in segments) + len(self._added)
+            if len(segments) + 1 > self.max_segments or live_rows < 0.8 * total_rows:
+                # Merge everything still live into the new segment
+                for segment, live in segments:
+                    rows = np.flatnonzero(live)
+                    ids += [segment["ids"][row] for row in rows]
+                    records += [self._raw_record(segment, row) for row in rows]
+                    parts.append(self._dense(segment, rows))
+                segments = []
+            ids += list(self._added)
+            records += [json.dumps({"document": value[1], "metadata": value[2]}).encode("utf-8")
+                        for value in self._added.values()]
+            if self._added:
+                parts.append(np.stack([value[0] for value in self._added.values()]))
+
+            segment_names = [segment["name"] for segment, _ in segments]
+            if ids:
+                name = f"seg-{number:06d}"
+                self._write_segment(name, ids, np.concatenate(parts).astype(np.float32), records)
+                segment_names.append(name)
+
+            deleted = {segment["name"]: np.flatnonzero(~live).tolist() for segment, live in segments}
+            with open(os.path.join(self.index_dir, f"{version}.json"), "w") as f:
+                json.dump({"segments": segment_names, "deleted": deleted}, f)
+            tmp_path = self._current_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(version)
+            os.replace(tmp_path, self._current_path())
+
+            previous = self._version
+            keep_segments = set(segment_names) | {segment["name"] for segment in self._segments}
+            self._added, self._removed = {}, set()
+            self._load()
+            # Readers that already mapped a removed segment keep their mapping until they reload
+            keep_versions = {f"{version}.json", f"{previous}.json"}
+            for entry in os.listdir(self.index_dir):
+                if entry.startswith("seg-") and entry not in keep_segments:
+                    shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+                elif entry.startswith("v") and entry.endswith(".json") and entry not in keep_versions:
+                    os.remove(os.path.join(self.index_dir, entry))
+
+    def _train_ivf(self, embeddings: np.ndarray, iterations: int = 15, sample_size: int = 65536):
+        """Spherical k-means on a sample; returns (centroids, list of every row)."""
+        n_lists = max(1, int(np.sqrt(len(embeddings))))
+        rng = np.random.default_rng(0)
+        sample = embeddings[rng.choice(len(embeddings), min(sample_size, len(embeddings)), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids /= np.clip(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12, None)
+        assignment = np.concatenate([
+            np.argmax(embeddings[start:start + self.block_rows] @ centroids.T, axis=1)
+            for start in range(0, len(embeddings), self.block_rows)
+        ])
+        return centroids.astype(np.float32), assignment
+
+    # Collection API
+
+    def count(self) -> int:
+        self._maybe_reload()
+        return len(self._row_of)
+
+    def upsert(self,
+               ids: List[str],
+               embeddings: List[List[float]],
+               documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        """Buffer rows for the next flush."""
+        with self._lock:
+            for chunk_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+                self._removed.discard(chunk_id)
+                self._added[chunk_id] = (np.asarray(embedding, dtype=np.float32), document, metadata)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for chunk_id in ids:
+                self._added.pop(chunk_id, None)
+                self._removed.add(chunk_id)
+
+    def get(self, ids: List[str], include: Optional[List[str]] = None) -> Dict[str, Any]:
+        self._maybe_reload()
+        segments, row_of = self._segments, self._row_of
+        found = [row_of[chunk_id] for chunk_id in ids if chunk_id in row_of]
+        records = [self._record(segments[s], row) for s, row in found]
+        result = {
+            "ids": [segments[s]["ids"][row] for s, row in found],
+            "documents": [record["document"] for record in records],
+            "metadatas": [record["metadata"] for record in records],
+        }
+        if include and "embeddings" in include:
+            result["embeddings"] = [self._dense(segments[s], np.array([row]))[0] for s, row in found]
+        return result
+
+    def _scan_ranges(self, segment: Dict[str, Any], query: np.ndarray) -> List[tuple]:
+        """Row ranges of a segment to scan: every row, or its nprobe closest IVF lists."""
+        n_rows = len(segment["ids"])
+        if segment["centroids"] is None:
+            return [(start, min(start + self.block_rows, n_rows)) for start in range(0, n_rows, self.block_rows)]
+        centroid_scores = segment["centroids"] @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = segment["list_offsets"]
+        return [(int(offsets[c]), int(offsets[c + 1])) for c in probes if offsets[c + 1] > offsets[c]]
+
+    def _search_segment(self, segment: Dict[str, Any], query: np.ndarray, n_results: int):
+        """Top live rows of one segment with their dot-product scores."""
+        int8 = segment["scales"] is not None
+        wanted = n_results * self.rescore_factor if int8 else n_results
+        best_rows, best_scores = [], []
+        for start, end in self._scan_ranges(segment, query):
+            scores = np.asarray(segment["vectors"][start:end], dtype=np.float32) @ query
+            if int8:
+                scores *= segment["scales"][start:end]
+            scores[~segment["live"][start:end]] = -np.inf
+            top = self._block_top(scores, wanted)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        return self._finish_candidates(segment, query, best_rows, best_scores, n_results)
+
+    def _search_segment_many(self, segment: Dict[str, Any], queries: np.ndarray, n_results: int) -> List[tuple]:
+        """
+        _search_segment for several queries.
+
+        An exhaustively scanned segment is read and converted once per block
+        for all queries together. IVF segments probe different lists per query,
+        so they are searched one query at a time.
+        """
+        if segment["centroids"] is not None or len(queries) == 1:
+            return [self._search_segment(segment, query, n_results) for query in queries]
+        int8 = segment["scales"] is not None
+        wanted = n_results * self.rescore_factor if int8 else n_results
+        best_rows = [[] for _ in queries]
+        best_scores = [[] for _ in queries]
+        for start, end in self._scan_ranges(segment, queries[0]):
+            scores = np.asarray(segment["vectors"][start:end], dtype=np.float32) @ queries.T
+            if int8:
+                scores *= segment["scales"][start:end, None]
+            scores[~segment["live"][start:end]] = -np.inf
+            for q in range(len(queries)):
+                top = self._block_top(scores[:, q], wanted)
+                best_rows[q].append(top + start)
+                best_scores[q].append(scores[top, q])
+        return [
+            self._finish_candidates(segment, query, rows, scores, n_results)
+            for query, rows, scores in zip(queries, best_rows, best_scores)
+        ]
+
+    @staticmethod
+    def _block_top(scores: np.ndarray, wanted: int) -> np.ndarray:
+        if len(scores) > wanted:
+            return np.argpartition(-scores, wanted - 1)[:wanted]
+        return np.arange(len(scores))
+
+    def _finish_candidates(self, segment: Dict[str, Any], query: np.ndarray,
+                           best_rows: List[np.ndarray], best_scores: List[np.ndarray], n_results: int):
+        """Merge per-block candidates, rescoring int8 ones against the float16 copy, and keep the top n_results."""
+        if not best_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+
+        if segment["scales"] is not None and len(rows):
+            # Rescore the approximate candidates against the float16 copy, reading rows in file order
+            rows = np.sort(rows)
+            scores = self._dense(segment, rows) @ query
+        if len(rows) > n_results:
+            top = np.argpartition(-scores, n_results - 1)[:n_results]
+            rows, scores = rows[top], scores[top]
+        return rows, scores
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, **kwargs) -> Dict[str, Any]:
+        """
+        ChromaDB-shaped results for each query embedding.
+
+        Distances are squared L2 (Chroma's default), computed as 2 - 2 * dot
+        because the stored embeddings are normalized. Writes are not visible
+        until flush().
+        """
+        self._maybe_reload()
+        segments = self._segments
+        results = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        per_query = [[] for _ in queries]
+        for segment in segments:
+            for hits, (rows, scores) in zip(per_query, self._search_segment_many(segment, queries, n_results)):
+                hits.extend((float(score), segment, int(row)) for row, score in zip(rows, scores))
+        for hits in per_query:
+            hits.sort(key=lambda hit: -hit[0])
+            hits = hits[:n_results]
+            records = [self._record(segment, row) for _, segment, row in hits]
+            results["ids"].append([segment["ids"][row] for _, segment, row in hits])
+            results["distances"].append([2 - 2 * score for score, _, _ in hits])
+            results["documents"].append([record["document"] for record in records])
+            results["metadatas"].append([record["metadata"] for record in records])
+        return results
+
+def create_vector_index(chroma_dir: str, backend: str = Config.VECTOR_BACKEND, index_dir: str = Config.VECTOR_INDEX_DIR):
+    """Build the semantic store selected in Config: a ChromaDB collection or an MmapVectorIndex in index_dir."""
+    if backend == "mmap":
+        return MmapVectorIndex(index_dir)
+    if backend == "chroma":
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path=chroma_dir)
+        return chroma_client.get_or_create_collection("documents")
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -0,0 +1,107 @@
+import random
+from pathlib import Path
+from typing import List, Dict
+
+COMMON_WORDS = (
+    "the a of and to in is for that with as on by this are be from it at an which can we data "
+    "model each when more used will between into these other most also than only how about our"
+).split()
+SYLLABLES = "ka lo mi ne ru sa ti vo xe za pa de fi gu ho".split()
+
+class SyntheticCorpus:
+    """
+    Deterministic topic-based text for benchmark PDFs.
+
+    Each topic has its own vocabulary of made-up terms. A document mixes a few
+    topics with common filler words. Queries are drawn from a single topic's
+    vocabulary, so both lexical and semantic retrieval have real matches to rank.
+    """
+
+    def __init__(self, seed: int = 0, topics: int = 50, terms_per_topic: int = 40):
+        self.rng = random.Random(seed)
+        self.topics: List[List[str]] = []
+        for _ in range(topics):
+            terms = set()
+            while len(terms) < terms_per_topic:
+                terms.add("".join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(2, 4))))
+            self.topics.append(sorted(terms))
+
+    def sentence(self, topic: List[str]) -> str:
+        words = [
+            self.rng.choice(topic) if self.rng.random() < 0.4 else self.rng.choice(COMMON_WORDS)
+            for _ in range(self.rng.randint(8, 18))
+        ]
+        return " ".join(words).capitalize() + "."
+
+    def document(self, pages: int, sentences_per_page: int) -> List[str]:
+        """Return the text of each page of one document."""
+        topics = self.rng.sample(self.topics, k=min(3, len(self.topics)))
+        return [
+            " ".join(self.sentence(self.rng.choice(topics)) for _ in range(sentences_per_page))
+            for _ in range(pages)
+        ]
+
+    def queries(self, count: int) -> List[str]:
+        return [
+            " ".join(self.rng.sample(topic, k=self.rng.randint(2, 5)))
+            for topic in (self.rng.choice(self.topics) for _ in range(count))
+        ]
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def write_pdf(path: Path, pages: List[str]):
+    """Write a minimal uncompressed PDF with one Helvetica text stream per page."""
+    page_count = len(pages)
+    # Objects: 1 catalog, 2 page tree, 3 font, then a (page, contents) pair per page
+    objects: Dict[int, bytes] = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i, text in enumerate(pages):
+        page_id, contents_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_id} 0 R")
+        lines = " ".join(f"({_escape(line)}) '" for line in _wrap(text)[:60])
+        stream = f"BT /F1 10 Tf 40 760 Td 12 TL {lines} ET".encode("latin-1", "replace")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {contents_id} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>"
+        ).encode()
+        objects[contents_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for object_id in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+def generate_corpus(pdf_dir: Path, corpus: SyntheticCorpus, documents: int, pages: int,
+                    sentences_per_page: int) -> List[Path]:
+    """Write `documents` PDFs into pdf_dir and return their paths."""
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = pdf_dir / f"doc_{i:05d}.pdf"
+        write_pdf(path, corpus.document(pages, sentences_per_page))
+        paths.append(path)
+    return paths
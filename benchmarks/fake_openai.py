@@ -0,0 +1,153 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests.
+
+Answers /v1/chat/completions, streamed or not, with usage, after a
+configurable time to first token. Tokens then follow at a fixed rate. Errors,
+rate limits and streams cut off part way can be injected at given rates.
+Point the backend at it with OPENAI_BASE_URL:
+
+    python -m benchmarks.fake_openai --port 8100 --ttft-ms 400 --tokens-per-s 60 --error-rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake uvicorn backend.api:app
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, AsyncIterator, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ("the pipeline reads each batch from the warehouse and writes the result to a partitioned table "
+         "so that downstream jobs can pick up only the files that changed since the last run").split()
+
+class FakeOpenAI:
+    """Latency, token rate and failure settings, and counts of what was served."""
+
+    def __init__(self,
+                 ttft_ms: float = 300.0,
+                 jitter: float = 0.3,
+                 tokens_per_s: float = 50.0,
+                 completion_tokens: int = 120,
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 cutoff_rate: float = 0.0,
+                 seed: int = 0):
+        self.ttft = ttft_ms / 1000.0
+        self.jitter = jitter
+        self.tokens_per_s = tokens_per_s
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.cutoff_rate = cutoff_rate
+        self.rng = random.Random(seed)
+        self.counts = {"requests": 0, "streams": 0, "in_flight": 0, "errors": 0, "rate_limited": 0, "cut_off": 0}
+
+    def first_token_delay(self) -> float:
+        """Time to first token, log-normally spread around ttft so the tail looks like a real API's."""
+        return self.ttft * self.rng.lognormvariate(0.0, self.jitter) if self.jitter > 0 else self.ttft
+
+    def tokens(self, count: int) -> List[str]:
+        start = self.rng.randrange(len(WORDS))
+        return [("" if i == 0 else " ") + WORDS[(start + i) % len(WORDS)] for i in range(count)]
+
+def error_body(message: str, kind: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": kind, "param": None, "code": None}}
+
+def create_app(fake: FakeOpenAI) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/stats")
+    def stats():
+        return fake.counts
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        fake.counts["requests"] += 1
+        if fake.rng.random() < fake.rate_limit_rate:
+            fake.counts["rate_limited"] += 1
+            return JSONResponse(error_body("Injected rate limit", "rate_limit_exceeded"), status_code=429,
+                                headers={"Retry-After": "1"})
+        if fake.rng.random() < fake.error_rate:
+            fake.counts["errors"] += 1
+            return JSONResponse(error_body("Injected server error", "server_error"), status_code=500)
+
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        limit = body.get("max_completion_tokens") or body.get("max_tokens") or fake.completion_tokens
+        tokens = fake.tokens(min(fake.completion_tokens, limit))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = body.get("model", "fake")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            fake.counts["in_flight"] += 1
+            try:
+                await asyncio.sleep(fake.first_token_delay() + len(tokens) / fake.tokens_per_s)
+            finally:
+                fake.counts["in_flight"] -= 1
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        fake.counts["streams"] += 1
+        cut_at = len(tokens) // 2 if fake.rng.random() < fake.cutoff_rate else None
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            fake.counts["in_flight"] += 1
+            try:
+                await asyncio.sleep(fake.first_token_delay())
+                yield chunk({"role": "assistant", "content": ""})
+                for i, token in enumerate(tokens):
+                    if i == cut_at:
+                        fake.counts["cut_off"] += 1
+                        raise ConnectionError("Injected stream cut-off")  # Ends the response without [DONE]
+                    if i:
+                        await asyncio.sleep(1.0 / fake.tokens_per_s)
+                    yield chunk({"content": token})
+                yield chunk({}, "stop")
+                if include_usage:
+                    payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": usage}
+                    yield f"data: {json.dumps(payload)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                fake.counts["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Median time to first token")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Log-normal sigma of the time to first token (0 = fixed)")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="Completion tokens per second after the first")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--cutoff-rate", type=float, default=0.0, help="Share of streams cut off half way")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    fake = FakeOpenAI(args.ttft_ms, args.jitter, args.tokens_per_s, args.completion_tokens,
+                      args.error_rate, args.rate_limit_rate, args.cutoff_rate, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
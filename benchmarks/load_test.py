@@ -0,0 +1,273 @@
+"""
+End-to-end load generator for backend.api.
+
+Replays questions from a file against /chat or /chat/stream and reports
+throughput, p50/p95/p99 latency, time to first token and error rates.
+Pair it with benchmarks.fake_openai so runs cost nothing and are not
+throttled by OpenAI.
+
+Open loop (default): requests arrive as a Poisson process at --rate per
+second, whether or not earlier ones have finished, like independent users.
+Closed loop: --concurrency clients each send their next request as soon as
+the last one finishes. --sweep runs the open loop at several rates and marks
+the highest one that met --slo-ms at p95 with under 1% errors:
+
+    python -m benchmarks.load_test --queries requests.jsonl --rate 20 --duration 60
+    python -m benchmarks.load_test --mode closed --concurrency 32 --endpoint chat
+    python -m benchmarks.load_test --sweep 5,10,20,40,80 --slo-ms 5000 --output load.json
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import httpx
+import numpy as np
+from typing import List, Dict, Any, Optional
+from .corpus import SyntheticCorpus
+from .meta import run_meta
+
+QUERY_FIELDS = ("message", "query", "question", "title")
+
+def load_queries(path: Optional[str], count: int, seed: int) -> List[str]:
+    """
+    Questions from a file, one per line, or synthetic ones if path is None.
+
+    JSON lines contribute their first field of QUERY_FIELDS, so request logs
+    (or the repo's requests.jsonl) can be replayed as they are; other lines
+    are used as plain text.
+    """
+    if path is None:
+        return SyntheticCorpus(seed=seed).queries(count)
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                queries.append(line)
+                continue
+            if isinstance(record, dict):
+                text = next((record[field] for field in QUERY_FIELDS if record.get(field)), None)
+                if text:
+                    queries.append(str(text))
+            elif isinstance(record, str):
+                queries.append(record)
+    if not queries:
+        raise ValueError(f"No queries found in {path}")
+    return queries
+
+class Sample:
+    __slots__ = ("started", "latency", "ttft", "status", "error")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.status: Optional[int] = None
+        self.error: Optional[str] = None  # None for a complete answer
+
+class LoadGenerator:
+    """Sends the requests of one run and keeps a Sample for each."""
+
+    def __init__(self, base_url: str, endpoint: str, queries: List[str], unique: bool, timeout: float):
+        self.url = {"chat": "/chat", "stream": "/chat/stream"}[endpoint]
+        self.stream = endpoint == "stream"
+        self.queries = queries
+        self.unique = unique
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                        limits=httpx.Limits(max_connections=None, max_keepalive_connections=1000))
+        self.samples: List[Sample] = []
+        self._sent = 0
+
+    def next_query(self) -> str:
+        query = self.queries[self._sent % len(self.queries)]
+        if self.unique:
+            query = f"{query} r{self._sent}"  # Defeats the result cache and request coalescing
+        self._sent += 1
+        return query
+
+    async def one(self):
+        sample = Sample(time.perf_counter())
+        self.samples.append(sample)
+        payload = {"message": self.next_query()}
+        try:
+            if self.stream:
+                await self._stream(sample, payload)
+            else:
+                response = await self.client.post(self.url, json=payload)
+                sample.status = response.status_code
+                if response.status_code != 200:
+                    sample.error = f"http_{response.status_code}"
+                elif response.json().get("degraded"):
+                    sample.error = "degraded"
+        except httpx.TimeoutException:
+            sample.error = "timeout"
+        except httpx.HTTPError as e:
+            sample.error = type(e).__name__
+        sample.latency = time.perf_counter() - sample.started
+
+    async def _stream(self, sample: Sample, payload: Dict[str, Any]):
+        async with self.client.stream("POST", self.url, json=payload) as response:
+            sample.status = response.status_code
+            if response.status_code != 200:
+                sample.error = f"http_{response.status_code}"
+                return
+            event = None
+            finished = False
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if event == "token" and sample.ttft is None:
+                        sample.ttft = time.perf_counter() - sample.started
+                    elif event in ("error", "degraded"):
+                        sample.error = f"stream_{event}"
+                    elif event == "done":
+                        finished = True
+            if not finished and sample.error is None:
+                sample.error = "stream_incomplete"
+
+    async def open_loop(self, rate: float, duration: float, seed: int):
+        """Poisson arrivals at `rate` per second for `duration` seconds, then wait for stragglers."""
+        rng = random.Random(seed)
+        tasks = []
+        deadline = time.perf_counter() + duration
+        next_arrival = time.perf_counter()
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.ensure_future(self.one()))
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, concurrency: int, duration: float):
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                await self.one()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def close(self):
+        await self.client.aclose()
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.array(values) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+def summarize(samples: List[Sample], started: float, warmup: float) -> Dict[str, Any]:
+    """
+    Stats over the requests sent after the warmup.
+
+    Throughput is complete answers per second, from the first measured request
+    to the end of the last. Latency percentiles cover complete answers only,
+    since shed requests return almost at once.
+    """
+    measured = [sample for sample in samples if sample.started >= started + warmup]
+    if not measured:
+        return {"requests": 0}
+    window = max(sample.started + sample.latency for sample in measured) - measured[0].started
+    ok = [sample for sample in measured if sample.error is None]
+    errors: Dict[str, int] = {}
+    for sample in measured:
+        if sample.error is not None:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    return {
+        "requests": len(measured),
+        "offered_per_s": len(measured) / (measured[-1].started - measured[0].started or 1.0),
+        "throughput_per_s": len(ok) / window if window > 0 else 0.0,
+        "error_rate": 1 - len(ok) / len(measured),
+        "errors": errors,
+        "latency": percentiles([sample.latency for sample in ok]),
+        "ttft": percentiles([sample.ttft for sample in ok if sample.ttft is not None]),
+    }
+
+async def run_once(args, queries: List[str], rate: Optional[float]) -> Dict[str, Any]:
+    generator = LoadGenerator(args.url, args.endpoint, queries, args.unique, args.timeout)
+    started = time.perf_counter()
+    try:
+        if args.mode == "open":
+            await generator.open_loop(rate, args.warmup + args.duration, args.seed)
+        else:
+            await generator.closed_loop(args.concurrency, args.warmup + args.duration)
+    finally:
+        await generator.close()
+    return summarize(generator.samples, started, args.warmup)
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:>9.0f}" if value is not None else f"{'-':>9}"
+
+def print_row(label: str, stats: Dict[str, Any]):
+    if not stats["requests"]:
+        print(f"{label:<12}no requests")
+        return
+    latency, ttft = stats["latency"], stats["ttft"]
+    print(f"{label:<12}{stats['requests']:>8}{stats['offered_per_s']:>9.1f}{stats['throughput_per_s']:>9.1f}"
+          f"{stats['error_rate'] * 100:>7.1f}%{_ms(latency['p50_ms'])}{_ms(latency['p95_ms'])}{_ms(latency['p99_ms'])}"
+          f"{_ms(ttft['p50_ms'])}{_ms(ttft['p95_ms'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat API with open- or closed-loop traffic.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["stream", "chat"], default="stream",
+                        help="/chat/stream reports time to first token; /chat only latency")
+    parser.add_argument("--queries", help="File of questions: JSON lines or plain text (default: synthetic)")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--rate", type=float, default=10.0, help="Open loop: mean arrivals per second")
+    parser.add_argument("--sweep", help="Open loop: comma-separated rates to run one after another")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed loop: concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds measured per run")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds sent before measuring starts")
+    parser.add_argument("--unique", action="store_true", help="Make every question unique to bypass caches and coalescing")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request in seconds")
+    parser.add_argument("--slo-ms", type=float, default=5000.0, help="p95 latency a sweep step must meet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args()
+    queries = load_queries(args.queries, 500, args.seed)
+
+    if args.mode == "closed":
+        runs = [("closed", f"c={args.concurrency}", None)]
+    else:
+        rates = [float(rate) for rate in args.sweep.split(",")] if args.sweep else [args.rate]
+        runs = [("open", f"{rate:g}/s", rate) for rate in rates]
+
+    print(f"{'load':<12}{'sent':>8}{'offered':>9}{'ok/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'ttft50':>9}{'ttft95':>9}")
+    results = []
+    for mode, label, rate in runs:
+        stats = asyncio.run(run_once(args, queries, rate))
+        results.append({"mode": mode, "rate": rate, "concurrency": args.concurrency if mode == "closed" else None, **stats})
+        print_row(label, stats)
+
+    saturation = None
+    if len(results) > 1:
+        for result in results:
+            if result["requests"] and result["error_rate"] < 0.01 and result["latency"]["p95_ms"] is not None \
+                    and result["latency"]["p95_ms"] <= args.slo_ms:
+                saturation = result["rate"]
+        print(f"\nHighest rate within a p95 of {args.slo_ms:g} ms and under 1% errors: "
+              f"{f'{saturation:g}/s' if saturation is not None else 'none'}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": run_meta(args, queries=len(queries)),
+            "runs": results,
+            "saturation_rate": saturation,
+        }, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Run metadata shared by the benchmarks, kept free of backend imports."""
+import sys
+import time
+import platform
+import subprocess
+from typing import Dict, Any
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_meta(args, **extra) -> Dict[str, Any]:
+    """Commit, time, interpreter, platform and arguments of a run, plus any extra fields."""
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": vars(args),
+        **extra,
+    }
@@ -0,0 +1,255 @@
+"""
+Retrieval microbenchmarks on a synthetic PDF corpus.
+
+Times extraction, chunking, embedding, the index writes and each stage of a
+query, then writes p50/p95/p99 latencies and throughput to JSON. Embeddings
+come from a hashing encoder unless --embedding selects a real model.
+
+By default everything runs in-process and offline: LocalBM25Index stands in
+for Elasticsearch and MmapVectorIndex for ChromaDB, so those numbers say
+nothing about either service. --backends configured uses the stores selected
+by LEXICAL_BACKEND and VECTOR_BACKEND instead: a fresh ChromaDB under the work
+directory and an Elasticsearch index named by --es-index, which is dropped
+before and after the run.
+
+    python -m benchmarks.retrieval_benchmark --documents 200 --output before.json
+    python -m benchmarks.retrieval_benchmark --documents 200 --output after.json --compare before.json
+    python -m benchmarks.retrieval_benchmark --backends configured --output services.json
+"""
+import json
+import time
+import zlib
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+from backend.config import Config
+from backend.embeddings import EmbeddingBackend, create_embedding_backend
+from backend.embedding_scheduler import EmbeddingBatcher
+from backend.bm25_index import LocalBM25Index, create_lexical_index, tokenize
+from backend.vector_index import MmapVectorIndex, create_vector_index
+from backend.hybrid_search import HybridSearchSystem
+from backend.document_processor import DocumentProcessor
+from .corpus import SyntheticCorpus, generate_corpus
+from .meta import run_meta
+
+class HashingEmbedder(EmbeddingBackend):
+    """Feature-hashed bag of words: no model download, and cheap enough not to dominate the timings."""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        output = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode())
+                output[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        output /= np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output
+
+class StageTimer:
+    """Collects per-call latencies and item counts for each named stage."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.items: Dict[str, int] = {}
+        self.wall: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float, items: int = 1):
+        self.samples.setdefault(stage, []).append(seconds)
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def time(self, stage: str, fn, *args, items: int = 1, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.record(stage, time.perf_counter() - started, items)
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            # Stages run concurrently report throughput over wall time rather than summed latency
+            elapsed = self.wall.get(stage, float(np.sum(samples)))
+            stages[stage] = {
+                "calls": len(samples),
+                "items": self.items[stage],
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "mean_ms": float(ms.mean()),
+                "items_per_s": self.items[stage] / elapsed if elapsed > 0 else 0.0,
+            }
+        return stages
+
+def build_index(system: HybridSearchSystem, pdf_files: List[Path], timer: StageTimer, batch_size: int) -> int:
+    """Extract, chunk, embed and write the corpus, timing each stage separately."""
+    processor = system.doc_processor
+    documents = []
+    for pdf_file in pdf_files:
+        text = timer.time("extract", processor.extract_text_from_pdf, str(pdf_file))
+        chunks = timer.time("chunk", processor.create_chunks, text)
+        documents.extend(
+            {"source": pdf_file.name, "chunk_id": f"{pdf_file.stem}_chunk_{i}", **chunk}
+            for i, chunk in enumerate(chunks)
+        )
+
+    system.es_manager.create_index()
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        embeddings = timer.time("embed", system.embed_chunks, batch, items=len(batch))
+        timer.time("lexical_write", system.es_manager.index_documents, batch, items=len(batch))
+        timer.time("vector_write", system.collection.upsert, ids=[doc["chunk_id"] for doc in batch],
+                   embeddings=embeddings.tolist(), documents=[doc["content"] for doc in batch],
+                   metadatas=[{"source": doc["source"], "chunk_id": doc["chunk_id"]} for doc in batch],
+                   items=len(batch))
+        timer.time("chunk_store_write", system.chunk_store.put_many, batch, items=len(batch))
+    timer.time("lexical_flush", system.es_manager.flush)
+    if hasattr(system.collection, "flush"):  # ChromaDB persists on every call
+        timer.time("vector_flush", system.collection.flush)
+    timer.time("chunk_store_flush", system.chunk_store.flush)
+    return len(documents)
+
+def benchmark_queries(system: HybridSearchSystem, queries: List[str], timer: StageTimer, k: int):
+    """Time each retrieval stage on its own, then the whole search() uncached and cached."""
+    for query in queries:
+        system.embedding_cache.clear()
+        query_embedding = timer.time("query_encode", system._encode_query, query)
+        semantic_results = timer.time("semantic_search", system._semantic_search, query_embedding)
+        bm25_results = timer.time("bm25_search", system._bm25_search, query)
+        merged_ids = timer.time("fusion", system.reciprocal_rank_fusion, semantic_results, bm25_results)
+        timer.time("fetch_chunks", system.fetch_chunks, merged_ids[:k], semantic_results, bm25_results)
+
+        system.embedding_cache.clear()
+        system.result_cache.clear()
+        timer.time("search", system.search, query, k)
+        timer.time("search_cached", system.search, query, k)
+
+def benchmark_concurrent(system: HybridSearchSystem, queries: List[str], timer: StageTimer, k: int,
+                         concurrency: int):
+    """Uncached search() from several threads; throughput is measured over wall time."""
+    system.embedding_cache.clear()
+    system.result_cache.clear()
+    # A per-call suffix keeps every query a cache miss without clearing caches under other threads
+    unique = [f"{query} q{i}" for i, query in enumerate(queries)]
+
+    def one(query):
+        timer.time("search_concurrent", system.search, query, k)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, unique))
+    timer.wall["search_concurrent"] = time.perf_counter() - started
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    if current["meta"].get("backends") != baseline["meta"].get("backends"):
+        print(f"\nNote: the baseline used other stores ({baseline['meta'].get('backends')})")
+    print(f"\n{'stage':<20}{'p50 ms':>12}{'base':>10}{'change':>9}{'p95 ms':>12}{'base':>10}{'change':>9}")
+    for stage, stats in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            continue
+        row = f"{stage:<20}"
+        for key in ("p50_ms", "p95_ms"):
+            change = (stats[key] / base[key] - 1) * 100 if base[key] else 0.0
+            row += f"{stats[key]:>12.3f}{base[key]:>10.3f}{change:>+8.1f}%"
+        print(row)
+
+def open_stores(args, workdir: Path):
+    """The (vector, lexical) stores to benchmark: the in-process stand-ins or the Config-selected backends."""
+    for name in ("bm25", "vectors", "chunks", "chroma"):
+        shutil.rmtree(workdir / name, ignore_errors=True)
+    if args.backends == "local":
+        return MmapVectorIndex(str(workdir / "vectors"), dtype=args.vector_dtype), LocalBM25Index(str(workdir / "bm25"))
+    collection = create_vector_index(str(workdir / "chroma"), index_dir=str(workdir / "vectors"))
+    lexical_index = create_lexical_index(index_dir=str(workdir / "bm25"), index_name=args.es_index)
+    drop_es_index(lexical_index)
+    return collection, lexical_index
+
+def drop_es_index(lexical_index):
+    if hasattr(lexical_index, "es"):
+        lexical_index.es.indices.delete(index=lexical_index.index_name, ignore_unavailable=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing and retrieval on a synthetic corpus.")
+    parser.add_argument("--documents", type=int, default=100, help="PDFs to generate")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per PDF")
+    parser.add_argument("--sentences-per-page", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads for the concurrent search stage (0 skips it)")
+    parser.add_argument("--batch-size", type=int, default=Config.INDEX_BATCH_SIZE)
+    parser.add_argument("--batch-window-ms", type=float, default=Config.EMBEDDING_BATCH_WINDOW_MS,
+                        help="Query embedding batch window (0 encodes each query directly)")
+    parser.add_argument("--embedding", choices=["hash", "sentence-transformers", "onnx"], default="hash")
+    parser.add_argument("--chunk-mode", choices=["sentences", "tokens"], default="sentences",
+                        help="tokens needs the embedding model's tokenizer (downloaded unless exported with ONNX)")
+    parser.add_argument("--backends", choices=["local", "configured"], default="local",
+                        help="local: in-process stand-ins; configured: LEXICAL_BACKEND and VECTOR_BACKEND (e.g. Elasticsearch, ChromaDB)")
+    parser.add_argument("--es-index", default="rag-benchmark", help="Elasticsearch index used with --backends configured")
+    parser.add_argument("--vector-dtype", choices=["float16", "int8"], default=Config.VECTOR_DTYPE,
+                        help="MmapVectorIndex dtype with --backends local")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep the corpus and indexes here instead of a temporary directory")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    corpus = SyntheticCorpus(seed=args.seed)
+    started = time.perf_counter()
+    pdf_files = generate_corpus(workdir / "pdfs", corpus, args.documents, args.pages, args.sentences_per_page)
+    print(f"Generated {len(pdf_files)} PDFs in {time.perf_counter() - started:.1f}s under {workdir}")
+
+    embedding_model = HashingEmbedder() if args.embedding == "hash" else create_embedding_backend(args.embedding)
+    collection, lexical_index = open_stores(args, workdir)
+    system = HybridSearchSystem(
+        str(workdir / "pdfs"),
+        chunk_store_dir=str(workdir / "chunks"),
+        generation_path=str(workdir / "generation"),
+        manifest_path=str(workdir / "manifest.json"),
+        embedding_model=embedding_model,
+        collection=collection,
+        lexical_index=lexical_index,
+    )
+    system.doc_processor = DocumentProcessor(chunk_mode=args.chunk_mode)
+    system.query_encoder = EmbeddingBatcher(embedding_model, args.batch_window_ms) if args.batch_window_ms > 0 else None
+
+    timer = StageTimer()
+    chunks = build_index(system, pdf_files, timer, args.batch_size)
+    if hasattr(lexical_index, "es"):
+        lexical_index.es.indices.refresh(index=lexical_index.index_name)  # Make the bulk writes searchable
+    print(f"Indexed {chunks} chunks")
+    queries = corpus.queries(args.queries)
+    benchmark_queries(system, queries, timer, args.k)
+    if args.concurrency > 0:
+        benchmark_concurrent(system, queries, timer, args.k, args.concurrency)
+
+    results = {
+        "meta": run_meta(args,
+                         backends={"vector": type(collection).__name__, "lexical": type(lexical_index).__name__},
+                         chunks=chunks),
+        "stages": timer.summary(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{'stage':<20}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<20}{stats['calls']:>7}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['items_per_s']:>12.1f}")
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.backends == "configured":
+        drop_es_index(lexical_index)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
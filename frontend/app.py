@@ -1,3 +1,5 @@
+import json
+import uuid
 import streamlit as st
 import requests
 
@@ -6,6 +8,32 @@ st.caption("Powered by o1-mini and Hybrid RAG")
 
 if "history" not in st.session_state:
     st.session_state.history = []
+if "session_id" not in st.session_state:
+    # The backend keeps the conversation under this id; history is only kept here for display
+    st.session_state.session_id = uuid.uuid4().hex
+
+def stream_chat(message: str, session_id: str, sources: dict):
+    """Yield answer tokens from the backend's SSE stream, filling `sources` as it arrives."""
+    with requests.post(
+        "http://127.0.0.1:8000/chat/stream",
+        json={"message": message, "session_id": session_id},
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "sources":
+                    sources.update(data)
+                elif event == "token":
+                    yield data["token"]
+                elif event == "error":
+                    yield f"\n\n_{data['detail']}_"
+                elif event == "degraded":
+                    yield "_The assistant is busy right now; here are the most relevant sources._"
 
 user_input = st.chat_input("Ask about your documents...")
 
@@ -19,19 +47,12 @@ for user_msg, bot_msg in st.session_state.history:
 if user_input:
     with st.chat_message("user"):
         st.markdown(user_input)
-    
-    response = requests.post(
-        "http://127.0.0.1:8000/chat",
-        json={"message": user_input, "history": st.session_state.history}
-    ).json()
-    
-    bot_response = response["response"]
-    
+
+    sources = {}
     with st.chat_message("assistant"):
-        st.markdown(bot_response)
+        # Render tokens as they arrive instead of waiting for the full completion
+        bot_response = st.write_stream(stream_chat(user_input, st.session_state.session_id, sources))
         with st.expander("View sources"):
-            st.write("\n".join(response["context_sources"]))
-    
-    # Update history and keep it within a limit (optional)
-    st.session_state.history.append((user_input, bot_response))
+            st.write("\n".join(sources.get("context_sources", [])))
 
+    st.session_state.history.append((user_input, bot_response))
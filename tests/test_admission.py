@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from backend.admission import AdmissionLimiter, Overloaded
+
+def test_full_queue_is_shed_with_429():
+    async def main():
+        limiter = AdmissionLimiter("test", limit=1, max_queue=1, queue_timeout=1.0)
+        holder = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.status_code == 429
+        assert shed.value.reason == "queue_full"
+        assert shed.value.retry_after >= 1
+
+        holder.release()
+        (await waiter).release()
+        assert limiter.stats()["active"] == 0
+        assert limiter.stats()["shed"] == {"queue_full": 1, "timeout": 0}
+
+    asyncio.run(main())
+
+def test_queue_timeout_is_shed_with_503():
+    async def main():
+        limiter = AdmissionLimiter("test", limit=1, max_queue=5, queue_timeout=0.02)
+        async with await limiter.acquire():
+            with pytest.raises(Overloaded) as shed:
+                await limiter.acquire()
+            assert shed.value.status_code == 503
+            assert shed.value.reason == "timeout"
+            assert limiter.stats()["queued"] == 0
+        assert limiter.stats()["active"] == 0
+
+    asyncio.run(main())
+
+def test_slots_pass_to_waiters_in_order():
+    async def main():
+        limiter = AdmissionLimiter("test", limit=1, max_queue=5, queue_timeout=1.0)
+        order = []
+
+        async def work(name):
+            async with await limiter.acquire():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[work(name) for name in "abcd"])
+        assert order == list("abcd")
+        assert limiter.stats()["admitted"] == 4
+        assert limiter.stats()["active"] == 0
+
+    asyncio.run(main())
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        limiter = AdmissionLimiter("test", limit=1, max_queue=5, queue_timeout=1.0)
+        holder = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        holder.release()
+        holder.release()  # Releasing twice is a no-op
+        assert limiter.stats()["active"] == 0 and limiter.stats()["queued"] == 0
+        (await asyncio.wait_for(limiter.acquire(), timeout=0.1)).release()
+
+    asyncio.run(main())
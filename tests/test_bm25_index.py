@@ -0,0 +1,111 @@
+import math
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from backend.bm25_index import FIELD_BOOSTS, LocalBM25Index, tokenize
+
+DOCS = [
+    {"chunk_id": "a", "source": "airflow.pdf", "content": "Airflow schedules the DAG and retries failed tasks.",
+     "context": "Orchestration with Airflow"},
+    {"chunk_id": "b", "source": "kafka.pdf", "content": "Kafka consumers in a group split the partitions of a topic.",
+     "context": "Streaming"},
+    {"chunk_id": "c", "source": "spark.pdf", "content": "Spark partitions a DataFrame and schedules tasks on executors.",
+     "context": ""},
+    {"chunk_id": "d", "source": "dbt.pdf", "content": "dbt models are SELECT statements that build tables.",
+     "context": "Transformations scheduled by Airflow"},
+]
+
+def reference_scores(docs, query, k1=1.2, b=0.75):
+    """Best boosted per-field BM25 score of each document, computed the slow way."""
+    scores = {}
+    for field, boost in FIELD_BOOSTS.items():
+        tokens = {doc["chunk_id"]: tokenize(doc.get(field, "")) for doc in docs}
+        with_field = [terms for terms in tokens.values() if terms]
+        avg_len = sum(len(terms) for terms in with_field) / len(with_field)
+        for chunk_id, terms in tokens.items():
+            score = 0.0
+            for term in tokenize(query):
+                doc_freq = sum(term in other for other in with_field)
+                tf = terms.count(term)
+                if not tf:
+                    continue
+                idf = math.log1p((len(with_field) - doc_freq + 0.5) / (doc_freq + 0.5))
+                score += idf * tf / (tf + k1 * (1 - b + b * len(terms) / avg_len))
+            scores[chunk_id] = max(scores.get(chunk_id, 0.0), boost * score)
+    return {chunk_id: score for chunk_id, score in scores.items() if score > 0}
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalBM25Index(str(tmp_path))
+    index.index_documents(DOCS)
+    return index
+
+@pytest.mark.parametrize("query", ["airflow schedules tasks", "partitions", "kafka topic partitions partitions", "tables"])
+def test_scores_match_reference_bm25(index, query):
+    hits = index.search(query, size=10)
+    expected = reference_scores(DOCS, query)
+    assert {hit["_id"] for hit in hits} == set(expected)
+    for hit in hits:
+        assert hit["_score"] == pytest.approx(expected[hit["_id"]], rel=1e-5)
+    assert [hit["_score"] for hit in hits] == sorted((hit["_score"] for hit in hits), reverse=True)
+
+def test_content_matches_outrank_context_matches(tmp_path):
+    index = LocalBM25Index(str(tmp_path))
+    index.index_documents([
+        {"chunk_id": "content", "source": "s", "content": "warehouse", "context": "lake"},
+        {"chunk_id": "context", "source": "s", "content": "lake", "context": "warehouse"},
+    ])
+    hits = index.search("warehouse")
+    assert [hit["_id"] for hit in hits] == ["content", "context"]
+    assert hits[0]["_score"] == pytest.approx(2 * hits[1]["_score"])
+
+def test_search_many_matches_search(index):
+    queries = ["airflow", "partitions of a topic", "no such words", "tasks"]
+    for query, hits in zip(queries, index.search_many(queries, size=3, block_queries=2)):
+        assert hits == index.search(query, size=3)
+
+def test_flush_reload_and_delete(tmp_path):
+    writer = LocalBM25Index(str(tmp_path))
+    writer.index_documents(DOCS)
+    writer.flush()
+    reader = LocalBM25Index(str(tmp_path))
+    assert [hit["_id"] for hit in reader.search("kafka")] == ["b"]
+
+    writer.delete_documents(["b", "missing"])
+    writer.index_documents([{"chunk_id": "a", "source": "airflow.pdf", "content": "Airflow sensors wait on Kafka."}])
+    writer.flush()
+    # The reader picks up the new version on its next search
+    assert [hit["_id"] for hit in reader.search("kafka")] == ["a"]
+    assert reader.search("executors")[0]["_source"]["source"] == "spark.pdf"
+    assert sorted(reader.ids) == ["a", "c", "d"]
+
+def test_flush_keeps_the_previous_version(tmp_path):
+    index = LocalBM25Index(str(tmp_path))
+    for doc in DOCS:
+        index.index_documents([doc])
+        index.flush()
+    assert sorted(os.listdir(tmp_path)) == ["CURRENT", "v3", "v4"]
+
+    # A reader that read CURRENT just before the last flush can still load
+    stale = LocalBM25Index(str(tmp_path))
+    stale._reset()
+    stale._version = None
+    with open(tmp_path / "CURRENT", "w") as f:
+        f.write("v3")
+    stale._load()
+    assert len(stale.ids) == 3
+
+def test_install_exported_version(tmp_path):
+    source = LocalBM25Index(str(tmp_path / "source"))
+    source.index_documents(DOCS)
+    source.export_version(str(tmp_path / "export"))
+
+    target = LocalBM25Index(str(tmp_path / "target"))
+    target.index_documents([{"chunk_id": "x", "source": "s", "content": "unflushed"}])
+    target.install_version(str(tmp_path / "export"))
+    assert target.search("unflushed") == []
+    assert [hit["_id"] for hit in target.search("kafka")] == ["b"]
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from backend import chunk_store
+from backend.chunk_store import ChunkStore
+
+def chunk(chunk_id, content=None):
+    return {"chunk_id": chunk_id, "source": f"{chunk_id}.pdf", "content": content or f"text of {chunk_id}", "context": ""}
+
+def test_put_flush_and_reopen(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.put_many([chunk(f"c{i}") for i in range(20)])
+    assert store.get_many(["c3"])["c3"]["content"] == "text of c3"  # Readable before flush
+    store.flush()
+
+    reopened = ChunkStore(str(tmp_path))
+    found = reopened.get_many(["c0", "c19", "missing"])
+    assert sorted(found) == ["c0", "c19"]
+    assert found["c19"] == chunk("c19")
+    assert sorted(reopened.ids()) == sorted(f"c{i}" for i in range(20))
+
+def test_replace_delete_and_compact(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.put_many([chunk(f"c{i}") for i in range(10)])
+    store.flush()
+    store.put_many([chunk("c1", "new text")])
+    store.delete(["c2", "missing"])
+    store.flush()
+    assert store.get_many(["c1"])["c1"]["content"] == "new text"
+    assert "c2" not in store.get_many(["c2"])
+
+    size = os.path.getsize(store.data_path)
+    store.compact()
+    assert os.path.getsize(store.data_path) < size
+    reopened = ChunkStore(str(tmp_path))
+    assert sorted(reopened.ids()) == sorted(f"c{i}" for i in range(10) if i != 2)
+    assert reopened.get_many(["c1"])["c1"]["content"] == "new text"
+
+def test_ids_sharing_a_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunk_store, "_hash_id", lambda chunk_id: 42 if chunk_id in ("x", "y") else hash(chunk_id) % 1000)
+    store = ChunkStore(str(tmp_path))
+    store.put_many([chunk("x"), chunk("y"), chunk("z")])
+    store.flush()
+    assert sorted(store.get_many(["x", "y"])) == ["x", "y"]
+
+    # Replacing or deleting one id must leave the other entry with its hash alone
+    store.put_many([chunk("x", "new x")])
+    store.flush()
+    found = ChunkStore(str(tmp_path)).get_many(["x", "y"])
+    assert found["x"]["content"] == "new x"
+    assert found["y"]["content"] == "text of y"
+
+    store.delete(["x"])
+    store.flush()
+    store.compact()
+    reopened = ChunkStore(str(tmp_path))
+    assert sorted(reopened.ids()) == ["y", "z"]
+    assert reopened.get_many(["x", "y"]) == {"y": chunk("y")}
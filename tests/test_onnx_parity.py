@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from backend.embeddings import OnnxEmbeddingBackend, SentenceTransformerBackend, check_parity, export_onnx_model
+
+SENTENCES = [
+    "Airflow schedules the DAG once a day and retries failed tasks twice.",
+    "Partition the table by date so queries only scan the files they need.",
+    "What is the difference between a data lake and a data warehouse?",
+    "Kafka consumers in the same group split the partitions of a topic between them.",
+    "dbt models are SELECT statements that build tables and views in the warehouse.",
+]
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("onnx"))
+    export_onnx_model(path, quantize=False)
+    return path
+
+def test_onnx_embeddings_match_sentence_transformers(onnx_dir):
+    report = check_parity(SentenceTransformerBackend(), OnnxEmbeddingBackend(onnx_dir, quantized=False), SENTENCES, k=3)
+    assert report["min_cosine"] > 0.99
+    assert report["top3_overlap"] == 1.0
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from backend.singleflight import SingleFlight, StreamFlight
+
+class Upstream:
+    """A slow call that records how often it started and whether it was cancelled."""
+
+    def __init__(self, delay=0.05, result="answer"):
+        self.delay = delay
+        self.result = result
+        self.started = 0
+        self.cancelled = False
+
+    async def call(self):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.result
+
+    async def stream(self):
+        self.started += 1
+        try:
+            for item in ("a", "b", "c"):
+                await asyncio.sleep(self.delay / 3)
+                yield item
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+def test_identical_calls_share_one_call():
+    async def main():
+        flight, upstream = SingleFlight("test"), Upstream()
+        results = await asyncio.gather(*[flight.do("key", upstream.call) for _ in range(5)])
+        assert results == ["answer"] * 5
+        assert upstream.started == 1
+        assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+    asyncio.run(main())
+
+def test_cancelled_leader_leaves_the_call_to_followers():
+    async def main():
+        flight, upstream = SingleFlight("test"), Upstream()
+        leader = asyncio.create_task(flight.do("key", upstream.call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", upstream.call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "answer"
+        assert leader.cancelled()
+        assert upstream.started == 1 and not upstream.cancelled
+
+    asyncio.run(main())
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def main():
+        flight, upstream = SingleFlight("test"), Upstream()
+        waiters = [asyncio.create_task(flight.do("key", upstream.call)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled
+        # The next caller starts a fresh call instead of joining the cancelled one
+        assert await flight.do("key", upstream.call) == "answer"
+        assert upstream.started == 2
+
+    asyncio.run(main())
+
+def test_errors_reach_every_waiter():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*[flight.do("key", fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
+
+async def consume(stream, into=None):
+    items = [] if into is None else into
+    async for item in stream:
+        items.append(item)
+    return items
+
+def test_streams_share_one_upstream_and_late_joiners_get_every_item():
+    async def main():
+        flight, upstream = StreamFlight("test"), Upstream()
+        first = asyncio.create_task(consume(flight.stream("key", upstream.stream)))
+        await asyncio.sleep(0.03)
+        late = asyncio.create_task(consume(flight.stream("key", upstream.stream)))
+        assert await first == ["a", "b", "c"]
+        assert await late == ["a", "b", "c"]
+        assert upstream.started == 1
+        assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 1}
+
+    asyncio.run(main())
+
+def test_cancelled_stream_leader_leaves_the_stream_to_followers():
+    async def main():
+        flight, upstream = StreamFlight("test"), Upstream()
+        leader_items = []
+        leader = asyncio.create_task(consume(flight.stream("key", upstream.stream), leader_items))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(consume(flight.stream("key", upstream.stream)))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        assert await follower == ["a", "b", "c"]
+        assert leader.cancelled() and len(leader_items) < 3
+        assert not upstream.cancelled
+
+    asyncio.run(main())
+
+def test_last_subscriber_leaving_closes_the_upstream():
+    async def main():
+        flight, upstream = StreamFlight("test"), Upstream(delay=0.3)
+        subscribers = [asyncio.create_task(consume(flight.stream("key", upstream.stream))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for subscriber in subscribers:
+            subscriber.cancel()
+        await asyncio.gather(*subscribers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert upstream.cancelled
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+def test_stream_errors_reach_every_subscriber():
+    async def main():
+        flight = StreamFlight("test")
+
+        async def fail():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        streams = [consume(flight.stream("key", fail)) for _ in range(2)]
+        results = await asyncio.gather(*streams, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend.vector_index import MmapVectorIndex
+
+DIM = 32
+
+def random_embeddings(rng, n):
+    embeddings = rng.standard_normal((n, DIM)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def add(index, ids, embeddings):
+    index.upsert(ids, embeddings.tolist(), [f"doc {i}" for i in ids], [{"source": f"{i}.pdf"} for i in ids])
+
+def brute_force(rows, query, k):
+    """Ids of the k rows of {id: embedding} with the highest dot product with query."""
+    ids = list(rows)
+    scores = np.stack([rows[i] for i in ids]) @ query
+    return [ids[i] for i in np.argsort(-scores, kind="stable")[:k]]
+
+def check_top_k(index, rows, queries, k=5):
+    results = index.query(queries.tolist(), n_results=k)
+    for query, ids, distances in zip(queries, results["ids"], results["distances"]):
+        assert ids == brute_force(rows, query, k)
+        expected = [2 - 2 * float(rows[i] @ query) for i in ids]
+        assert distances == pytest.approx(expected, abs=2e-2)
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_query_matches_brute_force(tmp_path, dtype):
+    rng = np.random.default_rng(0)
+    embeddings = random_embeddings(rng, 300)
+    rows = {f"c{i}": embeddings[i] for i in range(len(embeddings))}
+    index = MmapVectorIndex(str(tmp_path), dtype=dtype, ivf_min_rows=10 ** 6, block_rows=64)
+    add(index, list(rows), embeddings)
+    index.flush()
+    check_top_k(index, rows, random_embeddings(rng, 8))
+
+    reopened = MmapVectorIndex(str(tmp_path), dtype=dtype)
+    assert reopened.count() == 300
+    assert reopened.get(["c7", "missing"])["metadatas"] == [{"source": "c7.pdf"}]
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_query_after_delete_and_merge(tmp_path, dtype):
+    rng = np.random.default_rng(1)
+    queries = random_embeddings(rng, 8)
+    # With nprobe above the number of lists, the merged IVF segment is scanned exhaustively
+    index = MmapVectorIndex(str(tmp_path), dtype=dtype, ivf_min_rows=100, nprobe=1000, max_segments=3)
+    rows = {}
+    for batch in range(4):
+        embeddings = random_embeddings(rng, 60)
+        ids = [f"b{batch}-{i}" for i in range(60)]
+        add(index, ids, embeddings)
+        rows.update(zip(ids, embeddings))
+        index.flush()
+
+    # Delete the current best hits and replace some rows with new embeddings
+    deleted = {chunk_id for query in queries for chunk_id in brute_force(rows, query, 2)}
+    index.delete(sorted(deleted))
+    for chunk_id in deleted:
+        del rows[chunk_id]
+    replaced = ["b0-5", "b2-7"]
+    replacements = random_embeddings(rng, len(replaced))
+    add(index, replaced, replacements)
+    rows.update(zip(replaced, replacements))
+    index.flush()
+    assert index.count() == len(rows)
+    check_top_k(index, rows, queries)
+
+    reopened = MmapVectorIndex(str(tmp_path), dtype=dtype, nprobe=1000)
+    assert len(reopened._segments) <= 3
+    check_top_k(reopened, rows, queries)
+    assert reopened.get(sorted(deleted))["ids"] == []
+
+def test_writes_are_invisible_until_flush(tmp_path):
+    rng = np.random.default_rng(2)
+    embeddings = random_embeddings(rng, 3)
+    index = MmapVectorIndex(str(tmp_path))
+    add(index, ["a", "b", "c"], embeddings)
+    assert index.query(embeddings[:1].tolist(), n_results=3)["ids"] == [[]]
+    index.flush()
+    assert index.query(embeddings[:1].tolist(), n_results=1)["ids"] == [["a"]]